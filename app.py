@@ -1,24 +1,62 @@
 import os
+import re
 import json
 import uuid
 import base64
+import threading
 import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 
-from flask import Flask, request, jsonify, render_template, send_from_directory, session, redirect, url_for
-from anthropic import Anthropic
+from anthropic import APIError
+from flask import (
+    Flask, Response, request, jsonify, render_template, send_from_directory, session, redirect, url_for, g,
+    stream_with_context,
+)
 from dotenv import load_dotenv
 
 load_dotenv()
 
+from logging_config import (
+    configure_logging, get_logger, enable_request_debug, reset_request_debug, DEBUG_HEADER,
+)
+
+configure_logging()
+log = get_logger("APP")
+scout_log = get_logger("SCOUT")
+alt_log = get_logger("SCOUT-ALT")
+discover_log = get_logger("DISCOVER")
+spots_log = get_logger("MY-SAFE-SPOTS")
+
+import metrics
+from metrics import span
+from llm import create_message
+from background import submit_refresh
+from claude_json import parse_claude_json
+from models import ScoutResult
+import responses
+import static_assets
+import profiling
+import uploads
+import barcodes
+import ingredients
+from responses import json_body_response, splice_json
+
 app = Flask(__name__)
-app.config["UPLOAD_FOLDER"] = os.path.join(
+metrics.init_app(app)
+responses.init_app(app)
+static_assets.init_app(app)
+profiling.init_app(app)
+# UPLOAD_FOLDER / SCAN_HISTORY_FILE move runtime files out of the checkout
+# (the load test points them at a temp dir).
+app.config["UPLOAD_FOLDER"] = os.environ.get("UPLOAD_FOLDER") or os.path.join(
     os.path.dirname(os.path.abspath(__file__)), "static", "uploads"
 )
 app.config["MAX_CONTENT_LENGTH"] = 10 * 1024 * 1024  # 10MB max
 app.config["SECRET_KEY"] = os.environ.get("SECRET_KEY", "dev-secret-key-change-in-production")
+uploads.init_app(app)
 
-HISTORY_FILE = os.path.join(
+HISTORY_FILE = os.environ.get("SCAN_HISTORY_FILE") or os.path.join(
     os.path.dirname(os.path.abspath(__file__)), "scan_history.json"
 )
 RESTAURANT_HISTORY_FILE = os.path.join(
@@ -26,7 +64,21 @@ RESTAURANT_HISTORY_FILE = os.path.join(
 )
 ALLOWED_EXTENSIONS = {"png", "jpg", "jpeg", "webp", "gif"}
 
-client = Anthropic()
+
+# ---------------------------------------------------------------------------
+# Per-request debug logging (X-Celia-Debug header)
+# ---------------------------------------------------------------------------
+
+@app.before_request
+def request_debug_logging():
+    """Allow admins (or the local debug server) to get DEBUG logs for one request."""
+    if request.headers.get(DEBUG_HEADER) and (app.debug or session.get("admin_authenticated")):
+        g.log_debug_token = enable_request_debug()
+
+
+@app.teardown_request
+def reset_debug_logging(exc):
+    reset_request_debug(g.pop("log_debug_token", None))
 
 
 # ---------------------------------------------------------------------------
@@ -106,23 +158,7 @@ Restaurant name: {restaurant_name}
 {url_context}
 {location_context}
 
-## MANDATORY RESEARCH PHASE
-
-You MUST use web_search to perform ALL of the following searches before writing your analysis. Do not skip any search.
-
-1. Search: "{restaurant_name} official website menu"
-   → Find the restaurant's actual menu items
-
-2. Search: "{restaurant_name} gluten free reviews"
-   → Find real reviews from celiac/GF diners
-
-3. Search: "site:findmeglutenfree.com {restaurant_name}"
-   → Check Find Me Gluten Free for celiac-specific reviews and ratings
-
-4. Search: "{restaurant_name} celiac safe"
-   → Find any celiac-specific discussions, blog posts, or community advice
-
-{url_search_instruction}
+{research_phase}
 
 ## ANALYSIS RULES
 
@@ -237,6 +273,42 @@ OTHER RULES:
 
 Return ONLY valid JSON, no other text."""
 
+# Research instructions per scout tier (see SCOUT_TIERS), inserted as
+# {research_phase} above.
+SCOUT_FULL_RESEARCH = """## MANDATORY RESEARCH PHASE
+
+You MUST use web_search to perform ALL of the following searches before writing your analysis. Do not skip any search.
+
+1. Search: "{restaurant_name} official website menu"
+   → Find the restaurant's actual menu items
+
+2. Search: "{restaurant_name} gluten free reviews"
+   → Find real reviews from celiac/GF diners
+
+3. Search: "site:findmeglutenfree.com {restaurant_name}"
+   → Check Find Me Gluten Free for celiac-specific reviews and ratings
+
+4. Search: "{restaurant_name} celiac safe"
+   → Find any celiac-specific discussions, blog posts, or community advice
+
+{url_search_instruction}"""
+
+SCOUT_TRIAGE_RESEARCH = """## QUICK RESEARCH PHASE
+
+This is a quick first pass. Use web_search for at most these 2 searches:
+
+1. Search: "{restaurant_name} gluten free celiac"
+   → Find the restaurant's gluten-free practices and celiac reviews
+
+2. Search: "site:findmeglutenfree.com {restaurant_name}"
+   → Check Find Me Gluten Free for celiac-specific reviews and ratings
+
+## TRIAGE CONFIDENCE
+
+In addition to the fields in the response format below, include a top-level field "triage_confidence":
+- "HIGH" only if these searches clearly settle the score: e.g. the restaurant is a dedicated 100% gluten-free kitchen or certified GF, or it explicitly cannot accommodate celiac / has no GF options.
+- "LOW" otherwise: mixed or thin evidence, a shared kitchen whose practices need the menu and more reviews to judge, or you are unsure which restaurant this is. A fuller analysis will follow."""
+
 # ---------------------------------------------------------------------------
 # Alternatives Prompt
 # ---------------------------------------------------------------------------
@@ -289,8 +361,8 @@ HOURLY_RATE_WINDOW = 3600  # seconds
 _hourly_rate_log = {}
 
 
-def check_hourly_rate_limit(ip):
-    """Return True if the IP is within the hourly rate limit, False if exceeded."""
+def hourly_rate_remaining(ip):
+    """Return how many uncached searches the IP has left this hour."""
     now = datetime.now().timestamp()
     cutoff = now - HOURLY_RATE_WINDOW
 
@@ -298,7 +370,12 @@ def check_hourly_rate_limit(ip):
     timestamps = [t for t in timestamps if t > cutoff]
     _hourly_rate_log[ip] = timestamps
 
-    return len(timestamps) < HOURLY_RATE_LIMIT
+    return max(0, HOURLY_RATE_LIMIT - len(timestamps))
+
+
+def check_hourly_rate_limit(ip):
+    """Return True if the IP is within the hourly rate limit, False if exceeded."""
+    return hourly_rate_remaining(ip) > 0
 
 
 def record_hourly_rate_use(ip):
@@ -327,6 +404,17 @@ def get_searches_remaining():
     return max(0, FREE_SEARCH_LIMIT - count)
 
 
+def charge_search(ip):
+    """Count one uncached analysis against the free search and hourly limits."""
+    if "user_id" in session:
+        user = get_user_by_id(session["user_id"])
+        if user:
+            increment_search_count(user["email"])
+    else:
+        increment_anonymous_search_count(ip)
+    record_hourly_rate_use(ip)
+
+
 def allowed_file(filename):
     return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
 
@@ -338,9 +426,16 @@ def load_history():
     return []
 
 
+def write_json_file(path, data):
+    """Replace a JSON file atomically, so concurrent readers never see it half-written."""
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+
 def save_history(history):
-    with open(HISTORY_FILE, "w") as f:
-        json.dump(history, f, indent=2)
+    write_json_file(HISTORY_FILE, history)
 
 
 def load_restaurant_history():
@@ -351,8 +446,7 @@ def load_restaurant_history():
 
 
 def save_restaurant_history(history):
-    with open(RESTAURANT_HISTORY_FILE, "w") as f:
-        json.dump(history, f, indent=2)
+    write_json_file(RESTAURANT_HISTORY_FILE, history)
 
 
 def get_media_type(filename):
@@ -367,31 +461,6 @@ def get_media_type(filename):
     return types.get(ext, "image/jpeg")
 
 
-def parse_claude_json(response_text):
-    text = response_text.strip()
-    # Remove markdown code fences if present
-    if "```" in text:
-        # Find content between code fences
-        parts = text.split("```")
-        for part in parts:
-            # Skip the language identifier line (e.g., "json\n")
-            if part.strip().startswith("json"):
-                part = part.strip()[4:].strip()
-            elif part.strip().startswith("{"):
-                pass
-            else:
-                continue
-            if "{" in part:
-                text = part
-                break
-    # Extract just the JSON object: from first { to last }
-    start = text.find("{")
-    end = text.rfind("}")
-    if start != -1 and end != -1 and end > start:
-        text = text[start:end + 1]
-    return json.loads(text)
-
-
 # ---------------------------------------------------------------------------
 # Page Routes
 # ---------------------------------------------------------------------------
@@ -447,19 +516,13 @@ def signout():
 @app.route("/my-safe-spots")
 def my_safe_spots():
     if "user_id" not in session:
-        print("[MY-SAFE-SPOTS] No user_id in session, redirecting to signin")
+        spots_log.debug("No user_id in session, redirecting to signin")
         return redirect(url_for("signin"))
 
     user_id = session["user_id"]
-    print(f"[MY-SAFE-SPOTS] Loading saved restaurants for user_id={user_id}")
-
     user = get_user_by_id(user_id)
-    print(f"[MY-SAFE-SPOTS] User from DB: {user}")
-
     saved = get_user_saved_restaurants(user_id)
-    print(f"[MY-SAFE-SPOTS] Got {len(saved)} saved restaurants")
-    for i, r in enumerate(saved):
-        print(f"[MY-SAFE-SPOTS]   [{i}] id={r.get('id')}, name={r.get('name')}, location={r.get('location')}, score={r.get('safety_score')}")
+    spots_log.debug("Got %d saved restaurants for user_id=%s", len(saved), user_id)
 
     return render_template("my_safe_spots.html", user=user, saved_restaurants=saved)
 
@@ -531,8 +594,7 @@ def debug_saved_restaurants():
                 }
             })
     except Exception as e:
-        print(f"[DEBUG] Error: {e}")
-        traceback.print_exc()
+        log.exception("Debug route error: %s", e)
         return jsonify({"error": str(e)}), 500
     finally:
         conn.close()
@@ -542,6 +604,116 @@ def debug_saved_restaurants():
 # Label Scanner API
 # ---------------------------------------------------------------------------
 
+def analyze_label(images, user_id=None, ip_address=None, endpoint="scan"):
+    """Claude's label analysis of one product from one or more photos of it
+    (e.g. front, ingredient panel, allergen statement), in one vision call.
+    `images` is a list of (bytes, media type). Raises json.JSONDecodeError
+    when the response can't be parsed."""
+    content = [
+        {
+            "type": "image",
+            "source": {
+                "type": "base64",
+                "media_type": media_type,
+                "data": base64.standard_b64encode(image_bytes).decode("utf-8"),
+            },
+        }
+        for image_bytes, media_type in images
+    ]
+    prompt = ANALYSIS_PROMPT
+    if len(images) > 1:
+        prompt = MULTI_IMAGE_PROMPT.format(count=len(images)) + ANALYSIS_PROMPT
+    content.append({"type": "text", "text": prompt})
+
+    message = create_message(
+        endpoint,
+        user_id=user_id,
+        ip_address=ip_address,
+        model="claude-sonnet-4-20250514",
+        max_tokens=1500,
+        messages=[{"role": "user", "content": content}],
+    )
+
+    with span("json_parse"):
+        return parse_claude_json(message.content[0].text, schema="label")
+
+
+def indexable_analysis(analysis):
+    """Whether an analysis is good enough to answer later scans of the same
+    barcode: a low-confidence read (blurry or partial photo) is not."""
+    return (analysis.get("confidence") != "LOW"
+            and analysis.get("product_name") != "Not a food label"
+            and analysis.get("verdict") in ("SAFE", "UNSAFE", "INVESTIGATE"))
+
+
+def photo_barcode(images):
+    """The first barcode detected in the photos, or None."""
+    return next(filter(None, (barcodes.detect_barcode(data) for data, _ in images)), None)
+
+
+def product_verdict(images, barcode=None, user_id=None, ip_address=None, endpoint="scan"):
+    """The label analysis for one product: from the barcode index when the
+    product is known, from the local ingredient pre-screen when OCR finds an
+    obvious gluten source, otherwise from Claude (and then indexed).
+
+    `barcode` is one the client read; without it the photos are searched for
+    one. A client barcode is only used to look the product up: the analysis
+    is indexed only under a barcode detected in the photos here, so a wrong
+    or forged code can't file it under another product. Returns (analysis,
+    barcode or None, True if it came from the index)."""
+    client_barcode = barcode
+    barcode = barcode or photo_barcode(images)
+    if barcode:
+        known = get_product_verdict(barcode)
+        if known:
+            return known["analysis"], barcode, True
+
+    # Label text read locally: an obvious gluten source needs no vision call
+    if ingredients.ocr_available():
+        text = "\n".join(filter(None, (ingredients.ocr_text(data) for data, _ in images)))
+        local = ingredients.prescreen(text, source="ocr") if text else None
+        if local:
+            return local, barcode, False
+
+    analysis = analyze_label(images, user_id=user_id, ip_address=ip_address, endpoint=endpoint)
+    if barcode and indexable_analysis(analysis):
+        detected = photo_barcode(images) if client_barcode else barcode
+        if detected == barcode:
+            # One upsert after a vision call that took seconds: done inline, so
+            # the next scan of this product finds it
+            save_product_verdict(barcode, analysis)
+        else:
+            metrics.inc("celia_product_index_skipped_total", reason="unverified_barcode")
+    return analysis, barcode, False
+
+
+def build_scan_record(image_keys, analysis, barcode=None, from_index=False):
+    """A history entry. The first image is the one shown in the history list."""
+    record = {
+        "id": str(uuid.uuid4())[:8],
+        "image_key": image_keys[0],
+        **uploads.upload_urls(image_keys[0]),
+    }
+    if len(image_keys) > 1:
+        record["image_keys"] = image_keys
+    if barcode:
+        record["barcode"] = barcode
+        record["from_product_index"] = from_index
+    record.update({
+        "product_name": analysis.get("product_name", "Unknown Product"),
+        "verdict": analysis["verdict"],
+        "confidence": analysis.get("confidence", "MEDIUM"),
+        "summary": analysis["summary"],
+        "timestamp": datetime.now().isoformat(),
+        "analysis": analysis,
+    })
+    return record
+
+
+def scan_image_keys(scan):
+    return scan.get("image_keys") or ([scan["image_key"]] if scan.get("image_key") else [])
+
+
 @app.route("/api/scan", methods=["POST"])
 def scan_label():
     if "image" not in request.files:
@@ -554,63 +726,24 @@ def scan_label():
     if not allowed_file(file.filename):
         return jsonify({"error": "File type not allowed. Use PNG, JPG, WEBP, or GIF."}), 400
 
-    # Save file
-    scan_id = str(uuid.uuid4())[:8]
+    # Save file (content-addressed; the thumbnail is made in the background)
     ext = file.filename.rsplit(".", 1)[1].lower()
-    filename = f"{scan_id}.{ext}"
-    filepath = os.path.join(app.config["UPLOAD_FOLDER"], filename)
-    file.save(filepath)
-
-    # Read and encode image
-    with open(filepath, "rb") as f:
-        image_data = base64.standard_b64encode(f.read()).decode("utf-8")
+    image_bytes = file.read()
+    image_key = uploads.save_upload(image_bytes, ext)
 
-    media_type = get_media_type(filename)
-
-    # Call Claude Vision API
+    # Known barcode: the indexed verdict; otherwise call Claude Vision API
     try:
-        message = client.messages.create(
-            model="claude-sonnet-4-20250514",
-            max_tokens=1500,
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "image",
-                            "source": {
-                                "type": "base64",
-                                "media_type": media_type,
-                                "data": image_data,
-                            },
-                        },
-                        {
-                            "type": "text",
-                            "text": ANALYSIS_PROMPT,
-                        },
-                    ],
-                }
-            ],
-        )
-
-        analysis = parse_claude_json(message.content[0].text)
-
+        analysis, barcode, from_index = product_verdict(
+            [(image_bytes, get_media_type(file.filename))],
+            barcode=barcodes.normalize_barcode(request.form.get("barcode")),
+            user_id=session.get("user_id"), ip_address=get_client_ip())
     except json.JSONDecodeError:
         return jsonify({"error": "Failed to parse analysis. Please try again."}), 500
     except Exception as e:
         return jsonify({"error": f"Analysis failed: {str(e)}"}), 500
 
     # Save to history
-    scan_record = {
-        "id": scan_id,
-        "filename": filename,
-        "product_name": analysis.get("product_name", "Unknown Product"),
-        "verdict": analysis["verdict"],
-        "confidence": analysis.get("confidence", "MEDIUM"),
-        "summary": analysis["summary"],
-        "timestamp": datetime.now().isoformat(),
-        "analysis": analysis,
-    }
+    scan_record = build_scan_record([image_key], analysis, barcode, from_index)
 
     history = load_history()
     history.insert(0, scan_record)
@@ -619,9 +752,165 @@ def scan_label():
     return jsonify(scan_record)
 
 
+# Batch scans: several photos per product, several products per request
+SCAN_BATCH_MAX_IMAGES = int(os.environ.get("SCAN_BATCH_MAX_IMAGES", "20"))
+SCAN_BATCH_MAX_IMAGES_PER_PRODUCT = 4
+SCAN_BATCH_MAX_MB = int(os.environ.get("SCAN_BATCH_MAX_MB", "50"))
+# Vision calls run at once for batch scans, across all requests in this worker
+SCAN_BATCH_CONCURRENCY = int(os.environ.get("SCAN_BATCH_CONCURRENCY", "4"))
+_scan_batch_slots = threading.BoundedSemaphore(SCAN_BATCH_CONCURRENCY)
+
+MULTI_IMAGE_PROMPT = """The {count} images are photos of the SAME product (for example the front, the ingredient panel and the allergen statement). Combine what they show into ONE analysis of that product: take the product name from whichever image shows it, and treat a warning or certification on any image as applying to the product.
+
+"""
+
+
+def _batch_product_verdict(images, user_id, ip):
+    """product_verdict for one product of a batch, waiting for a global slot."""
+    with _scan_batch_slots:
+        return product_verdict(images, user_id=user_id, ip_address=ip, endpoint="scan_batch")
+
+
+@app.route("/api/scan/batch", methods=["POST"])
+def scan_label_batch():
+    """Scan several products at once, each from one or more photos.
+
+    Multipart form: one or more "image" files, and optionally one "product"
+    field per image (in the same order) naming the product it shows. Images
+    with the same product name are analyzed together in one vision call;
+    without "product" fields all images are one product. A product whose
+    barcode (found on any of its images) is in the product index is answered
+    from it; the others are analyzed concurrently. The response lists one
+    result per product, in the order the products first appear:
+        {"products": [{"product": name, "scan": {...history entry}}
+                      or {"product": name, "error": "..."}, ...]}
+    Each analyzed product is one history entry."""
+    request.max_content_length = SCAN_BATCH_MAX_MB * 1024 * 1024
+    files = [f for f in request.files.getlist("image") if f.filename]
+    if not files:
+        return jsonify({"error": "No image uploaded"}), 400
+    if len(files) > SCAN_BATCH_MAX_IMAGES:
+        return jsonify({"error": f"Too many images (at most {SCAN_BATCH_MAX_IMAGES} per batch)."}), 400
+    if not all(allowed_file(f.filename) for f in files):
+        return jsonify({"error": "File type not allowed. Use PNG, JPG, WEBP, or GIF."}), 400
+
+    names = request.form.getlist("product")
+    if names and len(names) != len(files):
+        return jsonify({"error": "Send one product field per image, or none."}), 400
+
+    products = {}  # product name -> its files, in first-seen order
+    for index, file in enumerate(files):
+        products.setdefault((names[index].strip() if names else "") or "1", []).append(file)
+    too_many = [name for name, group in products.items() if len(group) > SCAN_BATCH_MAX_IMAGES_PER_PRODUCT]
+    if too_many:
+        which = f" ({', '.join(too_many)})" if names else ""
+        return jsonify({"error": f"At most {SCAN_BATCH_MAX_IMAGES_PER_PRODUCT} images per product{which}."}), 400
+
+    for name, group in products.items():
+        images = []  # (bytes, media type, key)
+        for file in group:
+            image_bytes = file.read()
+            key = uploads.save_upload(image_bytes, file.filename.rsplit(".", 1)[1].lower())
+            images.append((image_bytes, get_media_type(file.filename), key))
+        products[name] = images
+
+    log.info("Batch scan: %d images, %d products", len(files), len(products))
+    user_id = session.get("user_id")
+    ip = get_client_ip()
+    results = {}
+    with ThreadPoolExecutor(max_workers=min(len(products), SCAN_BATCH_CONCURRENCY),
+                            thread_name_prefix="celia-scan") as pool:
+        futures = {
+            pool.submit(_batch_product_verdict, [(data, media_type) for data, media_type, _ in images],
+                        user_id, ip): name
+            for name, images in products.items()
+        }
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                analysis, barcode, from_index = future.result()
+            except json.JSONDecodeError:
+                results[name] = {"product": name, "error": "Failed to parse analysis. Please try again."}
+                continue
+            except Exception as e:
+                log.error("Batch scan of product %r failed: %s", name, e)
+                results[name] = {"product": name, "error": f"Analysis failed: {str(e)}"}
+                continue
+            keys = [key for _, _, key in products[name]]
+            results[name] = {"product": name, "scan": build_scan_record(keys, analysis, barcode, from_index)}
+
+    # One history write for the whole batch
+    scans = [results[name]["scan"] for name in products if "scan" in results[name]]
+    if scans:
+        history = load_history()
+        history[:0] = scans
+        save_history(history)
+
+    return jsonify({"products": [results[name] for name in products]})
+
+
+INGREDIENTS_PROMPT = """The ingredient list below was typed in by the user (not photographed). Analyze it as if it were the text of the product's label; if it doesn't look like an ingredient list, treat it as "Not a food label".
+
+<ingredients>
+{ingredients}
+</ingredients>
+
+"""
+
+
+def analyze_ingredient_text(text, product_name="", user_id=None, ip_address=None):
+    """Claude's label analysis of typed ingredient text (the pre-screen
+    couldn't decide it). A text-only check, so the smaller model does."""
+    prompt = INGREDIENTS_PROMPT.format(ingredients=text) + ANALYSIS_PROMPT
+    if product_name:
+        prompt += f"\n\nThe product is: {product_name}"
+    message = create_message(
+        "check_ingredients",
+        user_id=user_id,
+        ip_address=ip_address,
+        model="claude-haiku-4-5-20250929",
+        max_tokens=1500,
+        messages=[{"role": "user", "content": prompt}],
+    )
+    with span("json_parse"):
+        return parse_claude_json(message.content[0].text, schema="label")
+
+
+@app.route("/api/check-ingredients", methods=["POST"])
+def check_ingredients():
+    """Verdict for typed ingredient text: {"ingredients": "...", "product_name": "..."}.
+    Clear cases are decided locally in milliseconds (see ingredients.py); the
+    rest go to Claude. Returns {"analysis": {...}, "decided_by": "rules" or "claude"}.
+    Checks are not saved to the scan history."""
+    data = request.get_json(silent=True) or {}
+    text = str(data.get("ingredients") or "").strip()
+    product_name = str(data.get("product_name") or "").strip()[:200]
+    if not text:
+        return jsonify({"error": "Ingredients required"}), 400
+    if len(text) > ingredients.MAX_INGREDIENT_TEXT:
+        return jsonify({"error": f"Ingredient list too long (at most {ingredients.MAX_INGREDIENT_TEXT} characters)."}), 400
+
+    analysis = ingredients.prescreen(text, source="typed", product_name=product_name)
+    if analysis:
+        return jsonify({"analysis": analysis, "decided_by": analysis["decided_by"]})
+
+    try:
+        analysis = analyze_ingredient_text(text, product_name, user_id=session.get("user_id"),
+                                           ip_address=get_client_ip())
+    except json.JSONDecodeError:
+        return jsonify({"error": "Failed to parse analysis. Please try again."}), 500
+    except Exception as e:
+        return jsonify({"error": f"Analysis failed: {str(e)}"}), 500
+    return jsonify({"analysis": analysis, "decided_by": "claude"})
+
+
 @app.route("/api/history", methods=["GET"])
 def get_history():
     history = load_history()
+    for scan in history:
+        # Recorded before its thumbnail was ready: pick it up if it is now
+        if scan.get("image_key") and scan.get("thumbnail_url") == scan.get("image_url"):
+            scan.update(uploads.upload_urls(scan["image_key"]))
     return jsonify(history)
 
 
@@ -633,11 +922,17 @@ def delete_scan(scan_id):
     if len(updated) == len(history):
         return jsonify({"error": "Scan not found"}), 404
 
-    # Delete image file
+    # Delete the images unless another scan is of the same photo
     removed = next(s for s in history if s["id"] == scan_id)
-    filepath = os.path.join(app.config["UPLOAD_FOLDER"], removed["filename"])
-    if os.path.exists(filepath):
-        os.remove(filepath)
+    if scan_image_keys(removed):
+        referenced = {key for s in updated for key in scan_image_keys(s)}
+        for key in scan_image_keys(removed):
+            uploads.release_upload(key, still_referenced=key in referenced)
+    elif removed.get("filename"):
+        # Scans from before content-addressed uploads
+        filepath = os.path.join(app.config["UPLOAD_FOLDER"], removed["filename"])
+        if os.path.exists(filepath):
+            os.remove(filepath)
 
     save_history(updated)
     return jsonify({"success": True})
@@ -647,6 +942,266 @@ def delete_scan(scan_id):
 # Restaurant Scout API
 # ---------------------------------------------------------------------------
 
+class NoAnalysisText(Exception):
+    """Claude's response had no text block (e.g. it ran out of tokens mid-research)."""
+
+    def __init__(self, block_types, stop_reason):
+        super().__init__(f"No text block in Claude response (stop reason: {stop_reason})")
+        self.block_types = block_types
+        self.stop_reason = stop_reason
+
+
+class RestaurantNotFound(Exception):
+    """Claude's research turned up nothing about the restaurant."""
+
+    def __init__(self, analysis):
+        super().__init__(analysis.get("research_summary") or "Restaurant not found")
+        self.analysis = analysis
+
+
+NOT_FOUND_MESSAGE = "Celia couldn't find this restaurant online. Check the spelling or add a city and try again."
+
+# Research summaries that mean Claude couldn't identify the restaurant at all
+NOT_FOUND_PATTERN = re.compile(
+    r"(could not|couldn't|unable to|did not|didn't) (find|locate|verify|identify) "
+    r"(any |the )?(information|restaurant|evidence|record|listing|results)"
+    r"|(does not|doesn't) (appear|seem) to exist"
+    r"|no (information|results|listings?) (was |were )?found (for|about)"
+)
+
+
+def looks_not_found(analysis):
+    """Heuristic for a query Claude couldn't match to a real restaurant: no
+    usable safety score, or a research summary saying nothing was found with no
+    menu or restaurant-specific findings behind it."""
+    if not isinstance(analysis.get("safety_score"), (int, float)):
+        return True
+    if not NOT_FOUND_PATTERN.search((analysis.get("research_summary") or "").lower()):
+        return False
+    menu = analysis.get("menu_analysis") or {}
+    specifics = analysis.get("this_restaurant") or {}
+    found_anything = (
+        any(menu.get(key) for key in ("likely_safe", "ask_first", "red_flags"))
+        or specifics.get("specific_risks")
+        or specifics.get("specific_positives")
+    )
+    return not found_anything
+
+
+def scout_failure_kind(error):
+    """Negative cache bucket for an analysis failure (see SCOUT_FAILURE_BACKOFF)."""
+    if isinstance(error, RestaurantNotFound):
+        return "not_found"
+    if isinstance(error, NoAnalysisText):
+        return "no_text"
+    if isinstance(error, json.JSONDecodeError):
+        return "parse_error"
+    return "api_error"
+
+
+# Scout analyses go through a cheap triage pass first; only results it can't
+# settle are escalated to the full research.
+SCOUT_TIERS = {
+    "triage": {"model": "claude-haiku-4-5-20250929", "max_tokens": 6000, "max_searches": 2,
+               "research": SCOUT_TRIAGE_RESEARCH},
+    "full": {"model": "claude-sonnet-4-20250514", "max_tokens": 10000, "max_searches": 5,
+             "research": SCOUT_FULL_RESEARCH},
+}
+SCOUT_TRIAGE_ENABLED = os.environ.get("SCOUT_TRIAGE", "on").lower() not in ("0", "off", "false")
+
+# Triage results are kept only at the ends of the rubric, where a couple of
+# searches are enough (dedicated GF / certified kitchens, or no accommodation).
+# Everything in between needs the menu analysis and reviews of the full tier.
+TRIAGE_MIN_CONFIDENT_SCORE = 9
+TRIAGE_MAX_CONFIDENT_SCORE = 2
+
+
+def triage_escalation_reason(analysis):
+    """Why a triage analysis can't be served as-is, or None if it can."""
+    if analysis.get("triage_confidence") != "HIGH":
+        return "low confidence"
+    score = analysis.get("safety_score")
+    if TRIAGE_MAX_CONFIDENT_SCORE < score < TRIAGE_MIN_CONFIDENT_SCORE:
+        return f"mid-range score {score}"
+    return None
+
+
+def run_scout_analysis(restaurant_name, location="", menu_url="", endpoint="scout",
+                       user_id=None, ip_address=None):
+    """Run the web-research analysis for one restaurant and return the parsed
+    analysis dict, with analysis["analysis_tier"] set to the tier that
+    produced it. Plain name + location lookups try the triage tier first and
+    escalate to the full tier when triage is inconclusive.
+
+    Raises NoAnalysisText, json.JSONDecodeError or RestaurantNotFound on
+    unusable full-tier responses, and lets API errors propagate. Failures of
+    plain lookups are recorded in the negative cache so repeats back off
+    instead of paying for the same research."""
+    try:
+        if not menu_url and SCOUT_TRIAGE_ENABLED:
+            analysis = triage_restaurant(restaurant_name, location, endpoint, user_id, ip_address)
+            if analysis is not None:
+                return analysis
+        return _research_restaurant(restaurant_name, location, menu_url, endpoint, user_id, ip_address)
+    except (NoAnalysisText, json.JSONDecodeError, RestaurantNotFound, APIError) as e:
+        if not menu_url:
+            record_scout_failure(restaurant_name, location, scout_failure_kind(e), str(e))
+        raise
+
+
+def triage_restaurant(restaurant_name, location, endpoint, user_id, ip_address):
+    """Quick Haiku pass. Returns the analysis if it is conclusive, otherwise
+    None (including on any failure) so the caller escalates."""
+    try:
+        analysis = _research_restaurant(restaurant_name, location, "", f"{endpoint}_triage",
+                                        user_id, ip_address, tier="triage")
+    except (NoAnalysisText, json.JSONDecodeError, RestaurantNotFound, APIError) as e:
+        scout_log.info("Triage failed for %r (%s), escalating", restaurant_name, type(e).__name__)
+        metrics.inc("celia_scout_triage_total", result="failed")
+        return None
+
+    reason = triage_escalation_reason(analysis)
+    analysis.pop("triage_confidence", None)
+    if reason:
+        scout_log.info("Triage inconclusive for %r (%s), escalating", restaurant_name, reason)
+        metrics.inc("celia_scout_triage_total", result="escalated")
+        return None
+    metrics.inc("celia_scout_triage_total", result="accepted")
+    return analysis
+
+
+def _research_restaurant(restaurant_name, location, menu_url, endpoint, user_id, ip_address, tier="full"):
+    config = SCOUT_TIERS[tier]
+    url_context = ""
+    url_search_instruction = ""
+    if menu_url:
+        url_context = f"Menu or website URL provided by user: {menu_url}"
+        url_search_instruction = (
+            f'5. Search: "{menu_url}"\n'
+            f"   → Fetch the user-provided URL for menu or restaurant details"
+        )
+
+    location_context = f"Location: {location}" if location else ""
+
+    prompt = RESTAURANT_SCOUT_PROMPT.format(
+        restaurant_name=restaurant_name,
+        url_context=url_context,
+        location_context=location_context,
+        research_phase=config["research"].format(
+            restaurant_name=restaurant_name,
+            url_search_instruction=url_search_instruction,
+        ),
+    )
+
+    scout_log.info("Starting %s analysis for %r (%s)", tier, restaurant_name, endpoint)
+    message = create_message(
+        endpoint,
+        user_id=user_id,
+        ip_address=ip_address,
+        model=config["model"],
+        max_tokens=config["max_tokens"],
+        tools=[{"type": "web_search_20250305", "name": "web_search", "max_uses": config["max_searches"]}],
+        messages=[{"role": "user", "content": prompt}],
+    )
+
+    # Log response structure for debugging
+    block_types = [block.type for block in message.content]
+    scout_log.debug("Response blocks: %s, stop reason: %s", block_types, message.stop_reason)
+
+    # With web_search, response has multiple content blocks.
+    # Find the last text block which contains the JSON analysis.
+    response_text = None
+    for block in reversed(message.content):
+        if block.type == "text":
+            response_text = block.text
+            break
+
+    if not response_text:
+        scout_log.error("No text block found in response (stop reason: %s)", message.stop_reason)
+        raise NoAnalysisText(block_types, message.stop_reason)
+
+    scout_log.verbose("Raw response (first 500 chars): %s", response_text[:500])
+    try:
+        with span("json_parse"):
+            analysis = parse_claude_json(response_text, schema="scout")
+    except json.JSONDecodeError as e:
+        e.raw_response = response_text  # full text for the caller's debug output
+        raise
+    scout_log.debug("Parsed analysis for %r", analysis.get("restaurant_name", "unknown"))
+    if looks_not_found(analysis):
+        scout_log.info("No research found for %r (%r)", restaurant_name, location)
+        raise RestaurantNotFound(analysis)
+    analysis["analysis_tier"] = tier
+    return analysis
+
+
+def build_scout_result(restaurant_name, menu_url, analysis):
+    """Wrap an analysis in the result shape the frontend and cache expect."""
+    return ScoutResult(restaurant_name, analysis, menu_url).to_dict()
+
+
+def cache_scout_result(restaurant_name, location, result):
+    """Cache a plain name + location result and add it to the match index.
+    Sets result["restaurant_id"] when the row could be read back."""
+    cache_restaurant_result(restaurant_name, location, result)
+    restaurant_id = get_restaurant_id(restaurant_name, location)
+    if restaurant_id:
+        result["restaurant_id"] = restaurant_id
+        analysis = result["analysis"]
+        index_restaurant(restaurant_id, restaurant_name, location,
+                         analysis.get("safety_score"), analysis.get("restaurant_name"))
+    return result
+
+
+def refresh_restaurant(restaurant_name, location, endpoint="refresh"):
+    """Re-research a cached restaurant and overwrite its cache entry.
+    Used for stale-while-revalidate and by refresh_cache.py."""
+    analysis = run_scout_analysis(restaurant_name, location, endpoint=endpoint)
+    result = build_scout_result(restaurant_name, "", analysis)
+    cache_restaurant_result(restaurant_name, location, result)
+    return result
+
+
+def queue_restaurant_refresh(cached):
+    """Queue a background refresh for a stale cache entry (once per entry).
+    Returns False if recent refreshes of the entry failed and are backing off,
+    or the refresh pool is full."""
+    if get_scout_failure(cached["name"], cached["location"]):
+        return False
+    name = display_name_from_search_query(cached["search_query"], cached["location"], cached["name"])
+    return submit_refresh(("refresh", cached["restaurant_id"]), refresh_restaurant, name, cached["location"])
+
+
+def cached_restaurant_response(cached, cache_control=None):
+    """Serve a cache entry's pre-serialized body (restaurant_id already in it).
+    Past expires_at: serve the stale report now, re-research in the background."""
+    body = cached["body"]
+    if cached["stale"]:
+        body = splice_json(body, refreshing=queue_restaurant_refresh(cached))
+    return json_body_response(body, cache_control=cache_control)
+
+
+def scout_failure_response(failure):
+    """Quick answer for a negative cache hit: no research, no quota charge."""
+    retry_in = max(1, failure["retry_in"])
+    if failure["failure_kind"] == "not_found":
+        body = {
+            "error": NOT_FOUND_MESSAGE,
+            "not_found": True,
+        }
+        status = 404
+    else:
+        minutes = max(1, round(retry_in / 60))
+        body = {
+            "error": f"Celia had trouble researching this restaurant just now. Please try again in {minutes} minute{'s' if minutes != 1 else ''}.",
+        }
+        status = 503
+    body["retry_after"] = retry_in
+    response = jsonify(body)
+    response.headers["Retry-After"] = str(retry_in)
+    return response, status
+
+
 @app.route("/api/restaurant-scout", methods=["POST"])
 def restaurant_scout_analyze():
     data = request.get_json()
@@ -659,21 +1214,31 @@ def restaurant_scout_analyze():
 
     # Check cache first (only if no custom menu_url provided)
     if not menu_url:
-        print(f"[SCOUT] Checking cache for: name='{restaurant_name}', location='{location}'")
-        cached = get_cached_restaurant(restaurant_name, location)
+        cached = find_cached_restaurant(restaurant_name, location)
         if cached:
-            print(f"[SCOUT] CACHE HIT - Returning cached result for: {restaurant_name}")
-            # Include the database restaurant_id in the response
-            result = cached["data"]
-            result["restaurant_id"] = cached["restaurant_id"]
-            return jsonify(result)
-        else:
-            print(f"[SCOUT] CACHE MISS - Will perform web search for: {restaurant_name}")
+            scout_log.info("Cache hit (%s) for %r (%r)", cached["matched_by"], restaurant_name, location)
+            return cached_restaurant_response(cached)
+
+        failure = get_scout_failure(restaurant_name, location)
+        if failure:
+            scout_log.info("Negative cache hit (%s x%d) for %r (%r)", failure["failure_kind"],
+                           failure["failure_count"], restaurant_name, location)
+            return scout_failure_response(failure)
+
+        # A close but uncertain match: ask the user before serving another
+        # restaurant's report (they can confirm it, or research this name)
+        if not data.get("skip_suggestion"):
+            suggestion = match_suggestion(restaurant_name, location)
+            if suggestion:
+                scout_log.info("Suggesting id=%s for %r (%r)", suggestion["restaurant_id"], restaurant_name, location)
+                return jsonify({"suggestion": suggestion})
+
+        scout_log.info("Cache miss for %r (%r), will perform web search", restaurant_name, location)
 
     # --- Hourly rate limit (per-IP, in-memory) ---
     ip = get_client_ip()
     if not check_hourly_rate_limit(ip):
-        print(f"[SCOUT] HOURLY RATE LIMIT hit for IP {ip}")
+        scout_log.warning("Hourly rate limit hit for IP %s", ip)
         return jsonify({
             "error": "Celia is doing a lot of research for you! Try again in an hour, or search a restaurant we already know about.",
         }), 429
@@ -683,7 +1248,7 @@ def restaurant_scout_analyze():
         user = get_user_by_id(session["user_id"])
         if user:
             count = get_search_count(user["email"])
-            print(f"[SCOUT] Signed-in user {user['email']} search count: {count}")
+            scout_log.debug("Signed-in user %s search count: %d", user["id"], count)
             if count >= FREE_SEARCH_LIMIT:
                 return jsonify({
                     "error": "You've used all 5 free restaurant searches!",
@@ -692,110 +1257,95 @@ def restaurant_scout_analyze():
     else:
         ip = get_client_ip()
         count = get_anonymous_search_count(ip)
-        print(f"[SCOUT] Anonymous user {ip} search count: {count}")
+        scout_log.debug("Anonymous user %s search count: %d", ip, count)
         if count >= FREE_SEARCH_LIMIT:
             return jsonify({
                 "error": "You've used all 5 free restaurant searches!",
                 "limit_reached": True,
             }), 429
 
-    url_context = ""
-    url_search_instruction = ""
-    if menu_url:
-        url_context = f"Menu or website URL provided by user: {menu_url}"
-        url_search_instruction = (
-            f'5. Search: "{menu_url}"\n'
-            f"   → Fetch the user-provided URL for menu or restaurant details"
-        )
-
-    location_context = f"Location: {location}" if location else ""
-
-    prompt = RESTAURANT_SCOUT_PROMPT.format(
-        restaurant_name=restaurant_name,
-        url_context=url_context,
-        url_search_instruction=url_search_instruction,
-        location_context=location_context,
-    )
-
     try:
-        print(f"[SCOUT] Starting analysis for: {restaurant_name}")
-        message = client.messages.create(
-            model="claude-sonnet-4-20250514",
-            max_tokens=10000,
-            tools=[{"type": "web_search_20250305", "name": "web_search", "max_uses": 5}],
-            messages=[{"role": "user", "content": prompt}],
-        )
-
-        # Log response structure for debugging
-        block_types = [block.type for block in message.content]
-        print(f"[SCOUT] Response blocks: {block_types}")
-        print(f"[SCOUT] Stop reason: {message.stop_reason}")
-
-        # With web_search, response has multiple content blocks.
-        # Find the last text block which contains the JSON analysis.
-        response_text = None
-        for block in reversed(message.content):
-            if block.type == "text":
-                response_text = block.text
-                break
-
-        if not response_text:
-            print(f"[SCOUT] ERROR: No text block found in response")
-            return jsonify({
-                "error": "No analysis text in response. Please try again.",
-                "debug": {"block_types": block_types, "stop_reason": message.stop_reason},
-            }), 500
-
-        print(f"[SCOUT] Raw response (first 500 chars): {response_text[:500]}")
-        analysis = parse_claude_json(response_text)
-        print(f"[SCOUT] Successfully parsed analysis for: {analysis.get('restaurant_name', 'unknown')}")
+        analysis = run_scout_analysis(restaurant_name, location, menu_url,
+                                      user_id=session.get("user_id"), ip_address=ip)
 
+    except RestaurantNotFound:
+        return jsonify({
+            "error": NOT_FOUND_MESSAGE,
+            "not_found": True,
+        }), 404
+    except NoAnalysisText as e:
+        return jsonify({
+            "error": "No analysis text in response. Please try again.",
+            "debug": {"block_types": e.block_types, "stop_reason": e.stop_reason},
+        }), 500
     except json.JSONDecodeError as e:
-        print(f"[SCOUT] JSON parse error: {e}")
-        print(f"[SCOUT] Raw text that failed to parse:\n{response_text}")
+        scout_log.error("JSON parse error: %s", e)
+        scout_log.verbose("Raw text that failed to parse:\n%s", e.raw_response)
         return jsonify({
             "error": "Failed to parse analysis. Please try again.",
-            "debug": {"parse_error": str(e), "raw_response": response_text[:2000]},
+            "debug": {"parse_error": str(e), "raw_response": e.raw_response[:2000]},
         }), 500
     except Exception as e:
-        print(f"[SCOUT] Exception: {e}")
-        print(f"[SCOUT] Traceback:\n{traceback.format_exc()}")
+        scout_log.exception("Analysis failed: %s", e)
         return jsonify({
             "error": f"Analysis failed: {str(e)}",
             "debug": {"exception_type": type(e).__name__, "traceback": traceback.format_exc()},
         }), 500
 
     # Increment search count after successful (uncached) API call
-    if "user_id" in session:
-        user = get_user_by_id(session["user_id"])
-        if user:
-            increment_search_count(user["email"])
-    else:
-        increment_anonymous_search_count(get_client_ip())
+    charge_search(ip)
 
-    record_hourly_rate_use(ip)
-
-    scout_id = str(uuid.uuid4())[:8]
-    result = {
-        "id": scout_id,
-        "restaurant_name": restaurant_name,
-        "menu_url": menu_url,
-        "timestamp": datetime.now().isoformat(),
-        "analysis": analysis,
-    }
+    result = build_scout_result(restaurant_name, menu_url, analysis)
 
     # Cache the result (only if no custom menu_url) and get the database ID
     if not menu_url:
-        cache_restaurant_result(restaurant_name, location, result)
-        # Get the restaurant_id from the database after caching
-        restaurant_id = get_restaurant_id(restaurant_name, location)
-        if restaurant_id:
-            result["restaurant_id"] = restaurant_id
+        cache_scout_result(restaurant_name, location, result)
 
     return jsonify(result)
 
 
 
+def match_suggestion(restaurant_name, location):
+    """{"restaurant_id", "name", "location", "safety_score"} of a cached
+    restaurant the user probably means, for them to confirm, or None."""
+    restaurant_id = suggest_restaurant(restaurant_name, location)
+    cached = get_cached_restaurant_by_id(restaurant_id) if restaurant_id else None
+    if not cached:
+        return None
+    return {
+        "restaurant_id": restaurant_id,
+        "name": display_name_from_search_query(cached["search_query"], cached["location"], cached["name"]),
+        "location": cached["location"],
+        "safety_score": get_match_index().score(restaurant_id),
+    }
+
+
+@app.route("/api/restaurant-scout/confirm-match", methods=["POST"])
+def restaurant_scout_confirm_match():
+    """The user accepted a suggestion: remember their spelling as an alias of
+    that restaurant, so the next search for it is a cache hit."""
+    data = request.get_json(silent=True) or {}
+    restaurant_name = str(data.get("restaurant_name") or "").strip()
+    location = str(data.get("location") or "").strip()
+    restaurant_id = data.get("restaurant_id")
+    if not restaurant_name or not isinstance(restaurant_id, int):
+        return jsonify({"error": "restaurant_name and restaurant_id are required"}), 400
+    if not confirm_match(restaurant_name, location, restaurant_id):
+        return jsonify({"error": "That restaurant wasn't suggested for this search"}), 409
+    return jsonify({"success": True})
+
+
+@app.route("/api/restaurant/<int:restaurant_id>", methods=["GET"])
+def restaurant_report(restaurant_id):
+    """Full cached report for one restaurant. Listings (My Safe Spots,
+    alternatives) only load the listing columns and fetch this when opened."""
+    cached = get_cached_restaurant_by_id(restaurant_id)
+    if not cached:
+        return jsonify({"error": "Restaurant not found"}), 404
+    # Browsers keep the report and revalidate it with If-None-Match
+    return cached_restaurant_response(cached, cache_control="private, no-cache")
+
+
 @app.route("/api/restaurant-scout/save", methods=["POST"])
 def restaurant_scout_save():
     data = request.get_json()
@@ -818,6 +1368,25 @@ def restaurant_scout_save():
     return jsonify({"success": True, "id": record["id"]})
 
 
+ALTERNATIVES_LOCAL_MIN = 2  # local candidates needed to skip the web search
+ALTERNATIVES_MIN_SCORE = 7
+ALTERNATIVES_LIMIT = 3
+
+
+def local_alternative(row):
+    """Shape a cached restaurant row like an ALTERNATIVES_PROMPT result."""
+    return {
+        "name": row.get("display_name") or row["name"].title(),
+        "cuisine": row.get("cuisine_type") or "",
+        "estimated_safety_score": row["safety_score"],
+        "score_label": row.get("score_label") or "",
+        "brief_reason": row.get("summary") or "",
+        "location_note": row["location"].title() if row.get("location") else "",
+        "cached_score": row["safety_score"],
+        "restaurant_id": row["id"],
+    }
+
+
 @app.route("/api/restaurant-scout/alternatives", methods=["POST"])
 def restaurant_scout_alternatives():
     data = request.get_json()
@@ -827,6 +1396,16 @@ def restaurant_scout_alternatives():
     location = data["location"].strip()
     cuisine_type = data.get("cuisine_type", "").strip()
     original_name = data.get("original_restaurant_name", "").strip()
+    # "auto" (default): local corpus first, web search if too few;
+    # "local": never call Claude; "web": always call Claude
+    mode = data.get("mode", "auto")
+
+    if mode in ("auto", "local"):
+        local = get_local_alternatives(location, cuisine_type, original_name,
+                                       min_score=ALTERNATIVES_MIN_SCORE, limit=ALTERNATIVES_LIMIT)
+        if mode == "local" or len(local) >= ALTERNATIVES_LOCAL_MIN:
+            alt_log.info("Serving %d local alternatives near %r", len(local), location)
+            return jsonify({"alternatives": [local_alternative(r) for r in local], "source": "local"})
 
     prompt = ALTERNATIVES_PROMPT.format(
         original_restaurant_name=original_name,
@@ -835,8 +1414,11 @@ def restaurant_scout_alternatives():
     )
 
     try:
-        print(f"[SCOUT-ALT] Finding alternatives near {location} for {original_name}")
-        message = client.messages.create(
+        alt_log.info("Finding alternatives near %r for %r", location, original_name)
+        message = create_message(
+            "alternatives",
+            user_id=session.get("user_id"),
+            ip_address=get_client_ip(),
             model="claude-sonnet-4-20250514",
             max_tokens=2000,
             tools=[{"type": "web_search_20250305", "name": "web_search", "max_uses": 3}],
@@ -850,31 +1432,32 @@ def restaurant_scout_alternatives():
                 break
 
         if not response_text:
-            print(f"[SCOUT-ALT] ERROR: No text block found in response")
+            alt_log.error("No text block found in response")
             return jsonify({"alternatives": []}), 200
 
-        print(f"[SCOUT-ALT] Raw response (first 500 chars): {response_text[:500]}")
-        result = parse_claude_json(response_text)
+        alt_log.verbose("Raw response (first 500 chars): %s", response_text[:500])
+        with span("json_parse"):
+            result = parse_claude_json(response_text, schema="alternatives")
         alternatives = result.get("alternatives", [])
-        print(f"[SCOUT-ALT] Found {len(alternatives)} alternatives")
+        alt_log.debug("Found %d alternatives", len(alternatives))
 
         # Attach cached scores where available
         if alternatives:
             names = [a["name"] for a in alternatives]
-            cached_scores = get_cached_scores(names, location)
+            cached_scores = match_scores(names, location, get_cached_scores(names, location))
             for a in alternatives:
-                norm_name = " ".join(a["name"].lower().split())
+                norm_name = normalize_name(a["name"])
                 if norm_name in cached_scores:
                     a["cached_score"] = cached_scores[norm_name]
 
+        result["source"] = "web"
         return jsonify(result)
 
     except json.JSONDecodeError as e:
-        print(f"[SCOUT-ALT] JSON parse error: {e}")
+        alt_log.error("JSON parse error: %s", e)
         return jsonify({"alternatives": []}), 200
     except Exception as e:
-        print(f"[SCOUT-ALT] Exception: {e}")
-        print(f"[SCOUT-ALT] Traceback:\n{traceback.format_exc()}")
+        alt_log.exception("Alternatives failed: %s", e)
         return jsonify({"alternatives": []}), 200
 
 
@@ -1061,6 +1644,156 @@ Based on your research, return ONLY valid JSON with up to 5 restaurants you actu
 Return ONLY valid JSON, no other text."""
 
 
+def run_discovery(cuisine, location, user_id=None, ip_address=None):
+    """Ask Claude (Haiku + web search) for GF-friendly restaurants and cache the
+    list. Returns the restaurants list; raises on API or JSON parse errors."""
+    prompt = DISCOVER_PROMPT.format(cuisine=cuisine, location=location)
+
+    discover_log.info("Searching for %r restaurants in %r", cuisine, location)
+    message = create_message(
+        "discover",
+        user_id=user_id,
+        ip_address=ip_address,
+        model="claude-haiku-4-5-20250929",
+        max_tokens=2000,
+        tools=[{"type": "web_search_20250305", "name": "web_search", "max_uses": 3}],
+        messages=[{"role": "user", "content": prompt}],
+    )
+
+    response_text = None
+    for block in reversed(message.content):
+        if block.type == "text":
+            response_text = block.text
+            break
+
+    if not response_text:
+        discover_log.error("No text block found in response")
+        return []
+
+    discover_log.verbose("Raw response (first 500 chars): %s", response_text[:500])
+    with span("json_parse"):
+        result = parse_claude_json(response_text, schema="discover")
+    restaurants = result.get("restaurants", [])
+    discover_log.debug("Found %d restaurants", len(restaurants))
+
+    if restaurants:
+        cache_discovery_result(cuisine, location, restaurants)
+    return restaurants
+
+
+def attach_discover_scores(restaurants, location):
+    """Attach cached safety scores (looked up fresh, since they change
+    independently of the discovery list) to each restaurant dict."""
+    if not restaurants:
+        return restaurants
+    names = [r["name"] for r in restaurants]
+    cached_scores = match_scores(names, location, get_cached_scores(names, location))
+
+    for r in restaurants:
+        norm_name = normalize_name(r["name"])
+        if norm_name in cached_scores:
+            r["cached_score"] = cached_scores[norm_name]
+    return restaurants
+
+
+# Scout analyses run at once for "analyze all" discovery requests, across all
+# requests in this worker process.
+DISCOVER_ANALYZE_CONCURRENCY = int(os.environ.get("DISCOVER_ANALYZE_CONCURRENCY", "6"))
+_discover_analysis_slots = threading.BoundedSemaphore(DISCOVER_ANALYZE_CONCURRENCY)
+
+
+def ndjson_line(**fields):
+    return json.dumps(fields) + "\n"
+
+
+def _analyze_discovered(name, location, user_id, ip):
+    """Research one discovered restaurant (waiting for a global slot) and cache it."""
+    with _discover_analysis_slots:
+        analysis = run_scout_analysis(name, location, user_id=user_id, ip_address=ip)
+    return cache_scout_result(name, location, build_scout_result(name, "", analysis))
+
+
+def stream_discover_reports(restaurants, location, **summary):
+    """NDJSON stream for /api/discover with analyze_all: the restaurant list,
+    then one line per restaurant as its full report becomes available.
+
+    Cached reports (looked up together in one query) are sent straight away.
+    The rest are researched concurrently, as many as the user's free searches
+    and hourly limit allow, and sent in the order they finish. Lines:
+        {"type": "restaurants", "restaurants": [...], ...summary}
+        {"type": "report", "index": i, "cached": bool, "report": {..., "cached_score": n}}
+        {"type": "error", "index": i, "error": "...", "not_found": bool}
+        {"type": "skipped", "index": i, "limit_reached": true}
+        {"type": "done", "analyzed": n, "searches_remaining": n}
+    `index` is the restaurant's position in the list. Restaurants and reports
+    carry cached_score as in the non-streaming response."""
+    names = [r["name"] for r in restaurants]
+    user_id = session.get("user_id")
+    ip = get_client_ip()
+
+    restaurants = attach_discover_scores(restaurants, location)
+    yield ndjson_line(type="restaurants", restaurants=restaurants, **summary)
+
+    misses = []
+    for index, (name, cached) in enumerate(zip(names, find_cached_restaurants(names, location))):
+        if cached is None:
+            misses.append(index)
+            continue
+        fields = {"cached_score": restaurants[index].get("cached_score")}
+        if cached["stale"]:
+            fields["refreshing"] = queue_restaurant_refresh(cached)
+        body = splice_json(cached["body"], **fields)
+        yield f'{{"type": "report", "index": {index}, "cached": true, "report": {body}}}\n'
+
+    to_run = []
+    for index in misses:
+        failure = get_scout_failure(names[index], location)
+        if failure:
+            yield ndjson_line(type="error", index=index, not_found=failure["failure_kind"] == "not_found",
+                              error=NOT_FOUND_MESSAGE if failure["failure_kind"] == "not_found"
+                              else "Celia had trouble researching this restaurant just now.")
+        else:
+            to_run.append(index)
+
+    budget = min(get_searches_remaining(), hourly_rate_remaining(ip)) if to_run else 0
+    for index in to_run[budget:]:
+        yield ndjson_line(type="skipped", index=index, limit_reached=True)
+    to_run = to_run[:budget]
+
+    analyzed = 0
+    if to_run:
+        discover_log.info("Analyzing %d of %d discovered restaurants in %r", len(to_run), len(names), location)
+        with ThreadPoolExecutor(max_workers=len(to_run), thread_name_prefix="celia-discover") as pool:
+            futures = {pool.submit(_analyze_discovered, names[i], location, user_id, ip): i for i in to_run}
+            for future in as_completed(futures):
+                index = futures[future]
+                try:
+                    result = future.result()
+                except RestaurantNotFound:
+                    yield ndjson_line(type="error", index=index, not_found=True, error=NOT_FOUND_MESSAGE)
+                    continue
+                except Exception as e:
+                    discover_log.error("Analysis of %r failed: %s", names[index], e)
+                    yield ndjson_line(type="error", index=index, not_found=False,
+                                      error="Analysis failed. Please try again.")
+                    continue
+                charge_search(ip)
+                analyzed += 1
+                report = dict(result, cached_score=(result.get("analysis") or {}).get("safety_score"))
+                yield ndjson_line(type="report", index=index, cached=False, report=report)
+
+    yield ndjson_line(type="done", analyzed=analyzed, searches_remaining=get_searches_remaining())
+
+
+def discover_response(restaurants, location, analyze_all, **summary):
+    if analyze_all:
+        response = Response(stream_with_context(stream_discover_reports(restaurants, location, **summary)),
+                            mimetype="application/x-ndjson")
+        response.headers["Cache-Control"] = "no-cache"
+        return response
+    return jsonify({"restaurants": attach_discover_scores(restaurants, location), **summary})
+
+
 @app.route("/api/discover", methods=["POST"])
 def discover_restaurants():
     data = request.get_json()
@@ -1069,66 +1802,38 @@ def discover_restaurants():
 
     cuisine = data.get("cuisine", "").strip()
     location = data.get("location", "").strip()
+    analyze_all = bool(data.get("analyze_all"))
 
     if not cuisine or not location:
         return jsonify({"error": "Cuisine and location are required"}), 400
 
-    prompt = DISCOVER_PROMPT.format(cuisine=cuisine, location=location)
+    # Serve cached results instantly; refresh stale ones in the background
+    cached = get_cached_discovery(cuisine, location)
+    if cached:
+        refreshing = False
+        if cached["stale"]:
+            key = ("discover", normalize_cuisine(cuisine), normalize_location(location))
+            refreshing = submit_refresh(key, run_discovery, cuisine, location)
+        return discover_response(cached["restaurants"], location, analyze_all,
+                                 cached=True, refreshing=refreshing)
 
     try:
-        print(f"[DISCOVER] Searching for {cuisine} restaurants in {location}")
-        message = client.messages.create(
-            model="claude-haiku-4-5-20250929",
-            max_tokens=2000,
-            tools=[{"type": "web_search_20250305", "name": "web_search", "max_uses": 3}],
-            messages=[{"role": "user", "content": prompt}],
-        )
-
-        response_text = None
-        for block in reversed(message.content):
-            if block.type == "text":
-                response_text = block.text
-                break
-
-        if not response_text:
-            print(f"[DISCOVER] ERROR: No text block found in response")
-            return jsonify({"restaurants": []}), 200
-
-        print(f"[DISCOVER] Raw response (first 500 chars): {response_text[:500]}")
-        result = parse_claude_json(response_text)
-        restaurants = result.get("restaurants", [])
-        print(f"[DISCOVER] Found {len(restaurants)} restaurants")
-
-        # Check cache for any existing scores
-        if restaurants:
-            names = [r["name"] for r in restaurants]
-            cached_scores = get_cached_scores(names, location)
-
-            # Attach cached scores where available
-            for r in restaurants:
-                norm_name = " ".join(r["name"].lower().split())
-                if norm_name in cached_scores:
-                    r["cached_score"] = cached_scores[norm_name]
-
-        return jsonify({"restaurants": restaurants})
-
+        restaurants = run_discovery(cuisine, location, session.get("user_id"), get_client_ip())
     except json.JSONDecodeError as e:
-        print(f"[DISCOVER] JSON parse error: {e}")
-        return jsonify({"restaurants": []}), 200
+        discover_log.error("JSON parse error: %s", e)
+        restaurants = []
     except Exception as e:
-        print(f"[DISCOVER] Exception: {e}")
-        print(f"[DISCOVER] Traceback:\n{traceback.format_exc()}")
-        return jsonify({"restaurants": []}), 200
+        discover_log.exception("Discovery failed: %s", e)
+        restaurants = []
+    return discover_response(restaurants, location, analyze_all)
 
 
 # ---------------------------------------------------------------------------
 # Startup
 # ---------------------------------------------------------------------------
 
-os.makedirs(app.config["UPLOAD_FOLDER"], exist_ok=True)
-
 from database import (
-    init_tables, get_cached_restaurant, cache_restaurant_result, get_cached_scores,
+    apply_migrations, get_cached_restaurant, cache_restaurant_result, get_cached_scores,
     get_or_create_user, get_user_by_id, get_restaurant_id, restaurant_exists,
     save_user_restaurant, unsave_user_restaurant, is_restaurant_saved, get_user_saved_restaurants,
     get_search_count, increment_search_count,
@@ -1137,8 +1842,23 @@ from database import (
     get_restaurant_count,
     get_admin_stats, get_recent_restaurants, get_waitlist_entries,
     get_restaurant_request_entries, get_most_saved_restaurants,
+    get_llm_usage_by_endpoint, get_llm_usage_by_day, get_llm_usage_by_user,
+    get_cached_discovery, cache_discovery_result, normalize_cuisine, normalize_location,
+    get_local_alternatives, normalize_name, display_name_from_search_query,
+    get_scout_failure, record_scout_failure, get_cached_restaurant_by_id,
+    get_request_profiles, get_profiled_routes, get_request_profile,
+    get_product_verdict, save_product_verdict, get_most_scanned_products,
+)
+from matching import (
+    find_cached_restaurant, find_cached_restaurants, match_scores, index_restaurant,
+    suggest_restaurant, confirm_match, get_index as get_match_index,
 )
-init_tables()
+
+# Deploys run `python setup_db.py` first; this only checks the schema is
+# current (one query), unless that step was skipped. With gunicorn's
+# preload_app it runs once in the master rather than in every worker.
+if os.environ.get("MIGRATE_ON_STARTUP", "on").lower() != "off":
+    apply_migrations()
 
 
 # ---------------------------------------------------------------------------
@@ -1177,6 +1897,13 @@ def admin_dashboard():
     waitlist = get_waitlist_entries()
     requests = get_restaurant_request_entries()
     most_saved = get_most_saved_restaurants(10)
+    most_scanned = get_most_scanned_products(10)
+    usage_by_endpoint = get_llm_usage_by_endpoint(30)
+    usage_by_day = get_llm_usage_by_day(14)
+    usage_by_user = get_llm_usage_by_user(30, 20)
+    profile_route = request.args.get("profile_route") or None
+    profiles = get_request_profiles(profile_route, 25)
+    profiled_routes = get_profiled_routes()
 
     return render_template(
         "admin_dashboard.html",
@@ -1185,7 +1912,56 @@ def admin_dashboard():
         waitlist=waitlist,
         requests=requests,
         most_saved=most_saved,
+        most_scanned=most_scanned,
+        usage_by_endpoint=usage_by_endpoint,
+        usage_by_day=usage_by_day,
+        usage_by_user=usage_by_user,
+        profiles=profiles,
+        profiled_routes=profiled_routes,
+        profile_route=profile_route,
+        profiling_on=bool(request.cookies.get(profiling.PROFILE_COOKIE)),
+    )
+
+
+@app.route("/admin/profiles/<int:profile_id>.txt")
+def admin_profile_stacks(profile_id):
+    """Collapsed stacks of one profile, for flamegraph.pl or speedscope."""
+    if not session.get("admin_authenticated"):
+        return redirect(url_for("admin_login"))
+    profile = get_request_profile(profile_id)
+    if profile is None:
+        return "Profile not found", 404
+    filename = f"profile-{profile_id}-{re.sub(r'[^a-z0-9]+', '-', profile['route'].lower()).strip('-')}.txt"
+    return profile["stacks"] + "\n", 200, {
+        "Content-Type": "text/plain; charset=utf-8",
+        "Content-Disposition": f'attachment; filename="{filename}"',
+    }
+
+
+@app.route("/admin/profiling", methods=["POST"])
+def admin_toggle_profiling():
+    """Turn profiling of this browser's requests on or off (the profile cookie)."""
+    if not session.get("admin_authenticated"):
+        return redirect(url_for("admin_login"))
+    response = redirect(url_for("admin_dashboard"))
+    if request.form.get("enabled") == "1":
+        response.set_cookie(profiling.PROFILE_COOKIE, "1", max_age=3600, httponly=True, samesite="Lax")
+    else:
+        response.delete_cookie(profiling.PROFILE_COOKIE)
+    return response
+
+
+@app.route("/metrics")
+def metrics_endpoint():
+    """Prometheus scrape endpoint. Requires METRICS_TOKEN as a bearer token,
+    or an admin session when browsing."""
+    token = os.environ.get("METRICS_TOKEN")
+    authorized = session.get("admin_authenticated") or (
+        token and request.headers.get("Authorization") == f"Bearer {token}"
     )
+    if not authorized:
+        return "Unauthorized", 401
+    return metrics.render_prometheus(), 200, {"Content-Type": "text/plain; version=0.0.4"}
 
 
 @app.route("/admin/logout")
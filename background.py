@@ -0,0 +1,95 @@
+"""Thread pools for work that should not hold up a response. Jobs are
+de-duplicated by key so a burst of requests for the same stale entry only
+triggers one job.
+
+submit_once() is for short jobs (index rebuilds, snapshot refreshes,
+thumbnails, profile saves). Re-researching a stale entry with Claude takes
+tens of seconds, so submit_refresh() runs those on a pool of their own and
+caps how many can wait: when REFRESH_QUEUE_SIZE refreshes are already
+queued, a new one is dropped (the entry stays stale and is retried on a
+later request) instead of queueing for minutes.
+
+Environment:
+    BACKGROUND_WORKERS   threads for short jobs (default 2)
+    REFRESH_WORKERS      threads for Claude refreshes (default 2)
+    REFRESH_QUEUE_SIZE   refreshes allowed to wait for a thread (default 20)
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from logging_config import get_logger
+from metrics import inc
+
+log = get_logger("BACKGROUND")
+
+BACKGROUND_WORKERS = int(os.environ.get("BACKGROUND_WORKERS", "2"))
+REFRESH_WORKERS = int(os.environ.get("REFRESH_WORKERS", "2"))
+REFRESH_QUEUE_SIZE = int(os.environ.get("REFRESH_QUEUE_SIZE", "20"))
+
+
+class _Pool:
+    """A lazily created executor with per-key de-duplication and an optional
+    cap on jobs queued or running."""
+
+    def __init__(self, name, workers, max_pending=None):
+        self.name = name
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor = None
+        self._executor_pid = None
+        self._inflight = set()
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        """Create the pool lazily, and again after a fork (threads don't survive fork)."""
+        if self._executor_pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=f"celia-{self.name}")
+            self._executor_pid = os.getpid()
+            self._inflight.clear()
+        return self._executor
+
+    def submit_once(self, key, fn, *args, **kwargs):
+        with self._lock:
+            executor = self._get_executor()
+            if key in self._inflight:
+                return False
+            if self.max_pending is not None and len(self._inflight) >= self.max_pending:
+                inc("celia_background_dropped_total", pool=self.name)
+                log.warning("Background pool %s is full, dropping %s", self.name, key)
+                return False
+            self._inflight.add(key)
+
+        def run():
+            try:
+                fn(*args, **kwargs)
+            except Exception as e:
+                log.exception("Background job %s failed: %s", key, e)
+            finally:
+                with self._lock:
+                    self._inflight.discard(key)
+
+        executor.submit(run)
+        return True
+
+    def pending(self, key):
+        with self._lock:
+            return self._executor_pid == os.getpid() and key in self._inflight
+
+
+_default_pool = _Pool("bg", BACKGROUND_WORKERS)
+_refresh_pool = _Pool("refresh", REFRESH_WORKERS, max_pending=REFRESH_WORKERS + REFRESH_QUEUE_SIZE)
+
+
+def submit_once(key, fn, *args, **kwargs):
+    """Run fn(*args, **kwargs) in the background unless a job with the same key
+    is already queued or running. Returns True if the job was submitted."""
+    return _default_pool.submit_once(key, fn, *args, **kwargs)
+
+
+def submit_refresh(key, fn, *args, **kwargs):
+    """submit_once() for a slow Claude refresh, on the refresh pool. Returns
+    True if a refresh for `key` is now queued or running (this one or an
+    earlier one), False if the pool was full and it was dropped."""
+    return _refresh_pool.submit_once(key, fn, *args, **kwargs) or _refresh_pool.pending(key)
@@ -0,0 +1,122 @@
+"""UPC / EAN barcodes on label photos.
+
+A packaged product's barcode identifies it, so once a product has been
+analyzed its verdict is kept in the product_verdicts table and later scans
+of it are answered from there instead of a vision call (see
+database.get_product_verdict). The barcode comes from the scanner page when
+the browser can read it, otherwise it is detected here from the uploaded
+photo with zxing-cpp, or pyzbar when only that is installed. With neither
+(or Pillow) installed, only barcodes sent by the client are used.
+
+Every code is normalized to a 13-digit GTIN: UPC-E is expanded to UPC-A,
+and UPC-A and EAN-8 are zero-padded on the left. Codes with a wrong check
+digit are rejected.
+
+Environment:
+    BARCODE_DETECTION   "off" disables detection from photos (default on)
+"""
+
+import os
+from io import BytesIO
+
+from logging_config import get_logger
+from metrics import inc, span
+
+try:
+    from PIL import Image
+except ImportError:  # optional dependency
+    Image = None
+
+try:
+    import zxingcpp
+except ImportError:  # optional dependency
+    zxingcpp = None
+
+try:
+    from pyzbar import pyzbar
+except ImportError:  # optional dependency
+    pyzbar = None
+
+log = get_logger("BARCODE")
+
+BARCODE_DETECTION = os.environ.get("BARCODE_DETECTION", "on").lower() not in ("0", "off", "false")
+DETECT_MAX_SIZE = 2000  # px, longest side: larger photos are decoded at reduced size
+
+if zxingcpp is not None:
+    DECODER = "zxing-cpp"
+elif pyzbar is not None:
+    DECODER = "pyzbar"
+else:
+    DECODER = None
+
+
+def check_digit(digits):
+    """GTIN check digit for the digits before it."""
+    total = sum(int(d) * (3 if i % 2 == 0 else 1) for i, d in enumerate(reversed(digits)))
+    return str(-total % 10)
+
+
+def expand_upce(code):
+    """The 12-digit UPC-A for an 8-digit UPC-E code."""
+    system, d, check = code[0], code[1:7], code[7]
+    if d[5] in "012":
+        body = d[0:2] + d[5] + "0000" + d[2:5]
+    elif d[5] == "3":
+        body = d[0:3] + "00000" + d[3:5]
+    elif d[5] == "4":
+        body = d[0:4] + "00000" + d[4]
+    else:
+        body = d[0:5] + "0000" + d[5]
+    return system + body + check
+
+
+def normalize_barcode(text, kind=None):
+    """The 13-digit GTIN for a scanned code, or None if it isn't a valid
+    UPC-A / UPC-E / EAN-8 / EAN-13. An 8-digit code is read as EAN-8 unless
+    `kind` is "UPCE"."""
+    code = "".join((text or "").split())
+    if not code.isdigit():
+        return None
+    if len(code) == 8 and kind == "UPCE":
+        if code[0] not in "01":
+            return None
+        code = expand_upce(code)
+    if len(code) == 14 and code[0] == "0":
+        code = code[1:]
+    if len(code) not in (8, 12, 13) or code[-1] != check_digit(code[:-1]):
+        return None
+    return code.zfill(13)
+
+
+def _decode(image):
+    """(text, kind) for each product barcode found in a PIL image."""
+    if zxingcpp is not None:
+        formats = (zxingcpp.BarcodeFormat.EAN13 | zxingcpp.BarcodeFormat.EAN8
+                   | zxingcpp.BarcodeFormat.UPCA | zxingcpp.BarcodeFormat.UPCE)
+        return [(result.text, result.format.name) for result in zxingcpp.read_barcodes(image, formats=formats)]
+    symbols = [pyzbar.ZBarSymbol.EAN13, pyzbar.ZBarSymbol.EAN8, pyzbar.ZBarSymbol.UPCA, pyzbar.ZBarSymbol.UPCE]
+    return [(result.data.decode("ascii"), result.type) for result in pyzbar.decode(image, symbols=symbols)]
+
+
+def detect_barcode(image_bytes):
+    """The normalized barcode in a photo, or None (no barcode, or no decoder)."""
+    if not BARCODE_DETECTION or DECODER is None or Image is None:
+        return None
+    try:
+        with span("barcode.detect"):
+            with Image.open(BytesIO(image_bytes)) as image:
+                image.draft("L", (DETECT_MAX_SIZE, DETECT_MAX_SIZE))  # JPEG: decode at reduced size
+                image = image.convert("L")
+                image.thumbnail((DETECT_MAX_SIZE, DETECT_MAX_SIZE))
+                found = _decode(image)
+    except Exception as e:
+        log.warning("Barcode detection failed: %s", e)
+        inc("celia_barcode_detections_total", result="error")
+        return None
+    for text, kind in found:
+        barcode = normalize_barcode(text, kind)
+        if barcode:
+            inc("celia_barcode_detections_total", result="found")
+            return barcode
+    inc("celia_barcode_detections_total", result="none")
+    return None
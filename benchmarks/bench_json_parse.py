@@ -0,0 +1,253 @@
+"""Benchmark Claude response parsing against the recorded-response corpus.
+
+Compares the old first-"{"-to-last-"}" parser with claude_json, and with an
+incremental bracket-depth extractor fed the text in chunks (kept here to
+measure whether parsing while a response streams would be worth it): how
+many responses each parses into the expected schema, and microseconds per
+parse.
+
+Run:  python benchmarks/bench_json_parse.py [--repeat 200] [--chunk 64]
+
+Corpus files live in benchmarks/json_corpus/ and are named
+<schema>-<case>.txt; cases ending in "-expect-fail" have no usable answer.
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from claude_json import RESPONSE_SCHEMAS, parse_claude_json, validate
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "json_corpus")
+
+_STRUCTURAL = re.compile(r'[{}\[\]"]')
+_STRING_SPECIAL = re.compile(r'[\\"]')
+
+
+class IncrementalJSONExtractor:
+    """Find complete top-level JSON objects in text fed in arbitrary chunks.
+
+        extractor = IncrementalJSONExtractor()
+        for chunk in stream:
+            for obj in extractor.feed(chunk):
+                ...
+        leftovers = extractor.close()
+
+    Text outside objects is skipped. A candidate that closes with a mismatched
+    bracket or doesn't parse is abandoned and scanning resumes just after its
+    opening brace, so prose like "a {note} before" never hides the answer.
+    Only the new chunk is scanned on each feed; earlier text of an open
+    candidate is kept as a list of pieces and joined once it closes.
+    """
+
+    def __init__(self):
+        self._buf = ""          # text being scanned (the latest chunk)
+        self._pos = 0           # next index of _buf to scan
+        self._start = None      # index in _buf where the open candidate continues
+        self._head = []         # earlier pieces of the open candidate
+        self._closers = []      # expected closing brackets, innermost last
+        self._in_string = False
+        self._escape = False    # a backslash ended the previous chunk
+        self.objects = []       # everything found so far, in order
+
+    def feed(self, chunk):
+        """Add the next chunk of text. Returns the objects it completed."""
+        if not chunk:
+            return []
+        if self._start is not None:
+            self._head.append(self._buf[self._start:])
+            self._start = 0
+        self._buf = chunk
+        self._pos = 0
+        if self._escape:
+            self._escape = False
+            self._pos = 1
+        return self._scan()
+
+    def close(self):
+        """End of input. If a candidate is still open (an unbalanced "{" in
+        prose), rescan from just after it. Returns any objects found."""
+        found = []
+        while self._start is not None:
+            self._abandon()
+            found.extend(self._scan())
+        return found
+
+    def _abandon(self):
+        """Give up on the open candidate and rescan from after its "{"."""
+        text = "".join(self._head) + self._buf[self._start:]
+        self._buf = text[1:]
+        self._pos = 0
+        self._start = None
+        self._head = []
+        self._closers = []
+        self._in_string = False
+        self._escape = False
+
+    def _scan(self):
+        found = []
+        while True:
+            buf = self._buf
+            pos = self._pos
+            if self._start is None:
+                pos = buf.find("{", pos)
+                if pos == -1:
+                    break
+                self._start = pos
+                self._closers = ["}"]
+                self._pos = pos + 1
+                continue
+
+            if self._in_string:
+                m = _STRING_SPECIAL.search(buf, pos)
+                if m is None:
+                    self._pos = len(buf)
+                    break
+                if m.group() == "\\":
+                    if m.end() >= len(buf):
+                        self._escape = True  # escaped character is in the next chunk
+                        self._pos = len(buf)
+                        break
+                    self._pos = m.end() + 1
+                else:
+                    self._in_string = False
+                    self._pos = m.end()
+                continue
+
+            m = _STRUCTURAL.search(buf, pos)
+            if m is None:
+                self._pos = len(buf)
+                break
+            ch = m.group()
+            self._pos = m.end()
+            if ch == '"':
+                self._in_string = True
+            elif ch == "{":
+                self._closers.append("}")
+            elif ch == "[":
+                self._closers.append("]")
+            elif ch != self._closers.pop():
+                self._abandon()
+            elif not self._closers:
+                text = "".join(self._head) + buf[self._start:self._pos]
+                try:
+                    value = json.loads(text)
+                except ValueError:
+                    self._abandon()
+                    continue
+                found.append(value)
+                self._start = None
+                self._head = []
+
+        self.objects.extend(found)
+        return found
+
+
+def legacy_parse_claude_json(response_text):
+    """The parser this replaced, kept for comparison."""
+    text = response_text.strip()
+    if "```" in text:
+        parts = text.split("```")
+        for part in parts:
+            if part.strip().startswith("json"):
+                part = part.strip()[4:].strip()
+            elif part.strip().startswith("{"):
+                pass
+            else:
+                continue
+            if "{" in part:
+                text = part
+                break
+    start = text.find("{")
+    end = text.rfind("}")
+    if start != -1 and end != -1 and end > start:
+        text = text[start:end + 1]
+    return json.loads(text)
+
+
+def streamed_parse(text, schema, chunk_size):
+    extractor = IncrementalJSONExtractor()
+    for i in range(0, len(text), chunk_size):
+        for value in extractor.feed(text[i:i + chunk_size]):
+            if validate(value, RESPONSE_SCHEMAS[schema]) is None:
+                return value
+    for value in extractor.close():
+        if validate(value, RESPONSE_SCHEMAS[schema]) is None:
+            return value
+    raise json.JSONDecodeError("No matching JSON object", text, 0)
+
+
+def load_corpus():
+    corpus = []
+    for filename in sorted(os.listdir(CORPUS_DIR)):
+        if filename.endswith(".txt"):
+            with open(os.path.join(CORPUS_DIR, filename)) as f:
+                schema = filename.split("-", 1)[0]
+                corpus.append((filename, schema, f.read()))
+    return corpus
+
+
+def run(parser, text, schema):
+    """Return True if parser produced a value matching the schema."""
+    try:
+        value = parser(text, schema)
+    except (ValueError, KeyError):
+        return False
+    return validate(value, RESPONSE_SCHEMAS[schema]) is None
+
+
+def time_parser(parser, text, schema, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        try:
+            parser(text, schema)
+        except ValueError:
+            pass
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("--repeat", type=int, default=200, help="parses per file for timing")
+    arg_parser.add_argument("--chunk", type=int, default=64, help="chunk size for the streamed parser")
+    args = arg_parser.parse_args()
+
+    parsers = {
+        "legacy": lambda text, schema: legacy_parse_claude_json(text),
+        "claude_json": lambda text, schema: parse_claude_json(text, schema=schema),
+        "streamed": lambda text, schema: streamed_parse(text, schema, args.chunk),
+    }
+
+    corpus = load_corpus()
+    print(f"{'file':<40} {'bytes':>7}  " + "  ".join(f"{name:>18}" for name in parsers))
+    ok = {name: 0 for name in parsers}
+    expected = 0
+    regressions = []
+    for filename, schema, text in corpus:
+        should_parse = "expect-fail" not in filename
+        expected += should_parse
+        cells = []
+        for name, parser in parsers.items():
+            parsed = run(parser, text, schema)
+            ok[name] += parsed and should_parse
+            if name != "legacy" and parsed != should_parse:
+                regressions.append(f"{name}: {filename}")
+            micros = time_parser(parser, text, schema, args.repeat)
+            cells.append(f"{'ok' if parsed else 'FAIL':>4} {micros:>10.1f} us")
+        print(f"{filename:<40} {len(text):>7}  " + "  ".join(f"{c:>18}" for c in cells))
+
+    print()
+    for name in parsers:
+        print(f"{name:<12} parsed {ok[name]}/{expected} usable responses")
+    if regressions:
+        print("\nUnexpected results:\n  " + "\n  ".join(regressions))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,346 @@
+"""Micro-benchmarks for the pure-Python helpers on the request path.
+
+Each benchmark runs a helper over a realistic corpus and reports calls per
+second and the average transient allocation per call (tracemalloc peak,
+measured on a sample of inputs in a separate pass):
+
+    normalize_name / normalize_location   restaurant names and locations as
+                                          users type them
+    display_name                          display_name_from_search_query, as
+                                          in get_user_saved_restaurants
+    parse_claude_json                     recorded responses (json_corpus/)
+    get_media_type                        upload filenames
+    check_hourly_rate_limit               synthetic per-IP traffic: a few
+                                          heavy IPs, a long tail of one-off ones
+    ingredient_prescreen                  ingredients.prescreen over generated
+                                          ingredient lists (safe, gluten, hidden
+                                          risks, warnings, certifications)
+
+Names come from a generated corpus of a few thousand realistic spellings,
+or from the restaurants table with --database-url (one row per cached
+search).
+
+Results are compared with the latest run in the history file for the same
+Python version. The script exits 1 when a helper got slower or allocates
+more than --threshold (fractional, default 0.2); --record appends this run
+to the history. Allocation figures are exact; timings on a shared or
+single-CPU machine can swing 30%+, so raise --threshold there.
+
+Run:  python benchmarks/bench_micro.py [--seconds 1] [--record] [--database-url URL]
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import platform
+import argparse
+import subprocess
+import tracemalloc
+from datetime import datetime, timezone
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+
+# Import the app without a database or Claude client; only its helpers are used.
+os.environ["DATABASE_URL"] = ""
+os.environ["LLM_MODE"] = "replay"
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+import app as celia_app
+import ingredients
+from claude_json import parse_claude_json
+from database import normalize_name, normalize_location, display_name_from_search_query
+
+CORPUS_DIR = os.path.join(BENCH_DIR, "json_corpus")
+DEFAULT_HISTORY = os.path.join(BENCH_DIR, "micro_history.jsonl")
+ALLOC_SAMPLE = 500  # inputs per benchmark measured under tracemalloc
+
+# Per-benchmark overrides of --threshold (noisier helpers get more room)
+THRESHOLDS = {
+    "check_hourly_rate_limit": 0.3,
+}
+
+
+# ---------------------------------------------------------------------------
+# Corpora
+# ---------------------------------------------------------------------------
+
+NAME_CORES = [
+    "Zahav", "Dizengoff", "Goldie", "Laser Wolf", "Parc", "Vetri", "Talula's Garden", "Pizzeria Beddia",
+    "Joe's", "Mama Mia", "Golden Dragon", "Pho 75", "Sakura", "El Vez", "La Colombe", "Shake Shack",
+    "Sweetgreen", "Chipotle", "Reading Terminal", "Federal Donuts", "Han Dynasty", "Dim Sum Garden",
+    "Little Nonna's", "Barbuzzo", "Kalaya", "Suraya", "Friday Saturday Sunday", "Café Lift", "Señor Taco",
+    "Bánh Mì Saigon", "Thai Orchid", "Taj Mahal", "Blue Corn", "South Philly Barbacoa", "Ralph's",
+    "Green Eggs Café", "Honeygrow", "Tria", "Jim's South St", "Pat's King of Steaks", "Geno's",
+]
+NAME_PREFIXES = ["", "", "", "The ", "Big ", "Little ", "Old ", "New "]
+NAME_SUFFIXES = [
+    "", "", "", " Restaurant", " Kitchen", " Cafe", " Bistro", " Grill", " & Bar", " Bar and Grill",
+    " Pizzeria", " Bakery", " Taqueria", " Noodle House", " - Center City", " (Rittenhouse)",
+]
+LOCATIONS = [
+    "Philadelphia, PA", "philadelphia", "Philly", "  Philadelphia ,  PA ", "Rittenhouse, Philadelphia, PA",
+    "New York, NY", "NYC", "Brooklyn NY", "new york city", "Boston, MA", "Cambridge MA", "Austin, TX",
+    "Los Angeles", "LA", "San Francisco, CA", "Chicago, IL", "Washington DC", "", "Seattle",
+]
+UPLOAD_FILENAMES = [
+    "IMG_2041.JPG", "photo.jpeg", "label.png", "Screenshot 2024-05-01 at 10.22.13.png", "scan.webp",
+    "ingredients.HEIC.jpg", "image.gif", "PXL_20240501_102213123.jpg", "label.final.v2.PNG",
+]
+
+
+INGREDIENT_POOL = [
+    "rice", "water", "sugar", "salt", "sunflower oil", "cane sugar", "corn starch", "potato starch",
+    "rice flour", "almonds", "cocoa butter", "milk", "eggs", "citric acid", "xanthan gum", "vinegar",
+    "tapioca flour", "sea salt", "honey", "baking soda", "vanilla extract", "buckwheat flour",
+]
+INGREDIENT_RISKS = [
+    "enriched wheat flour (wheat flour, niacin, iron)", "barley malt extract", "natural flavors",
+    "modified food starch", "soy sauce (water, wheat, soybeans, salt)", "caramel color", "oats",
+    "gluten-free oats", "maltodextrin (corn)", "brewer's yeast", "spelt flour", "yeast extract",
+]
+INGREDIENT_NOTES = [
+    "", "", "", " Certified Gluten-Free.", " May contain milk.",
+    " Processed in a facility that also processes wheat.", " Contains: Wheat, Soy.",
+]
+
+
+def generated_ingredient_lists(count, seed=13):
+    """Ingredient lists as typed or read off labels: 4-15 items, most with
+    zero or one risky ingredient, some with an allergen or certification note."""
+    rng = random.Random(seed)
+    lists = []
+    for _ in range(count):
+        items = rng.sample(INGREDIENT_POOL, rng.randint(4, 12))
+        for _ in range(rng.choice([0, 0, 1, 1, 2, 3])):
+            items.insert(rng.randrange(len(items) + 1), rng.choice(INGREDIENT_RISKS))
+        lists.append("Ingredients: " + ", ".join(items) + "." + rng.choice(INGREDIENT_NOTES))
+    return lists
+
+
+def generated_restaurants(count, seed=7):
+    """(name, location) pairs as users type them: mixed case, stray spaces,
+    punctuation, ampersands and accents."""
+    rng = random.Random(seed)
+    rows = []
+    for _ in range(count):
+        name = rng.choice(NAME_PREFIXES) + rng.choice(NAME_CORES) + rng.choice(NAME_SUFFIXES)
+        roll = rng.random()
+        if roll < 0.15:
+            name = name.lower()
+        elif roll < 0.2:
+            name = name.upper()
+        elif roll < 0.3:
+            name = f"  {name}  "
+        rows.append((name, rng.choice(LOCATIONS)))
+    return rows
+
+
+def database_restaurants(database_url):
+    """(search_query, location, name) rows from a real restaurants table."""
+    import psycopg2
+    conn = psycopg2.connect(database_url)
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT search_query, location, name FROM restaurants")
+            return cur.fetchall()
+    finally:
+        conn.close()
+
+
+def recorded_responses():
+    responses = []
+    for filename in sorted(os.listdir(CORPUS_DIR)):
+        if filename.endswith(".txt") and not filename.endswith("-expect-fail.txt"):
+            with open(os.path.join(CORPUS_DIR, filename), encoding="utf-8") as f:
+                responses.append((f.read(), filename.split("-", 1)[0]))
+    return responses
+
+
+def ip_traffic(count, seed=11):
+    """Client IPs for `count` requests: Zipf-like, so a few IPs are heavy
+    and most appear once or twice."""
+    rng = random.Random(seed)
+    ips = [f"{rng.randint(1, 223)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}"
+           for _ in range(count // 2)]
+    weights = [1 / (rank + 1) for rank in range(len(ips))]
+    return rng.choices(ips, weights, k=count)
+
+
+# ---------------------------------------------------------------------------
+# Benchmarks
+# ---------------------------------------------------------------------------
+
+def build_benchmarks(args):
+    """name -> (function of one input, list of inputs)."""
+    if args.database_url:
+        rows = database_restaurants(args.database_url)
+        if not rows:
+            raise SystemExit("No restaurants in that database")
+        names = [(display_name_from_search_query(q, loc, n), loc) for q, loc, n in rows]
+        saved_rows = rows
+    else:
+        names = generated_restaurants(args.names)
+        saved_rows = [(f"{name} {location}".strip(), normalize_location(location), normalize_name(name))
+                      for name, location in names]
+
+    def hourly(ip):
+        if celia_app.check_hourly_rate_limit(ip):
+            celia_app.record_hourly_rate_use(ip)
+
+    return {
+        "normalize_name": (normalize_name, [name for name, _ in names]),
+        "normalize_location": (normalize_location, [location for _, location in names]),
+        "display_name": (lambda row: display_name_from_search_query(*row), saved_rows),
+        "parse_claude_json": (lambda item: parse_claude_json(item[0], schema=item[1]), recorded_responses()),
+        "get_media_type": (celia_app.get_media_type, UPLOAD_FILENAMES),
+        "check_hourly_rate_limit": (hourly, ip_traffic(args.ips)),
+        "ingredient_prescreen": (ingredients.prescreen, generated_ingredient_lists(args.ingredient_lists)),
+    }
+
+
+def ops_per_second(fn, inputs, seconds, repeat):
+    """Calls per second over passes through `inputs`: the best of `repeat`
+    rounds of about seconds / repeat each, so a round that lost the CPU to
+    something else doesn't count (as timeit does)."""
+    best = 0
+    for _ in range(repeat):
+        calls = 0
+        start = time.perf_counter()
+        deadline = start + seconds / repeat
+        while True:
+            for item in inputs:
+                fn(item)
+            calls += len(inputs)
+            now = time.perf_counter()
+            if now >= deadline:
+                break
+        best = max(best, calls / (now - start))
+    return best
+
+
+def alloc_per_call(fn, inputs):
+    """Mean tracemalloc peak (bytes) above the starting level, per call."""
+    sample = inputs[:ALLOC_SAMPLE]
+    tracemalloc.start()
+    try:
+        total = 0
+        for item in sample:
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            fn(item)
+            total += tracemalloc.get_traced_memory()[1] - before
+    finally:
+        tracemalloc.stop()
+    return total / len(sample)
+
+
+def run(benchmarks, seconds, repeat, only=None):
+    results = {}
+    for name, (fn, inputs) in benchmarks.items():
+        if only and name not in only:
+            continue
+        fn(inputs[0])  # warm up caches / lazy imports
+        results[name] = {
+            "ops_per_sec": round(ops_per_second(fn, inputs, seconds, repeat)),
+            "alloc_bytes_per_call": round(alloc_per_call(fn, inputs), 1),
+            "inputs": len(inputs),
+        }
+    return results
+
+
+# ---------------------------------------------------------------------------
+# History
+# ---------------------------------------------------------------------------
+
+def load_history(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def previous_run(history, python_version):
+    for entry in reversed(history):
+        if entry.get("python") == python_version:
+            return entry
+    return None
+
+
+def compare(results, previous, threshold):
+    regressions = []
+    for name, current in results.items():
+        before = previous["results"].get(name)
+        if not before:
+            continue
+        limit = THRESHOLDS.get(name, threshold)
+        if current["ops_per_sec"] < before["ops_per_sec"] * (1 - limit):
+            regressions.append(f"{name}: {current['ops_per_sec']:,} ops/s, was {before['ops_per_sec']:,}")
+        # Allocation sizes are exact; allow a few bytes for interpreter noise
+        if current["alloc_bytes_per_call"] > before["alloc_bytes_per_call"] * (1 + limit) + 16:
+            regressions.append(f"{name}: {current['alloc_bytes_per_call']:.0f} B/call, "
+                               f"was {before['alloc_bytes_per_call']:.0f}")
+    return regressions
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--seconds", type=float, default=1.0, help="timing per benchmark")
+    parser.add_argument("--repeat", type=int, default=5, help="timed rounds per benchmark (best counts)")
+    parser.add_argument("--names", type=int, default=5000, help="generated restaurant names")
+    parser.add_argument("--ips", type=int, default=20000, help="requests of synthetic IP traffic")
+    parser.add_argument("--ingredient-lists", type=int, default=2000, help="generated ingredient lists")
+    parser.add_argument("--database-url", help="take restaurant names from this database instead")
+    parser.add_argument("--only", nargs="*", help="run only these benchmarks")
+    parser.add_argument("--history", default=DEFAULT_HISTORY)
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed fractional regression")
+    parser.add_argument("--record", action="store_true", help="append this run to the history")
+    args = parser.parse_args()
+
+    results = run(build_benchmarks(args), args.seconds, args.repeat, args.only)
+    python_version = platform.python_version()
+    previous = previous_run(load_history(args.history), python_version)
+
+    print(f"{'benchmark':<26} {'ops/sec':>12} {'B/call':>9} {'inputs':>7}   vs previous")
+    for name, r in results.items():
+        change = ""
+        if previous and name in previous["results"]:
+            change = f"{r['ops_per_sec'] / previous['results'][name]['ops_per_sec'] - 1:+.1%}"
+        print(f"{name:<26} {r['ops_per_sec']:>12,} {r['alloc_bytes_per_call']:>9.0f} {r['inputs']:>7}   {change}")
+
+    if args.record:
+        entry = {
+            "ts": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "python": python_version,
+            "results": results,
+        }
+        with open(args.history, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+        print(f"\nRecorded in {args.history}")
+
+    if previous is None:
+        print(f"\nNo previous run for Python {python_version} to compare with")
+        return
+    regressions = compare(results, previous, args.threshold)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) since {previous.get('commit') or previous['ts']}:")
+        for message in regressions:
+            print(f"  {message}")
+        sys.exit(1)
+    print(f"\nNo regressions since {previous.get('commit') or previous['ts']}")
+
+
+if __name__ == "__main__":
+    main()
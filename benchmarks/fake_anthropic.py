@@ -0,0 +1,175 @@
+"""Stand-in for the Anthropic Messages API, for load tests and local runs.
+
+Answers POST /v1/messages with a recorded response from
+benchmarks/json_corpus/ that matches the kind of prompt (label scan, scout
+triage / full analysis, alternatives, discover), after a delay drawn from a
+log-normal distribution around that kind's typical production latency. Point
+the app at it with ANTHROPIC_BASE_URL=http://127.0.0.1:<port>.
+
+Run:  python benchmarks/fake_anthropic.py [--port 8911] [--latency-scale 1.0]
+"""
+
+import os
+import json
+import math
+import time
+import random
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "json_corpus")
+
+# Median latency (seconds) and typical usage per kind of call, roughly what
+# production sees with web search enabled.
+CALL_PROFILES = {
+    "label": {"latency": 6.0, "input_tokens": 1600, "output_tokens": 450, "web_searches": 0},
+    "scout_triage": {"latency": 9.0, "input_tokens": 9000, "output_tokens": 1500, "web_searches": 2},
+    "scout": {"latency": 35.0, "input_tokens": 30000, "output_tokens": 2500, "web_searches": 5},
+    "alternatives": {"latency": 20.0, "input_tokens": 15000, "output_tokens": 900, "web_searches": 3},
+    "discover": {"latency": 12.0, "input_tokens": 12000, "output_tokens": 800, "web_searches": 3},
+}
+LATENCY_SIGMA = 0.35  # log-normal spread around the median
+
+# Corpus file prefix answering each kind of call
+CORPUS_SCHEMA = {
+    "label": "label",
+    "scout_triage": "scout",
+    "scout": "scout",
+    "alternatives": "alternatives",
+    "discover": "discover",
+}
+
+
+def load_responses():
+    """Recorded response texts by corpus schema, skipping unusable cases."""
+    responses = {}
+    for filename in sorted(os.listdir(CORPUS_DIR)):
+        if not filename.endswith(".txt") or filename.endswith("-expect-fail.txt"):
+            continue
+        schema = filename.split("-", 1)[0]
+        with open(os.path.join(CORPUS_DIR, filename), encoding="utf-8") as f:
+            responses.setdefault(schema, []).append(f.read())
+    return responses
+
+
+def prompt_text(body):
+    """All text the request sends, for telling kinds of calls apart."""
+    parts = []
+    for message in body.get("messages", []):
+        content = message.get("content")
+        if isinstance(content, str):
+            parts.append(content)
+        else:
+            parts.extend(block.get("text", "") for block in content or [] if block.get("type") == "text")
+    return "\n".join(parts)
+
+
+def call_kind(body):
+    text = prompt_text(body)
+    if "ingredient label" in text:
+        return "label"
+    if "QUICK RESEARCH PHASE" in text:
+        return "scout_triage"
+    if "Find better alternatives" in text:
+        return "alternatives"
+    if "Find gluten-free-friendly" in text:
+        return "discover"
+    return "scout"
+
+
+class FakeAnthropic:
+    """Shared state for the request handler: responses, latency and counters."""
+
+    def __init__(self, latency_scale=1.0, seed=None):
+        self.responses = load_responses()
+        self.latency_scale = latency_scale
+        self.random = random.Random(seed)
+        self.calls = {}
+        self._lock = threading.Lock()
+
+    def answer(self, body):
+        kind = call_kind(body)
+        profile = CALL_PROFILES[kind]
+        with self._lock:
+            self.calls[kind] = self.calls.get(kind, 0) + 1
+            text = self.random.choice(self.responses[CORPUS_SCHEMA[kind]])
+            delay = profile["latency"] * math.exp(self.random.gauss(0, LATENCY_SIGMA))
+        time.sleep(delay * self.latency_scale)
+
+        content = [{"type": "server_tool_use", "id": f"srvtoolu_{i}", "name": "web_search",
+                    "input": {"query": "search"}} for i in range(profile["web_searches"])]
+        content.append({"type": "text", "text": text})
+        return {
+            "id": "msg_fake",
+            "type": "message",
+            "role": "assistant",
+            "model": body.get("model", ""),
+            "content": content,
+            "stop_reason": "end_turn",
+            "stop_sequence": None,
+            "usage": {
+                "input_tokens": profile["input_tokens"],
+                "output_tokens": profile["output_tokens"],
+                "server_tool_use": {"web_search_requests": profile["web_searches"]},
+            },
+        }
+
+
+def make_handler(fake):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            try:
+                body = json.loads(self.rfile.read(length) or b"{}")
+            except ValueError:
+                return self._send(400, {"type": "error", "error": {"type": "invalid_request_error",
+                                                                   "message": "Body is not JSON"}})
+            if self.path.split("?")[0] != "/v1/messages":
+                return self._send(404, {"type": "error", "error": {"type": "not_found_error",
+                                                                   "message": self.path}})
+            self._send(200, fake.answer(body))
+
+        def _send(self, status, payload):
+            data = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def start_server(port=0, latency_scale=1.0, seed=None):
+    """Serve in a background thread. Returns (server, fake); the bound port is
+    server.server_address[1]. Stop with server.shutdown()."""
+    fake = FakeAnthropic(latency_scale, seed)
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(fake))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-anthropic", daemon=True).start()
+    return server, fake
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--port", type=int, default=8911)
+    parser.add_argument("--latency-scale", type=float, default=1.0,
+                        help="multiply every simulated latency (0 = answer immediately)")
+    args = parser.parse_args()
+
+    server, _ = start_server(args.port, args.latency_scale)
+    print(f"Fake Anthropic API on http://127.0.0.1:{server.server_address[1]}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
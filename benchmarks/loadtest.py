@@ -0,0 +1,505 @@
+"""End-to-end load test: the app under gunicorn, Claude replaced by the fake
+API in fake_anthropic.py and Postgres by a throwaway database.
+
+Virtual users run a weighted mix of scripted scenarios (cache-hit and
+cache-miss scout searches, discover, label scan, save/unsave, admin
+dashboard) for --duration seconds. The report gives requests/sec and
+p50 / p95 / p99 latency per route. Results are compared with a stored
+baseline and the script exits 1 if any route's p50, p95, throughput or
+error rate regressed beyond --tolerance (p99 is reported only: with a few
+hundred requests per route it hinges on one or two slow calls);
+--save-baseline records the current run instead. Baselines are specific
+to the machine and options they were recorded with; record one where the
+comparison will run.
+
+The database is either a scratch database created on the server at
+--database-url (dropped afterwards) or, without --database-url, a
+temporary cluster started with initdb / pg_ctl (found on PATH or in
+$PG_BIN). Each run gets an empty schema, created by the app at startup.
+
+Run:  python benchmarks/loadtest.py [--users 20] [--duration 60]
+          [--latency-scale 0.1] [--database-url URL] [--save-baseline]
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import uuid
+import zlib
+import random
+import shutil
+import signal
+import socket
+import struct
+import argparse
+import tempfile
+import threading
+import subprocess
+import urllib.error
+import urllib.parse
+import urllib.request
+from http.cookiejar import CookieJar
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+import psycopg2
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from fake_anthropic import start_server
+
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "loadtest_baseline.json")
+ADMIN_PASSWORD = "loadtest"
+SEED_RESTAURANTS = 12
+REQUEST_TIMEOUT = 300
+
+# Settings a baseline is only comparable under
+COMPARABLE_SETTINGS = ("users", "duration", "latency_scale", "workers", "worker_class", "seed")
+
+# Allowed slack on top of --tolerance, so sub-10ms routes don't fail on noise
+LATENCY_SLACK_MS = 15
+ERROR_RATE_SLACK = 0.01
+MIN_COMPARE_REQUESTS = 30  # routes with fewer baseline requests aren't compared
+
+CUISINES = ["Thai", "Italian", "Mexican", "Japanese"]
+CITIES = ["Philadelphia, PA", "Boston, MA", "Austin, TX"]
+
+
+# ---------------------------------------------------------------------------
+# Throwaway Postgres
+# ---------------------------------------------------------------------------
+
+def _with_dbname(database_url, dbname):
+    parts = urllib.parse.urlsplit(database_url)
+    return urllib.parse.urlunsplit(parts._replace(path="/" + dbname))
+
+
+@contextmanager
+def scratch_database(database_url):
+    """Create an empty database on an existing server; drop it afterwards."""
+    dbname = f"celia_loadtest_{uuid.uuid4().hex[:8]}"
+    admin = psycopg2.connect(database_url)
+    admin.autocommit = True
+    try:
+        with admin.cursor() as cur:
+            cur.execute(f"CREATE DATABASE {dbname}")
+        yield _with_dbname(database_url, dbname)
+    finally:
+        with admin.cursor() as cur:
+            cur.execute(f"DROP DATABASE IF EXISTS {dbname} WITH (FORCE)")
+        admin.close()
+
+
+def _pg_binary(name):
+    pg_bin = os.environ.get("PG_BIN")
+    path = os.path.join(pg_bin, name) if pg_bin else shutil.which(name)
+    if not path or not os.path.exists(path):
+        raise SystemExit(f"{name} not found: pass --database-url or set PG_BIN")
+    return path
+
+
+@contextmanager
+def temporary_cluster():
+    """initdb a cluster in a temp directory, listening only on a Unix socket
+    there; stopped and deleted afterwards."""
+    data_dir = tempfile.mkdtemp(prefix="celia-pg-")
+    subprocess.run([_pg_binary("initdb"), "-D", data_dir, "-A", "trust", "-U", "postgres"],
+                   check=True, stdout=subprocess.DEVNULL)
+    subprocess.run([_pg_binary("pg_ctl"), "-D", data_dir, "-w", "-l", os.path.join(data_dir, "server.log"),
+                    "-o", f"-k {data_dir} -c listen_addresses='' -c max_connections=200", "start"],
+                   check=True, stdout=subprocess.DEVNULL)
+    try:
+        yield f"postgresql://postgres@/postgres?host={data_dir}"
+    finally:
+        subprocess.run([_pg_binary("pg_ctl"), "-D", data_dir, "-m", "immediate", "stop"],
+                       stdout=subprocess.DEVNULL)
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+# ---------------------------------------------------------------------------
+# App under test
+# ---------------------------------------------------------------------------
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@contextmanager
+def app_server(database_url, anthropic_url, workers, worker_class, log_path, scan_dir):
+    """Run the app with gunicorn.conf.py, writing label scan files under
+    scan_dir; yields its base URL."""
+    port = _free_port()
+    env = dict(
+        os.environ,
+        DATABASE_URL=database_url,
+        ANTHROPIC_BASE_URL=anthropic_url,
+        ANTHROPIC_API_KEY="loadtest",
+        ADMIN_PASSWORD=ADMIN_PASSWORD,
+        SECRET_KEY="loadtest",
+        LOG_LEVEL=os.environ.get("LOG_LEVEL", "WARNING"),
+        WEB_CONCURRENCY=str(workers),
+        GUNICORN_WORKER_CLASS=worker_class,
+        UPLOAD_FOLDER=os.path.join(scan_dir, "uploads"),
+        SCAN_HISTORY_FILE=os.path.join(scan_dir, "scan_history.json"),
+    )
+    with open(log_path, "wb") as log:
+        proc = subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "-b", f"127.0.0.1:{port}", "app:app"],
+            cwd=REPO_DIR, env=env, stdout=log, stderr=subprocess.STDOUT,
+        )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.monotonic() + 60
+        while True:
+            if proc.poll() is not None:
+                raise SystemExit(f"App exited during startup, see {log_path}")
+            try:
+                urllib.request.urlopen(base_url + "/discover", timeout=2).close()
+                break
+            except (urllib.error.URLError, ConnectionError, socket.timeout):
+                if time.monotonic() > deadline:
+                    raise SystemExit(f"App did not start within 60s, see {log_path}")
+                time.sleep(0.25)
+        yield base_url
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        try:
+            proc.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+@contextmanager
+def scan_files_dir():
+    """A temp directory for the uploads and scan_history.json that label
+    scans write, so the run leaves the checkout untouched; deleted afterwards."""
+    path = tempfile.mkdtemp(prefix="celia-loadtest-scans-")
+    try:
+        yield path
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+# ---------------------------------------------------------------------------
+# Virtual users
+# ---------------------------------------------------------------------------
+
+class Recorder:
+    """Latencies and failures per route. Only records while `recording`."""
+
+    def __init__(self):
+        self.latencies = {}   # route -> [seconds]
+        self.errors = {}      # route -> count
+        self.recording = False
+        self._lock = threading.Lock()
+
+    def add(self, route, seconds, ok):
+        if not self.recording:
+            return
+        with self._lock:
+            self.latencies.setdefault(route, []).append(seconds)
+            if not ok:
+                self.errors[route] = self.errors.get(route, 0) + 1
+
+
+class Client:
+    """One virtual user: its own cookie jar (session) and a recorder."""
+
+    def __init__(self, base_url, recorder):
+        self.base_url = base_url
+        self.recorder = recorder
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()))
+        self.signed_in = False
+        self.admin = False
+
+    def request(self, route, method, path, json_body=None, form=None, files=None, headers=None, expect=(200,)):
+        headers = dict(headers or {})
+        data = None
+        if json_body is not None:
+            data = json.dumps(json_body).encode()
+            headers["Content-Type"] = "application/json"
+        elif files is not None:
+            data, headers["Content-Type"] = encode_multipart(files)
+        elif form is not None:
+            data = urllib.parse.urlencode(form).encode()
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        req = urllib.request.Request(self.base_url + path, data=data, headers=headers, method=method)
+
+        start = time.perf_counter()
+        status, body = None, b""
+        try:
+            with self.opener.open(req, timeout=REQUEST_TIMEOUT) as response:
+                status, body = response.status, response.read()
+        except urllib.error.HTTPError as e:
+            status, body = e.code, e.read()
+        except (urllib.error.URLError, ConnectionError, socket.timeout):
+            pass
+        self.recorder.add(route, time.perf_counter() - start, status in expect)
+        return status, body
+
+
+def encode_multipart(files):
+    """files: {field: (filename, bytes, content_type)} -> (body, content type)."""
+    boundary = uuid.uuid4().hex
+    chunks = []
+    for field, (filename, content, content_type) in files.items():
+        chunks.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+            f"Content-Type: {content_type}\r\n\r\n".encode() + content + b"\r\n"
+        )
+    chunks.append(f"--{boundary}--\r\n".encode())
+    return b"".join(chunks), f"multipart/form-data; boundary={boundary}"
+
+
+def tiny_png():
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", 1, 1, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(b"\x00\xff\xff\xff")) + chunk(b"IEND", b""))
+
+
+PNG = tiny_png()
+
+
+class Scenarios:
+    """Scripted user journeys. Cache misses and first-time searches send a
+    fresh X-Forwarded-For so the per-IP free search limits don't kick in."""
+
+    def __init__(self, seeded, rng):
+        self.seeded = seeded      # [(name, location, restaurant_id)] cached before the run
+        self.rng = rng
+        self._counter = 0
+        self._lock = threading.Lock()
+
+    def fresh_ip(self):
+        with self._lock:
+            self._counter += 1
+            n = self._counter
+        return f"10.{(n >> 16) & 255}.{(n >> 8) & 255}.{n & 255}"
+
+    def scout_hit(self, client):
+        name, location, _ = self.rng.choice(self.seeded)
+        client.request("POST /api/restaurant-scout (hit)", "POST", "/api/restaurant-scout",
+                       json_body={"restaurant_name": name, "location": location})
+
+    def scout_miss(self, client):
+        # Anonymous: signed-in users would run out of their free searches
+        anonymous = Client(client.base_url, client.recorder)
+        name = f"Loadtest Kitchen {uuid.uuid4().hex[:10]}"
+        anonymous.request("POST /api/restaurant-scout (miss)", "POST", "/api/restaurant-scout",
+                       json_body={"restaurant_name": name, "location": self.rng.choice(CITIES),
+                                  "skip_suggestion": True},  # near-identical names: measure real misses
+                       headers={"X-Forwarded-For": self.fresh_ip()})
+
+    def discover(self, client):
+        client.request("POST /api/discover", "POST", "/api/discover",
+                       json_body={"cuisine": self.rng.choice(CUISINES), "location": self.rng.choice(CITIES)})
+
+    def label_scan(self, client):
+        client.request("POST /api/scan", "POST", "/api/scan",
+                       files={"image": ("label.png", PNG, "image/png")})
+
+    def save_unsave(self, client):
+        if not client.signed_in:
+            client.request("POST /signin", "POST", "/signin",
+                           form={"email": f"loadtest-{uuid.uuid4().hex[:10]}@example.com"})
+            client.signed_in = True
+        _, _, restaurant_id = self.rng.choice(self.seeded)
+        client.request("POST /api/save-restaurant", "POST", "/api/save-restaurant",
+                       json_body={"restaurant_id": restaurant_id})
+        client.request("GET /my-safe-spots", "GET", "/my-safe-spots")
+        client.request("POST /api/unsave-restaurant", "POST", "/api/unsave-restaurant",
+                       json_body={"restaurant_id": restaurant_id})
+
+    def admin_dashboard(self, client):
+        if not client.admin:
+            client.request("POST /admin", "POST", "/admin", form={"password": ADMIN_PASSWORD})
+            client.admin = True
+        client.request("GET /admin/dashboard", "GET", "/admin/dashboard")
+
+
+# Relative frequency of each scenario in the mix
+SCENARIO_WEIGHTS = {
+    "scout_hit": 40,
+    "scout_miss": 8,
+    "discover": 15,
+    "label_scan": 10,
+    "save_unsave": 20,
+    "admin_dashboard": 7,
+}
+
+
+def seed_restaurants(base_url, scenarios, count):
+    """Cache `count` restaurants through real scout searches, concurrently."""
+    def seed(i):
+        client = Client(base_url, Recorder())
+        name, location = f"Seeded Bistro {i}", CITIES[i % len(CITIES)]
+        status, body = client.request("seed", "POST", "/api/restaurant-scout",
+                                      json_body={"restaurant_name": name, "location": location,
+                                                 "skip_suggestion": True},
+                                      headers={"X-Forwarded-For": scenarios.fresh_ip()})
+        if status != 200:
+            raise SystemExit(f"Seeding {name!r} failed with HTTP {status}: {body[:300]!r}")
+        return name, location, json.loads(body)["restaurant_id"]
+
+    with ThreadPoolExecutor(max_workers=count) as pool:
+        return list(pool.map(seed, range(count)))
+
+
+def run_users(base_url, scenarios, recorder, users, warmup, duration, seed):
+    names = list(SCENARIO_WEIGHTS)
+    weights = [SCENARIO_WEIGHTS[n] for n in names]
+    stop_at = time.monotonic() + warmup + duration
+
+    def user(number):
+        rng = random.Random(seed * 1000 + number)
+        client = Client(base_url, recorder)
+        while time.monotonic() < stop_at:
+            getattr(scenarios, rng.choices(names, weights)[0])(client)
+
+    with ThreadPoolExecutor(max_workers=users) as pool:
+        futures = [pool.submit(user, n) for n in range(users)]
+        time.sleep(warmup)
+        recorder.recording = True
+        started = time.monotonic()
+        time.sleep(max(0.0, stop_at - time.monotonic()))
+        recorder.recording = False
+        elapsed = time.monotonic() - started
+        for future in futures:
+            future.result()
+    return elapsed
+
+
+# ---------------------------------------------------------------------------
+# Report and baseline
+# ---------------------------------------------------------------------------
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(recorder, elapsed):
+    routes = {}
+    for route, latencies in sorted(recorder.latencies.items()):
+        latencies = sorted(latencies)
+        routes[route] = {
+            "requests": len(latencies),
+            "rps": round(len(latencies) / elapsed, 2),
+            "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+            "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+            "error_rate": round(recorder.errors.get(route, 0) / len(latencies), 4),
+        }
+    return routes
+
+
+def print_report(routes, elapsed):
+    total = sum(r["requests"] for r in routes.values())
+    print(f"\n{total} requests in {elapsed:.1f}s ({total / elapsed:.1f} req/s)\n")
+    print(f"{'route':<38} {'reqs':>6} {'req/s':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for route, r in routes.items():
+        print(f"{route:<38} {r['requests']:>6} {r['rps']:>7.2f} {r['p50_ms']:>9.1f} {r['p95_ms']:>9.1f} "
+              f"{r['p99_ms']:>9.1f} {r['error_rate']:>7.1%}")
+
+
+def compare(routes, baseline, tolerance):
+    """Regression messages for routes slower, less busy or more error-prone
+    than the baseline by more than `tolerance` (a fraction)."""
+    regressions = []
+    for route, base in baseline["routes"].items():
+        if base["requests"] < MIN_COMPARE_REQUESTS:
+            continue
+        current = routes.get(route)
+        if current is None:
+            regressions.append(f"{route}: no requests recorded (baseline had {base['requests']})")
+            continue
+        for key in ("p50_ms", "p95_ms"):
+            limit = base[key] * (1 + tolerance) + LATENCY_SLACK_MS
+            if current[key] > limit:
+                regressions.append(f"{route}: {key} {current[key]:.1f} > {limit:.1f} (baseline {base[key]:.1f})")
+        if current["rps"] < base["rps"] * (1 - tolerance):
+            regressions.append(f"{route}: rps {current['rps']:.2f} < {base['rps'] * (1 - tolerance):.2f} "
+                               f"(baseline {base['rps']:.2f})")
+        if current["error_rate"] > base["error_rate"] + ERROR_RATE_SLACK:
+            regressions.append(f"{route}: error rate {current['error_rate']:.1%} "
+                               f"(baseline {base['error_rate']:.1%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--users", type=int, default=20, help="concurrent virtual users")
+    parser.add_argument("--duration", type=int, default=60, help="measured seconds")
+    parser.add_argument("--warmup", type=int, default=5, help="unmeasured seconds before measuring")
+    parser.add_argument("--latency-scale", type=float, default=0.1,
+                        help="scale the fake Claude latencies (1.0 = production-like)")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn worker processes")
+    parser.add_argument("--worker-class", default="gevent", choices=("gevent", "sync"))
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--database-url", help="server to create the scratch database on "
+                                               "(default: a temporary initdb cluster)")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--tolerance", type=float, default=0.5,
+                        help="allowed fractional regression against the baseline")
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the baseline")
+    args = parser.parse_args()
+
+    settings = {key: getattr(args, key) for key in COMPARABLE_SETTINGS}
+    settings["cpus"] = os.cpu_count()
+    log_path = os.path.join(tempfile.gettempdir(), "celia-loadtest-app.log")
+    database = scratch_database(args.database_url) if args.database_url else temporary_cluster()
+    fake_server, fake = start_server(latency_scale=args.latency_scale, seed=args.seed)
+    anthropic_url = f"http://127.0.0.1:{fake_server.server_address[1]}"
+
+    with database as database_url, scan_files_dir() as scan_dir, \
+            app_server(database_url, anthropic_url, args.workers, args.worker_class, log_path, scan_dir) as base_url:
+        scenarios = Scenarios([], random.Random(args.seed))
+        print(f"App at {base_url} (log: {log_path}); seeding {SEED_RESTAURANTS} restaurants...")
+        scenarios.seeded = seed_restaurants(base_url, scenarios, SEED_RESTAURANTS)
+        print(f"Running {args.users} users for {args.duration}s (+{args.warmup}s warmup)...")
+        recorder = Recorder()
+        elapsed = run_users(base_url, scenarios, recorder, args.users, args.warmup, args.duration, args.seed)
+    fake_server.shutdown()
+
+    routes = summarize(recorder, elapsed)
+    print_report(routes, elapsed)
+    print(f"\nFake Claude calls: {json.dumps(fake.calls, sort_keys=True)}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump({"settings": settings, "routes": routes}, f, indent=2)
+            f.write("\n")
+        print(f"Saved baseline to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print("No baseline to compare against (run with --save-baseline)")
+        return
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline["settings"] != settings:
+        print(f"Baseline was recorded with {baseline['settings']}, this run used {settings}; "
+              "rerun with matching options or --save-baseline")
+        sys.exit(2)
+
+    regressions = compare(routes, baseline, args.tolerance)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) against {args.baseline}:")
+        for message in regressions:
+            print(f"  {message}")
+        sys.exit(1)
+    print(f"\nNo regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""Pull the JSON answer out of a Claude response.
+
+Responses are asked to be "ONLY valid JSON", but web-search answers often wrap
+it in prose or code fences, and the prose itself can contain braces
+("{cuisine}", "see {1}"). Instead of slicing from the first "{" to the last
+"}", iter_json_objects() tries the C decoder at each "{" in turn and yields
+every top-level object that parses, so stray braces in prose are skipped.
+
+parse_claude_json() picks the object that matches the expected response
+schema (see RESPONSE_SCHEMAS) and raises json.JSONDecodeError, as before,
+when there is none.
+
+Schemas are tiny: a dict means an object with those required keys, a
+one-element list means an array of that item schema, a set lists allowed
+values, and a type or tuple of types is checked with isinstance.
+"""
+
+import json
+
+from metrics import inc
+
+NULLABLE_NUMBER = (int, float, type(None))
+
+RESPONSE_SCHEMAS = {
+    "label": {
+        "verdict": {"SAFE", "UNSAFE", "INVESTIGATE"},
+        "summary": str,
+    },
+    "scout": {
+        # null when Claude couldn't research the restaurant (see looks_not_found)
+        "safety_score": NULLABLE_NUMBER,
+    },
+    "alternatives": {
+        "alternatives": [{"name": str}],
+    },
+    "discover": {
+        "restaurants": [{"name": str}],
+    },
+}
+
+_decoder = json.JSONDecoder()
+
+
+class SchemaMismatch(json.JSONDecodeError):
+    """The response contained JSON, but none of it matched the expected schema."""
+
+
+def iter_json_objects(text):
+    """Yield each top-level JSON object in a complete text, in order. A "{"
+    that doesn't start a valid object is skipped."""
+    pos = text.find("{")
+    while pos != -1:
+        try:
+            value, end = _decoder.raw_decode(text, pos)
+        except ValueError:
+            pos = text.find("{", pos + 1)
+            continue
+        yield value
+        pos = text.find("{", end)
+
+
+def validate(value, schema, path="$"):
+    """Return None if `value` matches `schema`, otherwise a short description
+    of the first mismatch (e.g. "$.restaurants[2].name is missing")."""
+    if isinstance(schema, dict):
+        if not isinstance(value, dict):
+            return f"{path} should be an object"
+        for key, item_schema in schema.items():
+            if key not in value:
+                return f"{path}.{key} is missing"
+            error = validate(value[key], item_schema, f"{path}.{key}")
+            if error:
+                return error
+        return None
+    if isinstance(schema, list):
+        if not isinstance(value, list):
+            return f"{path} should be an array"
+        for i, item in enumerate(value):
+            error = validate(item, schema[0], f"{path}[{i}]")
+            if error:
+                return error
+        return None
+    if isinstance(schema, (set, frozenset)):
+        if value not in schema:
+            return f"{path} should be one of {sorted(schema)}"
+        return None
+    if not isinstance(value, schema):
+        return f"{path} has the wrong type ({type(value).__name__})"
+    return None
+
+
+def extract_json(text, schema=None):
+    """Return the JSON object in `text` that matches `schema` (the first one
+    that does), or with no schema the object with the most keys. Raises
+    json.JSONDecodeError if there is no JSON object, SchemaMismatch if none
+    matches."""
+    if schema is None:
+        objects = list(iter_json_objects(text))
+        if not objects:
+            raise json.JSONDecodeError("No JSON object found in response", text, 0)
+        return max(objects, key=len)
+
+    first_error = None
+    for value in iter_json_objects(text):
+        error = validate(value, schema)
+        if error is None:
+            return value
+        first_error = first_error or error
+    if first_error is None:
+        raise json.JSONDecodeError("No JSON object found in response", text, 0)
+    raise SchemaMismatch(f"Response JSON does not match schema: {first_error}", text, 0)
+
+
+def parse_claude_json(response_text, schema=None):
+    """Parse the JSON answer out of a Claude response. `schema` is a
+    RESPONSE_SCHEMAS name ("label", "scout", "alternatives", "discover") or a
+    schema object. Raises json.JSONDecodeError when nothing usable is found."""
+    name = schema if isinstance(schema, str) else "custom" if schema else "none"
+    if isinstance(schema, str):
+        schema = RESPONSE_SCHEMAS[schema]
+    try:
+        value = extract_json(response_text, schema)
+    except SchemaMismatch:
+        inc("celia_json_parse_total", schema=name, result="schema_mismatch")
+        raise
+    except json.JSONDecodeError:
+        inc("celia_json_parse_total", schema=name, result="no_json")
+        raise
+    inc("celia_json_parse_total", schema=name, result="ok")
+    return value
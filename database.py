@@ -1,50 +1,170 @@
 import os
 import json
+import threading
 import psycopg2
 import psycopg2.errors
-from psycopg2.extras import RealDictCursor
+import psycopg2.extensions
+from psycopg2.extras import RealDictCursor, execute_values
 from datetime import datetime, timedelta, timezone
 
+import snapshot
+from logging_config import get_logger
+from metrics import span, timed, inc
+from models import ScoutResult, scout_response_body
 
-def get_connection():
-    """Get a database connection using DATABASE_URL from environment."""
+log = get_logger("DB")
+cache_log = get_logger("CACHE")
+user_log = get_logger("USER")
+
+
+# Open connections per worker process. Under gevent a worker serves hundreds
+# of requests at once; without a cap they would exhaust Postgres' max_connections.
+DB_MAX_CONNECTIONS = int(os.environ.get("DB_MAX_CONNECTIONS", "10"))
+DB_CONNECT_WAIT = 30  # seconds to wait for a free slot
+# Restaurant cache reads give up on a slow primary after this long and are
+# served from the local snapshot instead (see snapshot.py)
+CACHE_READ_TIMEOUT_MS = int(os.environ.get("CACHE_READ_TIMEOUT_MS", "2000"))
+
+_connection_slots = None
+_connection_slots_pid = None
+
+
+def _get_connection_slots():
+    """This process's slot semaphore, created lazily and again after a fork,
+    so a preloaded master never hands its state to the workers."""
+    global _connection_slots, _connection_slots_pid
+    if _connection_slots_pid != os.getpid():
+        _connection_slots = threading.BoundedSemaphore(DB_MAX_CONNECTIONS)
+        _connection_slots_pid = os.getpid()
+    return _connection_slots
+
+
+class ConnectionSlotTimeout(psycopg2.OperationalError):
+    """No connection slot freed up in time. The worker is busy, which says
+    nothing about whether Postgres is up."""
+
+
+class _LimitedConnection(psycopg2.extensions.connection):
+    """Connection that gives its slot back when closed (see get_connection)."""
+
+    _slots = None
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            self._release_slot()
+
+    def _release_slot(self):
+        slots, self._slots = self._slots, None
+        if slots is not None:
+            slots.release()
+
+    def __del__(self):
+        self._release_slot()
+
+
+def get_connection(wait=DB_CONNECT_WAIT, timeout_ms=None):
+    """Get a database connection using DATABASE_URL from environment. Waits
+    up to `wait` seconds for one of DB_MAX_CONNECTIONS slots; the slot is
+    freed on close(). With `timeout_ms`, connecting and each statement are
+    limited to about that long."""
     database_url = os.environ.get("DATABASE_URL")
     if not database_url:
         return None
     # Render provides postgres:// but psycopg2 expects postgresql://
     if database_url.startswith("postgres://"):
         database_url = database_url.replace("postgres://", "postgresql://", 1)
-    return psycopg2.connect(database_url, cursor_factory=RealDictCursor)
+    slots = _get_connection_slots()
+    with span("db.connect"):
+        if not slots.acquire(timeout=wait):
+            raise ConnectionSlotTimeout("Timed out waiting for a free database connection slot")
+        limits = {}
+        if timeout_ms:
+            limits = {"connect_timeout": max(2, -(-timeout_ms // 1000)),
+                      "options": f"-c statement_timeout={timeout_ms}"}
+        try:
+            conn = psycopg2.connect(database_url, connection_factory=_LimitedConnection,
+                                    cursor_factory=RealDictCursor, **limits)
+        except Exception:
+            slots.release()
+            raise
+    conn._slots = slots
+    return conn
+
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+SCHEMA_LOCK_ID = 0x43454C4941  # advisory lock key held while migrations run
+
+
+def list_migrations():
+    """(version, path) for every migrations/NNNN_name.sql file, in order."""
+    try:
+        filenames = sorted(f for f in os.listdir(MIGRATIONS_DIR) if f.endswith(".sql"))
+    except FileNotFoundError:
+        return []
+    return [(f[:-len(".sql")], os.path.join(MIGRATIONS_DIR, f)) for f in filenames]
+
+
+def _applied_migrations(cur):
+    cur.execute("SELECT to_regclass('schema_migrations') IS NOT NULL AS present")
+    if not cur.fetchone()["present"]:
+        return set()
+    cur.execute("SELECT version FROM schema_migrations")
+    return {row["version"] for row in cur.fetchall()}
 
 
-def init_tables():
-    """Create tables using schema.sql if they don't already exist. Returns True
-    if successful, False if DATABASE_URL is not configured or tables already
-    exist."""
+def apply_migrations():
+    """Apply migrations/*.sql files not yet recorded in schema_migrations, in
+    order, each in its own transaction. An up-to-date database costs one
+    query; otherwise an advisory lock makes concurrent callers (workers
+    booting together, a pre-deploy job) wait while the first one migrates.
+    Returns True if the schema is up to date, False if DATABASE_URL is not
+    configured or a migration failed."""
     conn = get_connection()
     if conn is None:
-        print("[DB] DATABASE_URL not set, skipping database initialization")
+        log.warning("DATABASE_URL not set, skipping migrations")
         return False
 
-    schema_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "schema.sql")
+    migrations = list_migrations()
     try:
-        with open(schema_path) as f:
-            schema_sql = f.read()
-    except FileNotFoundError:
-        print("[DB] schema.sql not found, skipping database initialization")
-        return False
+        with conn.cursor() as cur:
+            applied = _applied_migrations(cur)
+        conn.rollback()
+        if all(version in applied for version, _ in migrations):
+            log.debug("Schema up to date (%d migrations)", len(applied))
+            return True
 
-    try:
-        with conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_lock(%s)", (SCHEMA_LOCK_ID,))
+        conn.commit()
+        try:
+            with conn:
+                with conn.cursor() as cur:
+                    cur.execute("""
+                        CREATE TABLE IF NOT EXISTS schema_migrations (
+                            version VARCHAR(255) PRIMARY KEY,
+                            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                        )
+                    """)
+                    applied = _applied_migrations(cur)
+            for version, path in migrations:
+                if version in applied:
+                    continue
+                with open(path) as f:
+                    migration_sql = f.read()
+                with conn:
+                    with conn.cursor() as cur:
+                        cur.execute(migration_sql)
+                        cur.execute("INSERT INTO schema_migrations (version) VALUES (%s)", (version,))
+                log.info("Applied migration %s", version)
+        finally:
             with conn.cursor() as cur:
-                cur.execute(schema_sql)
-        print("[DB] Tables initialized successfully")
-        return True
-    except psycopg2.errors.DuplicateTable:
-        print("[DB] Tables already exist, skipping")
+                cur.execute("SELECT pg_advisory_unlock(%s)", (SCHEMA_LOCK_ID,))
+            conn.commit()
         return True
     except Exception as e:
-        print(f"[DB] Failed to initialize tables: {e}")
+        log.error("Migration failed: %s", e)
         return False
     finally:
         conn.close()
@@ -67,6 +187,7 @@ def normalize_location(location):
     return " ".join(location.lower().split())
 
 
+@timed("db.get_restaurant_count")
 def get_restaurant_count():
     """Return the total number of cached restaurants."""
     conn = get_connection()
@@ -82,25 +203,104 @@ def get_restaurant_count():
         conn.close()
 
 
+RESTAURANT_CACHE_TTL = timedelta(days=30)
+RESTAURANT_MAX_STALE = timedelta(days=180)
+
+
+# Cached result columns: the stored analysis with the listing columns merged
+# back in, as JSON text, plus the wrapper fields. Postgres does the merge and
+# serialization, so a cache hit never decodes the document in Python.
+SCOUT_BODY_COLUMNS = """
+    COALESCE(analysis_json->>'id', '') AS result_id,
+    COALESCE(analysis_json->>'ts', analysis_json->>'timestamp') AS result_ts,
+    (COALESCE(analysis_json->'analysis', '{}'::jsonb) || jsonb_strip_nulls(jsonb_build_object(
+        'safety_score', safety_score, 'score_label', score_label,
+        'cuisine_type', cuisine_type, 'summary', summary,
+        'analysis_tier', analysis_tier)))::text AS analysis_text
+"""
+
+
+def _restaurant_cache_entry(row):
+    """Turn a restaurants row into a cache result, or None if it is past
+    RESTAURANT_MAX_STALE. 'body' is the serialized response (with
+    restaurant_id); 'stale' is True once it is past RESTAURANT_CACHE_TTL:
+    still served, but due for a background refresh."""
+    searched_at = row["searched_at"]
+    if searched_at.tzinfo is None:
+        searched_at = searched_at.replace(tzinfo=timezone.utc)
+    age = datetime.now(timezone.utc) - searched_at
+    if age > RESTAURANT_MAX_STALE:
+        return None
+    display_name = display_name_from_search_query(row["search_query"], row["location"], row["name"])
+    return {
+        "restaurant_id": row["id"],
+        "body": scout_response_body(row, display_name),
+        "stale": age > RESTAURANT_CACHE_TTL,
+        "name": row["name"],
+        "location": row["location"],
+        "search_query": row["search_query"],
+    }
+
+
+def _cache_connection():
+    """(connection, use_snapshot) for a restaurant cache read. use_snapshot is
+    True when Postgres failed just now or recently and the read should come
+    from the local snapshot; otherwise the connection is None only when
+    DATABASE_URL isn't configured. Only connect errors mark the primary
+    down; a read that merely waited too long for a slot uses the snapshot
+    once."""
+    if not snapshot.primary_available():
+        return None, True
+    try:
+        conn = get_connection(wait=CACHE_READ_TIMEOUT_MS / 1000, timeout_ms=CACHE_READ_TIMEOUT_MS)
+    except ConnectionSlotTimeout as e:
+        cache_log.warning("%s, reading from the snapshot", e)
+        inc("celia_db_slot_timeouts_total")
+        return None, True
+    except psycopg2.OperationalError as e:
+        snapshot.primary_failed(e)
+        return None, True
+    if conn is not None:
+        snapshot.maybe_refresh()
+    return conn, False
+
+
+def _snapshot_cache_entry(row):
+    """_restaurant_cache_entry for a snapshot row. Never stale: re-research
+    couldn't be saved while the primary is down."""
+    entry = _restaurant_cache_entry(row) if row else None
+    inc("celia_cache_lookups_total", result="snapshot_hit" if entry else "snapshot_miss")
+    if entry:
+        entry["stale"] = False
+    return entry
+
+
+@timed("db.get_cached_restaurant")
 def get_cached_restaurant(name, location):
-    """Look up a cached restaurant result. Returns a dict with 'restaurant_id' (database ID)
-    and 'data' (the analysis JSON) if found and not expired (< 30 days old), otherwise None."""
-    conn = get_connection()
+    """Look up a cached restaurant result. Returns a dict with 'restaurant_id'
+    (database ID), 'body' (the response JSON text), 'stale' and the stored
+    name / location / search_query, or None if missing or too old to serve.
+    Entries older than RESTAURANT_CACHE_TTL come back with stale=True so the
+    caller can serve them while refreshing. Falls back to the local
+    snapshot when Postgres is down or slow."""
+    norm_name = normalize_name(name)
+    norm_location = normalize_location(location)
+    conn, use_snapshot = _cache_connection()
+    if use_snapshot:
+        return _snapshot_cache_entry(snapshot.get_row(norm_name, norm_location))
     if conn is None:
-        print("[CACHE] No database connection")
+        cache_log.warning("No database connection")
+        inc("celia_cache_lookups_total", result="unavailable")
         return None
 
-    norm_name = normalize_name(name)
-    norm_location = normalize_location(location)
-    print(f"[CACHE] Looking up: norm_name='{norm_name}', norm_location='{norm_location}'")
-    cache_ttl = timedelta(days=30)
+    cache_log.debug("Looking up: norm_name=%r, norm_location=%r", norm_name, norm_location)
 
     try:
         with conn.cursor() as cur:
             cur.execute(
                 """
-                SELECT id, name, location, search_query, safety_score, analysis_json,
-                       searched_at, expires_at
+                SELECT id, name, location, search_query, searched_at, expires_at,
+                """ + SCOUT_BODY_COLUMNS + """
                 FROM restaurants
                 WHERE LOWER(name) = %s AND LOWER(location) = %s
                 """,
@@ -109,28 +309,282 @@ def get_cached_restaurant(name, location):
             row = cur.fetchone()
 
         if not row:
+            inc("celia_cache_lookups_total", result="miss")
             return None
 
-        # Check if expired (searched_at older than 30 days)
-        searched_at = row["searched_at"]
-        if searched_at.tzinfo is None:
-            searched_at = searched_at.replace(tzinfo=timezone.utc)
-        now = datetime.now(timezone.utc)
+        entry = _restaurant_cache_entry(row)
+        if entry is None:
+            cache_log.info("Expired cache for %s (%s)", name, location)
+            inc("celia_cache_lookups_total", result="expired")
+            return None
+
+        if entry["stale"]:
+            cache_log.info("Stale cache for %s (%s)", name, location)
+            inc("celia_cache_lookups_total", result="stale")
+        else:
+            cache_log.debug("Hit for %s (%s)", name, location)
+            inc("celia_cache_lookups_total", result="hit")
+        return entry
+
+    except psycopg2.OperationalError as e:
+        snapshot.primary_failed(e)
+        return _snapshot_cache_entry(snapshot.get_row(norm_name, norm_location))
+    except Exception as e:
+        cache_log.error("Error reading cache: %s", e)
+        return None
+    finally:
+        conn.close()
+
+
+@timed("db.get_cached_restaurant_by_id")
+def get_cached_restaurant_by_id(restaurant_id):
+    """Like get_cached_restaurant, for an ID resolved by the matching layer
+    (alias or fuzzy match). Returns None if missing or too old to serve."""
+    conn, use_snapshot = _cache_connection()
+    if use_snapshot:
+        return _snapshot_cache_entry(snapshot.get_row_by_id(restaurant_id))
+    if conn is None:
+        return None
 
-        if now - searched_at > cache_ttl:
-            print(f"[CACHE] Expired cache for {name} ({location})")
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT id, name, location, search_query, searched_at,
+                """ + SCOUT_BODY_COLUMNS + """
+                FROM restaurants WHERE id = %s
+                """,
+                (restaurant_id,),
+            )
+            row = cur.fetchone()
+
+        if not row:
             return None
+        return _restaurant_cache_entry(row)
+
+    except psycopg2.OperationalError as e:
+        snapshot.primary_failed(e)
+        return _snapshot_cache_entry(snapshot.get_row_by_id(restaurant_id))
+    except Exception as e:
+        cache_log.error("Error reading cache by id: %s", e)
+        return None
+    finally:
+        conn.close()
 
-        print(f"[CACHE] Hit for {name} ({location})")
-        return {"restaurant_id": row["id"], "data": row["analysis_json"]}
 
+@timed("db.get_cached_restaurants")
+def get_cached_restaurants(names, location, restaurant_ids=()):
+    """Bulk get_cached_restaurant: one query for several names in the same
+    location, plus any IDs already resolved by the matching layer. Returns
+    {"by_name": {normalized name: entry}, "by_id": {restaurant_id: entry}};
+    entries are shaped like get_cached_restaurant's and missing / too old
+    ones are left out."""
+    found = {"by_name": {}, "by_id": {}}
+    if not names and not restaurant_ids:
+        return found
+    norm_location = normalize_location(location)
+    norm_names = [normalize_name(n) for n in names]
+
+    conn, use_snapshot = _cache_connection()
+    if use_snapshot:
+        return _found_restaurants(snapshot.get_rows(norm_names, norm_location, restaurant_ids),
+                                  norm_location, from_snapshot=True)
+    if conn is None:
+        cache_log.warning("No database connection")
+        return found
+
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT id, name, location, search_query, searched_at,
+                """ + SCOUT_BODY_COLUMNS + """
+                FROM restaurants
+                WHERE (LOWER(location) = %s AND LOWER(name) = ANY(%s)) OR id = ANY(%s)
+                """,
+                (norm_location, norm_names, list(restaurant_ids)),
+            )
+            rows = cur.fetchall()
+        return _found_restaurants(rows, norm_location)
+
+    except psycopg2.OperationalError as e:
+        snapshot.primary_failed(e)
+        return _found_restaurants(snapshot.get_rows(norm_names, norm_location, restaurant_ids),
+                                  norm_location, from_snapshot=True)
+    except Exception as e:
+        cache_log.error("Error reading bulk cache: %s", e)
+        return found
+    finally:
+        conn.close()
+
+
+def _found_restaurants(rows, norm_location, from_snapshot=False):
+    found = {"by_name": {}, "by_id": {}}
+    for row in rows:
+        entry = _snapshot_cache_entry(row) if from_snapshot else _restaurant_cache_entry(row)
+        if entry is None:
+            continue
+        found["by_id"][row["id"]] = entry
+        if row["location"].lower() == norm_location:
+            found["by_name"][row["name"].lower()] = entry
+    return found
+
+
+@timed("db.get_restaurants_changed_since")
+def get_restaurants_changed_since(since, after_id=0, limit=2000):
+    """Cached restaurants with (searched_at, id) after (since, after_id), oldest
+    first, with the columns snapshot.py keeps. Returns [] on error."""
+    conn = get_connection()
+    if conn is None:
+        return []
+
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT id, name, location, search_query, safety_score, searched_at,
+                """ + SCOUT_BODY_COLUMNS + """
+                FROM restaurants
+                WHERE (searched_at, id) > (%s, %s)
+                ORDER BY searched_at, id
+                LIMIT %s
+                """,
+                (since, after_id, limit),
+            )
+            return [dict(row) for row in cur.fetchall()]
+    except Exception as e:
+        cache_log.error("Error reading changed restaurants: %s", e)
+        return []
+    finally:
+        conn.close()
+
+
+def get_restaurant_ids():
+    """Every cached restaurant ID, for snapshot.py to drop rows deleted from
+    Postgres. Returns None on error (not an empty set, which would empty the
+    snapshot)."""
+    conn = get_connection()
+    if conn is None:
+        return None
+
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT id FROM restaurants")
+            return {row["id"] for row in cur.fetchall()}
     except Exception as e:
-        print(f"[CACHE] Error reading cache: {e}")
+        cache_log.error("Error reading restaurant ids: %s", e)
         return None
     finally:
         conn.close()
 
 
+@timed("db.get_expiring_restaurants")
+def get_expiring_restaurants(within_days=3, limit=10):
+    """Return the most-saved cached restaurants whose entries expire within
+    `within_days` (or already have), for the refresh_cache.py job. Each row
+    has id, name, location, search_query, expires_at and save_count."""
+    conn = get_connection()
+    if conn is None:
+        return []
+
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT r.id, r.name, r.location, r.search_query, r.expires_at,
+                       COUNT(s.user_id) AS save_count
+                FROM restaurants r
+                LEFT JOIN saved_restaurants s ON s.restaurant_id = r.id
+                WHERE r.expires_at < NOW() + make_interval(days => %s)
+                GROUP BY r.id
+                ORDER BY save_count DESC, r.expires_at
+                LIMIT %s
+                """,
+                (within_days, limit),
+            )
+            return [dict(row) for row in cur.fetchall()]
+    except Exception as e:
+        cache_log.error("Error listing expiring restaurants: %s", e)
+        return []
+    finally:
+        conn.close()
+
+
+@timed("db.get_restaurant_match_rows")
+def get_restaurant_match_rows():
+    """Return (id, name, location, safety_score) for every cached restaurant,
+    used to build the in-process fuzzy matching index. Read from the local
+    snapshot while Postgres is unavailable."""
+    conn, use_snapshot = _cache_connection()
+    if use_snapshot:
+        return snapshot.get_match_rows()
+    if conn is None:
+        return []
+
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT id, name, location, safety_score FROM restaurants")
+            return [dict(row) for row in cur.fetchall()]
+    except psycopg2.OperationalError as e:
+        snapshot.primary_failed(e)
+        return snapshot.get_match_rows()
+    except Exception as e:
+        cache_log.error("Error loading restaurant match rows: %s", e)
+        return []
+    finally:
+        conn.close()
+
+
+@timed("db.get_restaurant_aliases")
+def get_restaurant_aliases():
+    """Return all learned (alias_name, alias_location, restaurant_id) rows.
+    None are kept in the snapshot, so this is empty while Postgres is down."""
+    conn, use_snapshot = _cache_connection()
+    if conn is None:
+        return []
+
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT alias_name, alias_location, restaurant_id FROM restaurant_aliases")
+            return [dict(row) for row in cur.fetchall()]
+    except Exception as e:
+        cache_log.error("Error loading restaurant aliases: %s", e)
+        return []
+    finally:
+        conn.close()
+
+
+@timed("db.add_restaurant_alias")
+def add_restaurant_alias(name, location, restaurant_id):
+    """Record that (name, location) refers to restaurant_id. Keys are normalized
+    with normalize_name / normalize_location. Returns True if saved."""
+    if not snapshot.primary_available():
+        return False
+    conn = get_connection()
+    if conn is None:
+        return False
+
+    try:
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    INSERT INTO restaurant_aliases (alias_name, alias_location, restaurant_id)
+                    VALUES (%s, %s, %s)
+                    ON CONFLICT (alias_name, alias_location) DO UPDATE SET
+                        restaurant_id = EXCLUDED.restaurant_id
+                    """,
+                    (normalize_name(name), normalize_location(location), restaurant_id),
+                )
+        return True
+    except Exception as e:
+        cache_log.error("Error saving restaurant alias: %s", e)
+        return False
+    finally:
+        conn.close()
+
+
+@timed("db.cache_restaurant_result")
 def cache_restaurant_result(name, location, result_json):
     """Save or update a restaurant result in the cache."""
     conn = get_connection()
@@ -140,7 +594,8 @@ def cache_restaurant_result(name, location, result_json):
     norm_name = normalize_name(name)
     norm_location = normalize_location(location)
     search_query = f"{name} {location}".strip()
-    safety_score = result_json.get("analysis", {}).get("safety_score")
+    result = ScoutResult.from_dict(result_json)
+    columns = result.columns()
     now = datetime.now(timezone.utc)
     expires_at = now + timedelta(days=30)
 
@@ -150,27 +605,140 @@ def cache_restaurant_result(name, location, result_json):
                 cur.execute(
                     """
                     INSERT INTO restaurants (name, location, search_query, safety_score,
+                                             score_label, cuisine_type, summary, analysis_tier,
                                              analysis_json, searched_at, expires_at)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
                     ON CONFLICT (name, location) DO UPDATE SET
                         search_query = EXCLUDED.search_query,
                         safety_score = EXCLUDED.safety_score,
+                        score_label = EXCLUDED.score_label,
+                        cuisine_type = EXCLUDED.cuisine_type,
+                        summary = EXCLUDED.summary,
+                        analysis_tier = EXCLUDED.analysis_tier,
                         analysis_json = EXCLUDED.analysis_json,
                         searched_at = EXCLUDED.searched_at,
                         expires_at = EXCLUDED.expires_at
                     """,
-                    (norm_name, norm_location, search_query, safety_score,
-                     json.dumps(result_json), now, expires_at),
+                    (norm_name, norm_location, search_query, columns["safety_score"],
+                     columns["score_label"], columns["cuisine_type"], columns["summary"],
+                     columns["analysis_tier"], json.dumps(result.to_storage()), now, expires_at),
+                )
+                # A successful analysis clears any negative cache entries for the key
+                cur.execute(
+                    "DELETE FROM scout_failures WHERE name = %s AND location = %s",
+                    (norm_name, norm_location),
                 )
-        print(f"[CACHE] Saved {name} ({location})")
+        cache_log.info("Saved %s (%s)", name, location)
         return True
     except Exception as e:
-        print(f"[CACHE] Error saving to cache: {e}")
+        cache_log.error("Error saving to cache: %s", e)
         return False
     finally:
         conn.close()
 
 
+# Negative cache backoff per failure kind: (first backoff, maximum backoff).
+# Each repeat failure of the same kind doubles the wait up to the maximum.
+SCOUT_FAILURE_BACKOFF = {
+    "api_error": (timedelta(minutes=1), timedelta(minutes=15)),
+    "no_text": (timedelta(minutes=10), timedelta(hours=6)),
+    "parse_error": (timedelta(minutes=10), timedelta(hours=6)),
+    "not_found": (timedelta(hours=6), timedelta(days=7)),
+}
+
+
+def scout_failure_backoff(failure_kind, failure_count):
+    """How long to negative-cache a key after its `failure_count`th failure
+    of this kind in a row (1 = the first since a success cleared the entry):
+    the kind's first backoff, doubled per repeat, capped at its maximum.
+    Unknown kinds back off like api_error."""
+    backoff, maximum = SCOUT_FAILURE_BACKOFF.get(failure_kind, SCOUT_FAILURE_BACKOFF["api_error"])
+    for _ in range(failure_count - 1):
+        if backoff >= maximum:
+            break  # a key failing for weeks would otherwise overflow timedelta
+        backoff *= 2
+    return min(backoff, maximum)
+
+
+@timed("db.get_scout_failure")
+def get_scout_failure(name, location):
+    """Return the active negative cache entry for a restaurant key, i.e. the
+    failure with the latest retry_after that is still in the future, as a dict
+    (failure_kind, failure_count, detail, retry_in seconds), or None."""
+    conn = get_connection()
+    if conn is None:
+        return None
+
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT failure_kind, failure_count, detail,
+                       CEIL(EXTRACT(EPOCH FROM retry_after - NOW()))::int AS retry_in
+                FROM scout_failures
+                WHERE name = %s AND location = %s AND retry_after > NOW()
+                ORDER BY retry_after DESC
+                LIMIT 1
+                """,
+                (normalize_name(name), normalize_location(location)),
+            )
+            row = cur.fetchone()
+        if row:
+            inc("celia_cache_lookups_total", result="negative_hit")
+            return dict(row)
+        return None
+    except Exception as e:
+        cache_log.error("Error reading scout failures: %s", e)
+        return None
+    finally:
+        conn.close()
+
+
+@timed("db.record_scout_failure")
+def record_scout_failure(name, location, failure_kind, detail=""):
+    """Record a failed analysis for a restaurant key and push its retry_after
+    out by the next backoff step for that failure kind. Returns the backoff
+    as a timedelta, or None if it could not be recorded."""
+    conn = get_connection()
+    if conn is None:
+        return None
+
+    key = (normalize_name(name), normalize_location(location), failure_kind)
+    try:
+        with conn:
+            with conn.cursor() as cur:
+                # The upsert locks the row, so concurrent failures count in turn
+                cur.execute(
+                    """
+                    INSERT INTO scout_failures (name, location, failure_kind, detail, retry_after)
+                    VALUES (%s, %s, %s, %s, NOW())
+                    ON CONFLICT (name, location, failure_kind) DO UPDATE SET
+                        failure_count = scout_failures.failure_count + 1,
+                        detail = EXCLUDED.detail,
+                        last_failed_at = NOW()
+                    RETURNING failure_count
+                    """,
+                    (*key, detail[:500]),
+                )
+                count = cur.fetchone()["failure_count"]
+                backoff = scout_failure_backoff(failure_kind, count)
+                cur.execute(
+                    """
+                    UPDATE scout_failures SET retry_after = NOW() + make_interval(secs => %s)
+                    WHERE name = %s AND location = %s AND failure_kind = %s
+                    """,
+                    (backoff.total_seconds(), *key),
+                )
+        cache_log.info("Negative-cached %s (%s): %s x%d, retry in %s", name, location, failure_kind, count, backoff)
+        return backoff
+    except Exception as e:
+        cache_log.error("Error recording scout failure: %s", e)
+        return None
+    finally:
+        conn.close()
+
+
+@timed("db.get_cached_scores")
 def get_cached_scores(names, location):
     """Look up cached safety scores for multiple restaurant names.
     Returns a dict mapping normalized names to safety scores."""
@@ -196,12 +764,235 @@ def get_cached_scores(names, location):
         return {row["norm_name"]: row["safety_score"] for row in rows}
 
     except Exception as e:
-        print(f"[CACHE] Error reading bulk cache: {e}")
+        cache_log.error("Error reading bulk cache: %s", e)
         return {}
     finally:
         conn.close()
 
 
+@timed("db.get_local_alternatives")
+def get_local_alternatives(location, cuisine_type="", exclude_name="", min_score=7, limit=3):
+    """Return the best-scoring cached restaurants in a location, preferring the
+    given cuisine, as lightweight dicts (listing columns only, no analysis_json)."""
+    conn = get_connection()
+    if conn is None:
+        return []
+
+    cuisine_pattern = f"%{cuisine_type.strip()}%" if cuisine_type and cuisine_type.strip() else None
+
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT id, name, location, search_query, safety_score,
+                       cuisine_type, score_label, summary
+                FROM restaurants
+                WHERE LOWER(location) = %s AND safety_score >= %s AND LOWER(name) <> %s
+                ORDER BY (%s::TEXT IS NOT NULL AND cuisine_type ILIKE %s) DESC,
+                         safety_score DESC, searched_at DESC
+                LIMIT %s
+                """,
+                (normalize_location(location), min_score, normalize_name(exclude_name or ""),
+                 cuisine_pattern, cuisine_pattern, limit),
+            )
+            rows = [dict(row) for row in cur.fetchall()]
+        for r in rows:
+            r["display_name"] = display_name_from_search_query(r["search_query"], r["location"], r["name"])
+        return rows
+    except Exception as e:
+        cache_log.error("Error getting local alternatives: %s", e)
+        return []
+    finally:
+        conn.close()
+
+
+DISCOVERY_CACHE_TTL = timedelta(days=7)
+DISCOVERY_MAX_STALE = timedelta(days=60)
+
+
+def normalize_cuisine(cuisine):
+    """Normalize cuisine for the discovery cache key: same rules as names."""
+    return normalize_name(cuisine or "")
+
+
+@timed("db.get_cached_discovery")
+def get_cached_discovery(cuisine, location):
+    """Look up cached discovery results. Returns {'restaurants': [...], 'stale': bool}
+    if an entry exists that is younger than DISCOVERY_MAX_STALE, otherwise None.
+    'stale' is True once the entry is past DISCOVERY_CACHE_TTL and should be
+    refreshed in the background."""
+    conn = get_connection()
+    if conn is None:
+        return None
+
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT results_json, searched_at
+                FROM discovery_cache
+                WHERE cuisine = %s AND location = %s
+                """,
+                (normalize_cuisine(cuisine), normalize_location(location)),
+            )
+            row = cur.fetchone()
+
+        if not row:
+            inc("celia_discovery_cache_lookups_total", result="miss")
+            return None
+
+        searched_at = row["searched_at"]
+        if searched_at.tzinfo is None:
+            searched_at = searched_at.replace(tzinfo=timezone.utc)
+        age = datetime.now(timezone.utc) - searched_at
+
+        if age > DISCOVERY_MAX_STALE:
+            inc("celia_discovery_cache_lookups_total", result="expired")
+            return None
+
+        stale = age > DISCOVERY_CACHE_TTL
+        inc("celia_discovery_cache_lookups_total", result="stale" if stale else "hit")
+        return {"restaurants": row["results_json"], "stale": stale}
+
+    except Exception as e:
+        cache_log.error("Error reading discovery cache: %s", e)
+        return None
+    finally:
+        conn.close()
+
+
+@timed("db.cache_discovery_result")
+def cache_discovery_result(cuisine, location, restaurants):
+    """Save or replace discovery results for a cuisine + location."""
+    conn = get_connection()
+    if conn is None:
+        return False
+
+    now = datetime.now(timezone.utc)
+
+    try:
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    INSERT INTO discovery_cache (cuisine, location, results_json, searched_at, expires_at)
+                    VALUES (%s, %s, %s, %s, %s)
+                    ON CONFLICT (cuisine, location) DO UPDATE SET
+                        results_json = EXCLUDED.results_json,
+                        searched_at = EXCLUDED.searched_at,
+                        expires_at = EXCLUDED.expires_at
+                    """,
+                    (normalize_cuisine(cuisine), normalize_location(location),
+                     json.dumps(restaurants), now, now + DISCOVERY_CACHE_TTL),
+                )
+        cache_log.info("Saved discovery results for %s in %s", cuisine, location)
+        return True
+    except Exception as e:
+        cache_log.error("Error saving discovery cache: %s", e)
+        return False
+    finally:
+        conn.close()
+
+
+# Verdicts are re-analyzed after this long, in case the recipe changed
+PRODUCT_VERDICT_TTL = timedelta(days=180)
+
+
+@timed("db.get_product_verdict")
+def get_product_verdict(barcode):
+    """The indexed label analysis for a barcode (13-digit GTIN), counting the
+    scan. Returns {'analysis', 'analyzed_at', 'scan_count'} or None if the
+    product is unknown or its verdict is older than PRODUCT_VERDICT_TTL."""
+    conn = get_connection()
+    if conn is None:
+        return None
+
+    try:
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    UPDATE product_verdicts
+                    SET scan_count = scan_count + 1, last_scanned_at = NOW()
+                    WHERE barcode = %s AND analyzed_at > NOW() - make_interval(secs => %s)
+                    RETURNING analysis_json, analyzed_at, scan_count
+                    """,
+                    (barcode, PRODUCT_VERDICT_TTL.total_seconds()),
+                )
+                row = cur.fetchone()
+        inc("celia_product_index_lookups_total", result="hit" if row else "miss")
+        if not row:
+            return None
+        return {"analysis": row["analysis_json"], "analyzed_at": row["analyzed_at"], "scan_count": row["scan_count"]}
+    except Exception as e:
+        cache_log.error("Error reading product verdict: %s", e)
+        return None
+    finally:
+        conn.close()
+
+
+@timed("db.save_product_verdict")
+def save_product_verdict(barcode, analysis):
+    """Save or replace the label analysis for a barcode."""
+    conn = get_connection()
+    if conn is None:
+        return False
+
+    try:
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    INSERT INTO product_verdicts (barcode, product_name, verdict, confidence, analysis_json)
+                    VALUES (%s, %s, %s, %s, %s)
+                    ON CONFLICT (barcode) DO UPDATE SET
+                        product_name = EXCLUDED.product_name,
+                        verdict = EXCLUDED.verdict,
+                        confidence = EXCLUDED.confidence,
+                        analysis_json = EXCLUDED.analysis_json,
+                        analyzed_at = NOW(),
+                        scan_count = product_verdicts.scan_count + 1,
+                        last_scanned_at = NOW()
+                    """,
+                    (barcode, analysis.get("product_name", "Unknown Product")[:255], analysis["verdict"],
+                     analysis.get("confidence"), json.dumps(analysis)),
+                )
+        cache_log.info("Indexed product %s: %s (%s)", barcode, analysis.get("product_name"), analysis["verdict"])
+        return True
+    except Exception as e:
+        cache_log.error("Error saving product verdict: %s", e)
+        return False
+    finally:
+        conn.close()
+
+
+@timed("db.get_most_scanned_products")
+def get_most_scanned_products(limit=10):
+    """Indexed products by scan count, for the admin dashboard."""
+    conn = get_connection()
+    if conn is None:
+        return []
+
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT barcode, product_name, verdict, scan_count, analyzed_at, last_scanned_at
+                FROM product_verdicts
+                ORDER BY scan_count DESC
+                LIMIT %s
+                """,
+                (limit,),
+            )
+            return [dict(row) for row in cur.fetchall()]
+    except Exception as e:
+        log.error("Error reading product verdicts: %s", e)
+        return []
+    finally:
+        conn.close()
+
+
+@timed("db.get_or_create_user")
 def get_or_create_user(email):
     """Get existing user by email or create a new one. Returns user dict with id and email."""
     conn = get_connection()
@@ -229,12 +1020,13 @@ def get_or_create_user(email):
                 return dict(row)
 
     except Exception as e:
-        print(f"[USER] Error getting/creating user: {e}")
+        user_log.error("Error getting/creating user: %s", e)
         return None
     finally:
         conn.close()
 
 
+@timed("db.get_user_by_id")
 def get_user_by_id(user_id):
     """Get user by ID. Returns user dict or None."""
     conn = get_connection()
@@ -248,12 +1040,13 @@ def get_user_by_id(user_id):
             return dict(row) if row else None
 
     except Exception as e:
-        print(f"[USER] Error getting user: {e}")
+        user_log.error("Error getting user: %s", e)
         return None
     finally:
         conn.close()
 
 
+@timed("db.get_restaurant_id")
 def get_restaurant_id(name, location):
     """Get restaurant ID by name and location. Returns ID or None."""
     conn = get_connection()
@@ -273,12 +1066,13 @@ def get_restaurant_id(name, location):
             return row["id"] if row else None
 
     except Exception as e:
-        print(f"[DB] Error getting restaurant ID: {e}")
+        log.error("Error getting restaurant ID: %s", e)
         return None
     finally:
         conn.close()
 
 
+@timed("db.restaurant_exists")
 def restaurant_exists(restaurant_id):
     """Check if a restaurant exists by ID. Returns True if exists."""
     conn = get_connection()
@@ -291,12 +1085,13 @@ def restaurant_exists(restaurant_id):
             return cur.fetchone() is not None
 
     except Exception as e:
-        print(f"[DB] Error checking restaurant exists: {e}")
+        log.error("Error checking restaurant exists: %s", e)
         return False
     finally:
         conn.close()
 
 
+@timed("db.save_user_restaurant")
 def save_user_restaurant(user_id, restaurant_id):
     """Save a restaurant to user's saved list. Returns True if successful."""
     conn = get_connection()
@@ -317,12 +1112,13 @@ def save_user_restaurant(user_id, restaurant_id):
         return True
 
     except Exception as e:
-        print(f"[DB] Error saving restaurant: {e}")
+        log.error("Error saving restaurant: %s", e)
         return False
     finally:
         conn.close()
 
 
+@timed("db.is_restaurant_saved")
 def is_restaurant_saved(user_id, restaurant_id):
     """Check if a restaurant is already saved by user."""
     conn = get_connection()
@@ -338,12 +1134,13 @@ def is_restaurant_saved(user_id, restaurant_id):
             return cur.fetchone() is not None
 
     except Exception as e:
-        print(f"[DB] Error checking saved restaurant: {e}")
+        log.error("Error checking saved restaurant: %s", e)
         return False
     finally:
         conn.close()
 
 
+@timed("db.unsave_user_restaurant")
 def unsave_user_restaurant(user_id, restaurant_id):
     """Remove a restaurant from user's saved list. Returns True if successful."""
     conn = get_connection()
@@ -360,12 +1157,13 @@ def unsave_user_restaurant(user_id, restaurant_id):
         return True
 
     except Exception as e:
-        print(f"[DB] Error unsaving restaurant: {e}")
+        log.error("Error unsaving restaurant: %s", e)
         return False
     finally:
         conn.close()
 
 
+@timed("db.get_search_count")
 def get_search_count(email):
     """Get the search count for a signed-in user by email."""
     conn = get_connection()
@@ -378,12 +1176,13 @@ def get_search_count(email):
             row = cur.fetchone()
             return row["search_count"] if row else 0
     except Exception as e:
-        print(f"[DB] Error getting search count: {e}")
+        log.error("Error getting search count: %s", e)
         return 0
     finally:
         conn.close()
 
 
+@timed("db.increment_search_count")
 def increment_search_count(email):
     """Increment the search count for a signed-in user by email."""
     conn = get_connection()
@@ -399,12 +1198,13 @@ def increment_search_count(email):
                 )
         return True
     except Exception as e:
-        print(f"[DB] Error incrementing search count: {e}")
+        log.error("Error incrementing search count: %s", e)
         return False
     finally:
         conn.close()
 
 
+@timed("db.get_anonymous_search_count")
 def get_anonymous_search_count(ip_address):
     """Get the search count for an anonymous user by IP address."""
     conn = get_connection()
@@ -417,12 +1217,13 @@ def get_anonymous_search_count(ip_address):
             row = cur.fetchone()
             return row["search_count"] if row else 0
     except Exception as e:
-        print(f"[DB] Error getting anonymous search count: {e}")
+        log.error("Error getting anonymous search count: %s", e)
         return 0
     finally:
         conn.close()
 
 
+@timed("db.increment_anonymous_search_count")
 def increment_anonymous_search_count(ip_address):
     """Increment the search count for an anonymous user by IP address (upsert)."""
     conn = get_connection()
@@ -444,12 +1245,13 @@ def increment_anonymous_search_count(ip_address):
                 )
         return True
     except Exception as e:
-        print(f"[DB] Error incrementing anonymous search count: {e}")
+        log.error("Error incrementing anonymous search count: %s", e)
         return False
     finally:
         conn.close()
 
 
+@timed("db.add_restaurant_request")
 def add_restaurant_request(name, location, email, ip):
     """Save a restaurant request. Returns True if saved."""
     conn = get_connection()
@@ -467,15 +1269,16 @@ def add_restaurant_request(name, location, email, ip):
                     (name.strip(), location.strip() if location else None,
                      email.lower().strip() if email else None, ip),
                 )
-        print(f"[DB] Restaurant request saved: {name} ({location})")
+        log.info("Restaurant request saved: %s (%s)", name, location)
         return True
     except Exception as e:
-        print(f"[DB] Error saving restaurant request: {e}")
+        log.error("Error saving restaurant request: %s", e)
         return False
     finally:
         conn.close()
 
 
+@timed("db.get_pending_requests")
 def get_pending_requests():
     """Get all unfulfilled restaurant requests, oldest first."""
     conn = get_connection()
@@ -494,12 +1297,13 @@ def get_pending_requests():
             )
             return [dict(row) for row in cur.fetchall()]
     except Exception as e:
-        print(f"[DB] Error getting pending requests: {e}")
+        log.error("Error getting pending requests: %s", e)
         return []
     finally:
         conn.close()
 
 
+@timed("db.mark_request_fulfilled")
 def mark_request_fulfilled(request_id):
     """Mark a restaurant request as fulfilled."""
     conn = get_connection()
@@ -515,12 +1319,13 @@ def mark_request_fulfilled(request_id):
                 )
         return True
     except Exception as e:
-        print(f"[DB] Error marking request fulfilled: {e}")
+        log.error("Error marking request fulfilled: %s", e)
         return False
     finally:
         conn.close()
 
 
+@timed("db.add_to_waitlist")
 def add_to_waitlist(email):
     """Add an email to the Pro waitlist. Returns True if added, False on error/duplicate."""
     conn = get_connection()
@@ -536,12 +1341,13 @@ def add_to_waitlist(email):
                 )
         return True
     except Exception as e:
-        print(f"[DB] Error adding to waitlist: {e}")
+        log.error("Error adding to waitlist: %s", e)
         return False
     finally:
         conn.close()
 
 
+@timed("db.get_admin_stats")
 def get_admin_stats():
     """Get overview stats for the admin dashboard."""
     conn = get_connection()
@@ -581,12 +1387,13 @@ def get_admin_stats():
             "request_count": requests,
         }
     except Exception as e:
-        print(f"[DB] Error getting admin stats: {e}")
+        log.error("Error getting admin stats: %s", e)
         return {}
     finally:
         conn.close()
 
 
+@timed("db.get_recent_restaurants")
 def get_recent_restaurants(limit=20):
     """Get the most recently cached restaurants."""
     conn = get_connection()
@@ -601,12 +1408,13 @@ def get_recent_restaurants(limit=20):
             )
             return [dict(row) for row in cur.fetchall()]
     except Exception as e:
-        print(f"[DB] Error getting recent restaurants: {e}")
+        log.error("Error getting recent restaurants: %s", e)
         return []
     finally:
         conn.close()
 
 
+@timed("db.get_waitlist_entries")
 def get_waitlist_entries():
     """Get all waitlist entries."""
     conn = get_connection()
@@ -618,12 +1426,13 @@ def get_waitlist_entries():
             cur.execute("SELECT email, signed_up_at FROM waitlist ORDER BY signed_up_at DESC")
             return [dict(row) for row in cur.fetchall()]
     except Exception as e:
-        print(f"[DB] Error getting waitlist entries: {e}")
+        log.error("Error getting waitlist entries: %s", e)
         return []
     finally:
         conn.close()
 
 
+@timed("db.get_restaurant_request_entries")
 def get_restaurant_request_entries():
     """Get all restaurant request entries."""
     conn = get_connection()
@@ -637,12 +1446,13 @@ def get_restaurant_request_entries():
             )
             return [dict(row) for row in cur.fetchall()]
     except Exception as e:
-        print(f"[DB] Error getting restaurant requests: {e}")
+        log.error("Error getting restaurant requests: %s", e)
         return []
     finally:
         conn.close()
 
 
+@timed("db.get_most_saved_restaurants")
 def get_most_saved_restaurants(limit=10):
     """Get the most saved restaurants by users."""
     conn = get_connection()
@@ -664,35 +1474,45 @@ def get_most_saved_restaurants(limit=10):
             )
             return [dict(row) for row in cur.fetchall()]
     except Exception as e:
-        print(f"[DB] Error getting most saved restaurants: {e}")
+        log.error("Error getting most saved restaurants: %s", e)
         return []
     finally:
         conn.close()
 
 
+def display_name_from_search_query(search_query, location, norm_name):
+    """Derive a display name for a cached restaurant. search_query keeps the
+    user's original casing in "Restaurant Name Location" format, so strip the
+    location off the end; fall back to title-casing the normalized name."""
+    if search_query:
+        # If location exists, remove it from end of search_query
+        loc = location or ''
+        if not loc:
+            display_name = search_query.strip()
+        elif search_query.lower().endswith(loc.lower()):
+            display_name = search_query[:-len(loc)].strip()
+        else:
+            display_name = search_query.split()[0]
+        return display_name if display_name else norm_name.title()
+    # Fallback: title case the normalized name
+    return norm_name.title()
+
+
+@timed("db.get_user_saved_restaurants")
 def get_user_saved_restaurants(user_id):
-    """Get all saved restaurants for a user. Returns list of restaurant dicts."""
+    """Get all saved restaurants for a user. Returns list of restaurant dicts
+    with listing columns only; the full report is fetched by ID when opened."""
     conn = get_connection()
     if conn is None:
-        print(f"[DB] No connection for get_user_saved_restaurants")
+        log.warning("No connection for get_user_saved_restaurants")
         return []
 
-    print(f"[DB] Getting saved restaurants for user_id={user_id}")
-
     try:
         with conn.cursor() as cur:
-            # First check how many saved_restaurants exist for this user
-            cur.execute(
-                "SELECT COUNT(*) as count FROM saved_restaurants WHERE user_id = %s",
-                (user_id,)
-            )
-            count_row = cur.fetchone()
-            print(f"[DB] Found {count_row['count']} saved_restaurants entries for user {user_id}")
-
             cur.execute(
                 """
                 SELECT r.id, r.name, r.location, r.safety_score, r.search_query,
-                       sr.saved_at
+                       r.score_label, r.cuisine_type, r.summary, sr.saved_at
                 FROM saved_restaurants sr
                 JOIN restaurants r ON sr.restaurant_id = r.id
                 WHERE sr.user_id = %s
@@ -702,41 +1522,261 @@ def get_user_saved_restaurants(user_id):
             )
             rows = cur.fetchall()
 
-            # Extract display name from search_query or analysis_json
             results = []
             for row in rows:
                 r = dict(row)
-                # Use search_query for display (it has original casing)
-                # search_query is "Restaurant Name Location" format
-                if r.get('search_query'):
-                    # If location exists, remove it from end of search_query
-                    sq = r['search_query']
-                    loc = r.get('location', '')
-                    if loc and sq.lower().endswith(loc.lower()):
-                        display_name = sq[:-len(loc)].strip()
-                    else:
-                        display_name = sq.split()[0] if sq else r['name']
-                    # Actually, just use the search_query without location as name
-                    # Better: parse from analysis_json if available
-                    r['name'] = display_name if display_name else r['name'].title()
-                else:
-                    # Fallback: title case the normalized name
-                    r['name'] = r['name'].title()
+                r['name'] = display_name_from_search_query(r.get('search_query'), r.get('location'), r['name'])
 
                 # Title case location if it exists
                 if r.get('location'):
                     r['location'] = r['location'].title()
 
-                print(f"[DB] Saved restaurant: id={r['id']}, name={r['name']}, location={r['location']}, score={r['safety_score']}")
+                log.verbose("Saved restaurant: id=%s, name=%s, location=%s, score=%s",
+                            r['id'], r['name'], r['location'], r['safety_score'])
                 results.append(r)
 
-            print(f"[DB] Returning {len(results)} saved restaurants")
+            log.debug("Returning %d saved restaurants for user_id=%s", len(results), user_id)
             return results
 
     except Exception as e:
-        print(f"[DB] Error getting saved restaurants: {e}")
-        import traceback
-        traceback.print_exc()
+        log.exception("Error getting saved restaurants: %s", e)
+        return []
+    finally:
+        conn.close()
+
+
+LLM_USAGE_COLUMNS = (
+    "created_at", "endpoint", "model", "user_id", "ip_address",
+    "input_tokens", "output_tokens", "cache_creation_tokens", "cache_read_tokens",
+    "web_searches", "latency_ms", "cost_micros",
+)
+
+
+@timed("db.insert_llm_usage")
+def insert_llm_usage(rows):
+    """Insert a batch of LLM usage rows (dicts keyed by LLM_USAGE_COLUMNS) in one
+    statement. Returns True if successful."""
+    if not rows:
+        return True
+    conn = get_connection()
+    if conn is None:
+        return False
+
+    try:
+        with conn:
+            with conn.cursor() as cur:
+                execute_values(
+                    cur,
+                    f"INSERT INTO llm_usage ({', '.join(LLM_USAGE_COLUMNS)}) VALUES %s",
+                    [tuple(row.get(col) for col in LLM_USAGE_COLUMNS) for row in rows],
+                )
+        return True
+    except Exception as e:
+        log.error("Error inserting LLM usage: %s", e)
+        return False
+    finally:
+        conn.close()
+
+
+_LLM_USAGE_TOTALS = """
+    COUNT(*) AS calls,
+    COALESCE(SUM(input_tokens), 0) AS input_tokens,
+    COALESCE(SUM(output_tokens), 0) AS output_tokens,
+    COALESCE(SUM(cache_read_tokens), 0) AS cache_read_tokens,
+    COALESCE(SUM(web_searches), 0) AS web_searches,
+    COALESCE(AVG(latency_ms), 0)::INTEGER AS avg_latency_ms,
+    COALESCE(SUM(cost_micros), 0) / 1000000.0 AS cost_usd
+"""
+
+
+@timed("db.get_llm_usage_by_endpoint")
+def get_llm_usage_by_endpoint(days=30):
+    """LLM usage totals per endpoint and model over the last `days` days."""
+    conn = get_connection()
+    if conn is None:
+        return []
+
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                f"""
+                SELECT endpoint, model, {_LLM_USAGE_TOTALS}
+                FROM llm_usage
+                WHERE created_at >= NOW() - make_interval(days => %s)
+                GROUP BY endpoint, model
+                ORDER BY cost_usd DESC
+                """,
+                (days,),
+            )
+            return [dict(row) for row in cur.fetchall()]
+    except Exception as e:
+        log.error("Error getting LLM usage by endpoint: %s", e)
         return []
     finally:
         conn.close()
+
+
+@timed("db.get_llm_usage_by_day")
+def get_llm_usage_by_day(days=14):
+    """LLM usage totals per day over the last `days` days, newest first."""
+    conn = get_connection()
+    if conn is None:
+        return []
+
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                f"""
+                SELECT created_at::DATE AS day, {_LLM_USAGE_TOTALS}
+                FROM llm_usage
+                WHERE created_at >= NOW() - make_interval(days => %s)
+                GROUP BY day
+                ORDER BY day DESC
+                """,
+                (days,),
+            )
+            return [dict(row) for row in cur.fetchall()]
+    except Exception as e:
+        log.error("Error getting LLM usage by day: %s", e)
+        return []
+    finally:
+        conn.close()
+
+
+@timed("db.get_llm_usage_by_user")
+def get_llm_usage_by_user(days=30, limit=20):
+    """Top signed-in users / anonymous IPs by LLM cost over the last `days` days."""
+    conn = get_connection()
+    if conn is None:
+        return []
+
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                f"""
+                SELECT COALESCE(u.email, l.ip_address, 'unknown') AS user_or_ip,
+                       u.email IS NOT NULL AS registered, {_LLM_USAGE_TOTALS}
+                FROM llm_usage l
+                LEFT JOIN users u ON l.user_id = u.id
+                WHERE l.created_at >= NOW() - make_interval(days => %s)
+                GROUP BY user_or_ip, registered
+                ORDER BY cost_usd DESC
+                LIMIT %s
+                """,
+                (days, limit),
+            )
+            return [dict(row) for row in cur.fetchall()]
+    except Exception as e:
+        log.error("Error getting LLM usage by user: %s", e)
+        return []
+    finally:
+        conn.close()
+
+
+PROFILE_RETENTION_DAYS = 14
+REQUEST_PROFILE_COLUMNS = (
+    "route", "method", "path", "status", "duration_ms",
+    "sample_count", "interval_ms", "trigger", "stacks",
+)
+
+
+@timed("db.save_request_profile")
+def save_request_profile(row):
+    """Store one request profile (a dict keyed by REQUEST_PROFILE_COLUMNS) and
+    drop profiles older than PROFILE_RETENTION_DAYS. Returns True if successful."""
+    conn = get_connection()
+    if conn is None:
+        return False
+
+    try:
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    f"""
+                    INSERT INTO request_profiles ({', '.join(REQUEST_PROFILE_COLUMNS)})
+                    VALUES ({', '.join(['%s'] * len(REQUEST_PROFILE_COLUMNS))})
+                    """,
+                    tuple(row.get(col) for col in REQUEST_PROFILE_COLUMNS),
+                )
+                cur.execute(
+                    "DELETE FROM request_profiles WHERE created_at < NOW() - make_interval(days => %s)",
+                    (PROFILE_RETENTION_DAYS,),
+                )
+        return True
+    except Exception as e:
+        log.error("Error saving request profile: %s", e)
+        return False
+    finally:
+        conn.close()
+
+
+@timed("db.get_request_profiles")
+def get_request_profiles(route=None, limit=25):
+    """Stored profiles without their stacks, slowest first, optionally for one route."""
+    conn = get_connection()
+    if conn is None:
+        return []
+
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT id, route, method, path, status, duration_ms, sample_count,
+                       interval_ms, trigger, created_at
+                FROM request_profiles
+                WHERE %(route)s::TEXT IS NULL OR route = %(route)s
+                ORDER BY duration_ms DESC
+                LIMIT %(limit)s
+                """,
+                {"route": route, "limit": limit},
+            )
+            return [dict(row) for row in cur.fetchall()]
+    except Exception as e:
+        log.error("Error getting request profiles: %s", e)
+        return []
+    finally:
+        conn.close()
+
+
+@timed("db.get_profiled_routes")
+def get_profiled_routes():
+    """Routes that have stored profiles, with counts and the slowest duration."""
+    conn = get_connection()
+    if conn is None:
+        return []
+
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT route, COUNT(*) AS profiles, MAX(duration_ms) AS max_duration_ms
+                FROM request_profiles
+                GROUP BY route
+                ORDER BY max_duration_ms DESC
+                """
+            )
+            return [dict(row) for row in cur.fetchall()]
+    except Exception as e:
+        log.error("Error getting profiled routes: %s", e)
+        return []
+    finally:
+        conn.close()
+
+
+@timed("db.get_request_profile")
+def get_request_profile(profile_id):
+    """One stored profile including its collapsed stacks, or None."""
+    conn = get_connection()
+    if conn is None:
+        return None
+
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT * FROM request_profiles WHERE id = %s", (profile_id,))
+            row = cur.fetchone()
+            return dict(row) if row else None
+    except Exception as e:
+        log.error("Error getting request profile: %s", e)
+        return None
+    finally:
+        conn.close()
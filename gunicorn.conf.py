@@ -0,0 +1,60 @@
+"""Gunicorn settings (loaded with `gunicorn -c gunicorn.conf.py app:app`).
+
+Requests spend nearly all their time waiting on Claude (tens of seconds for
+a scout analysis) or Postgres, so workers use gevent: each worker process
+serves up to GUNICORN_WORKER_CONNECTIONS requests concurrently as
+greenlets. gevent patches the standard library (sockets for httpx /
+Anthropic, threading for the background pool and log writer) as soon as
+this file is loaded, and psycogreen makes psycopg2 yield to other greenlets while
+it waits on the database instead of blocking the whole process.
+
+Environment:
+    WEB_CONCURRENCY               worker processes (default 2)
+    GUNICORN_WORKER_CLASS         "gevent" (default) or "sync" to fall back
+    GUNICORN_WORKER_CONNECTIONS   concurrent requests per gevent worker (default 200)
+    DB_MAX_CONNECTIONS            Postgres connections per worker (default 10, see database.py)
+    GUNICORN_PRELOAD              "on" (default): import the app once in the master and
+                                  fork workers from it; "off" imports it in every worker
+    METRICS_DIR                   where workers share their metrics (default: a fresh temp
+                                  directory per master, see metrics.py)
+
+With preload the master does the slow startup work (imports, the schema
+check) once, and workers boot and restart in milliseconds. Everything that
+must not be shared across fork is created lazily per process: the Claude
+client (llm.get_client), database connection slots, the background pools and
+the log writer thread.
+"""
+
+import os
+import glob
+import shutil
+import tempfile
+
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gevent")
+workers = int(os.environ.get("WEB_CONCURRENCY", "2"))
+worker_connections = int(os.environ.get("GUNICORN_WORKER_CONNECTIONS", "200"))
+timeout = 120
+graceful_timeout = 30
+keepalive = 5
+preload_app = os.environ.get("GUNICORN_PRELOAD", "on").lower() != "off"
+
+# Set before the app (and metrics.py) is imported, here or in the workers
+_own_metrics_dir = not os.environ.get("METRICS_DIR")
+if _own_metrics_dir:
+    os.environ["METRICS_DIR"] = tempfile.mkdtemp(prefix="celia-metrics-")
+for stale in glob.glob(os.path.join(os.environ["METRICS_DIR"], "*.json")):
+    os.remove(stale)  # a previous master's workers
+
+if worker_class == "gevent":
+    # Patch before gunicorn and the app import anything that captures the
+    # unpatched modules (e.g. selectors picking epoll, which gevent removes).
+    from gevent import monkey
+    monkey.patch_all()
+
+    from psycogreen.gevent import patch_psycopg
+    patch_psycopg()
+
+
+def on_exit(server):
+    if _own_metrics_dir:
+        shutil.rmtree(os.environ["METRICS_DIR"], ignore_errors=True)
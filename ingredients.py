@@ -0,0 +1,446 @@
+"""Local pre-screen of ingredient text, before (or instead of) a Claude analysis.
+
+Many labels are decidable without a model: "wheat flour" makes a product
+UNSAFE, and a certified gluten-free mark with nothing risky makes it SAFE.
+prescreen() matches ingredient text against a curated lexicon in one pass
+with an Aho-Corasick automaton (compiled once at import) and returns a
+verdict for the clear cases, in the same shape as ANALYSIS_PROMPT's JSON,
+or None when the text needs a model's judgement:
+
+    gluten source, no certification          -> UNSAFE
+    certified gluten-free, nothing risky     -> SAFE (MEDIUM confidence when
+                                                some items aren't in the
+                                                lexicon at all)
+    hidden risk or cross-contamination only  -> INVESTIGATE
+    anything else (nothing recognized, a certification that contradicts
+    a risky ingredient, or only ambiguous
+    mentions, see below)                     -> None: escalate
+
+Exceptions are lexicon entries too: a match inside a longer one is dropped,
+so "buckwheat", "gluten-free oats", "wheat-free" or "corn maltodextrin"
+don't count as the shorter term they contain. A risky term after a
+cross-contamination phrase in the same sentence ("processed in a facility
+that also handles wheat") makes that sentence a cross-contamination warning
+rather than an ingredient; the phrase alone ("may contain milk") is nothing.
+
+Some mentions of a risky term aren't ingredients at all, and are set aside
+as ambiguous rather than trusted either way:
+  - negated ones: after a negation in the same sentence ("contains no
+    wheat", "does not contain gluten", "free of barley"), or followed by
+    "free" / "not" in the same list item ("gluten and wheat free"). A
+    negation in parentheses only reaches the closing parenthesis, so
+    "wheat flour (not bromated)" is still wheat flour;
+  - "flour" after a word the lexicon doesn't know ("tigernut flour"), which
+    may well not be wheat;
+  - the word "gluten" on its own: labels use it to declare an amount
+    ("less than 20 ppm gluten", "Gluten: none", "0 mg gluten") as often as
+    an ingredient.
+A label whose only risky terms are ambiguous goes to Claude.
+
+Text comes from /api/check-ingredients (typed by the user) or from OCR of a
+label photo when pytesseract and the tesseract binary are installed. OCR can
+miss words, so for OCR text only UNSAFE is trusted: a missed "wheat" must
+never turn into a local SAFE.
+
+Environment:
+    LABEL_OCR   "off" disables OCR of label photos (default on when available)
+"""
+
+import os
+import re
+from io import BytesIO
+from bisect import bisect_left
+from itertools import accumulate
+from collections import deque
+
+from logging_config import get_logger
+from metrics import inc, span
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # optional dependency
+    Image = None
+
+try:
+    import pytesseract
+except ImportError:  # optional dependency
+    pytesseract = None
+
+log = get_logger("INGREDIENTS")
+
+LABEL_OCR = os.environ.get("LABEL_OCR", "on").lower() not in ("0", "off", "false")
+OCR_MAX_SIZE = 2000      # px, longest side
+OCR_MIN_WORDS = 5        # fewer recognized words than this: not an ingredient list
+MAX_INGREDIENT_TEXT = 5000
+
+GLUTEN = "gluten"
+HIDDEN = "hidden"
+CROSS_CONTAMINATION = "cross_contamination"
+CERTIFICATION = "certification"
+NEGATION = "negation"
+EXCEPTION = "exception"
+AMBIGUOUS = "ambiguous"  # not a lexicon kind: risky terms find_terms couldn't settle
+UNRECOGNIZED = "unrecognized"  # not a lexicon kind: list items with no lexicon term
+
+# Matched as whole words after normalize_text (lowercase, punctuation and
+# hyphens to spaces, "brewer's" -> "brewers"). Plain "flour" is wheat flour
+# under US labelling rules, but only plain: see _FLOUR_LEADS.
+LEXICON = {
+    GLUTEN: [
+        "wheat", "wheat flour", "whole wheat", "wheat starch", "wheat protein", "wheat germ",
+        "wheat bran", "hydrolyzed wheat protein", "vital wheat gluten", "gluten", "flour",
+        "enriched flour", "bleached flour", "unbleached flour", "all purpose flour", "white flour",
+        "bread flour", "cake flour", "pastry flour", "plain flour", "organic flour",
+        "whole grain flour", "graham", "graham flour", "self rising flour", "barley", "barley malt",
+        "barley flour", "pearl barley", "malted barley", "rye", "rye flour", "spelt", "kamut",
+        "khorasan", "triticale", "einkorn", "emmer", "farro", "durum", "semolina", "farina", "bulgur",
+        "couscous", "freekeh", "seitan", "malt", "malt extract", "malt syrup", "malt flavoring",
+        "malt flavouring", "malt vinegar", "malted milk", "brewers yeast", "matzo", "matzah", "panko",
+        "breadcrumbs", "bread crumbs", "orzo", "udon", "tabbouleh", "beer", "ale", "lager", "stout",
+        "dinkel", "triticum", "triticum aestivum", "triticum durum", "triticum spelta", "hordeum vulgare",
+        "secale cereale", "pretzel", "pretzels", "pretzel pieces", "cracker meal", "cracker crumbs",
+        "croutons", "wheat berries",
+    ],
+    HIDDEN: [
+        "oats", "oat", "oat flour", "rolled oats", "oatmeal", "modified food starch", "food starch",
+        "starch", "vegetable starch", "hydrolyzed vegetable protein", "hydrolyzed plant protein",
+        "textured vegetable protein", "natural flavor", "natural flavors", "natural flavour",
+        "natural flavours", "caramel color", "caramel colour", "dextrin", "maltodextrin", "soy sauce",
+        "shoyu", "teriyaki", "tamari", "miso", "seasoning", "seasonings", "spice blend",
+        "seasoning blend", "yeast extract", "brown rice syrup",
+    ],
+    # Start of a warning; it counts when a risky term follows in the same sentence
+    CROSS_CONTAMINATION: [
+        "may contain", "may also contain", "processed in a facility", "made in a facility",
+        "manufactured in a facility", "produced in a facility", "packaged in a facility",
+        "made on equipment", "made on shared equipment", "processed on shared equipment",
+        "shared equipment", "same equipment", "same facility", "same line", "traces of",
+        "cross contact", "cross contamination",
+    ],
+    # Start of a negation; risky terms after it in the same sentence don't count
+    NEGATION: [
+        "no", "not", "nor", "never", "without", "zero", "free of", "free from",
+    ],
+    CERTIFICATION: [
+        "certified gluten free", "gluten free certified", "gluten free certification", "gfco",
+        "csa certified", "crossed grain",
+    ],
+    # Longer terms that contain a risky one but aren't risky themselves
+    EXCEPTION: [
+        "buckwheat", "buckwheat flour", "gluten free", "wheat free", "oat free", "malt free",
+        "gluten free oats", "gluten free oat", "gluten free oat flour", "gluten free rolled oats",
+        "certified gluten free oats", "gluten free soy sauce", "gluten free tamari",
+        "tamari gluten free", "wheat free tamari", "gluten free beer", "gluten free flour",
+        "gluten free breadcrumbs", "gluten free panko", "gluten free seasoning", "gluten free pretzel",
+        "gluten free pretzels", "gluten free pretzel pieces", "gluten free cracker meal",
+        "gluten free croutons",
+        "corn starch", "cornstarch", "potato starch", "tapioca starch", "rice starch", "pea starch",
+        "arrowroot starch", "modified corn starch", "modified potato starch", "modified tapioca starch",
+        "modified food starch corn", "modified food starch potato", "modified food starch tapioca",
+        "corn maltodextrin", "maltodextrin corn", "tapioca maltodextrin", "corn dextrin",
+        "tapioca dextrin", "potato dextrin", "dextrin corn", "dextrin tapioca",
+        "rice flour", "corn flour", "almond flour", "coconut flour", "tapioca flour", "potato flour",
+        "chickpea flour", "sorghum flour", "cassava flour", "teff flour", "quinoa flour",
+        "millet flour", "amaranth flour", "banana flour", "lentil flour", "pea flour", "soy flour",
+        "bean flour", "chestnut flour", "hemp flour", "arrowroot flour", "flaxseed flour",
+        "rice malt", "corn malt", "ginger ale", "root beer",
+    ],
+}
+
+
+# ---------------------------------------------------------------------------
+# Aho-Corasick automaton
+# ---------------------------------------------------------------------------
+
+class Automaton:
+    """Multi-pattern matcher over normalized text. Patterns are padded with
+    spaces, so matches are whole words, and overlapping matches are all found."""
+
+    def __init__(self, patterns):
+        # patterns: {pattern: kind}
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [[]]  # state -> [(pattern, kind)] ending here
+        for pattern, kind in patterns.items():
+            state = 0
+            for char in f" {pattern} ":
+                if char not in self.goto[state]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append([])
+                    self.goto[state][char] = len(self.goto) - 1
+                state = self.goto[state][char]
+            self.out[state].append((pattern, kind))
+
+        # Failure links, breadth first (states one character deep fail to the root)
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in self.goto[state].items():
+                queue.append(child)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(char, 0)
+                self.out[child] = self.out[child] + self.out[self.fail[child]]
+
+    def find(self, text):
+        """(start, end, pattern, kind) for every match in padded normalized
+        text; text[start:end] is the pattern."""
+        matches = []
+        state = 0
+        for i, char in enumerate(text):
+            while state and char not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(char, 0)
+            for pattern, kind in self.out[state]:
+                matches.append((i - len(pattern), i, pattern, kind))
+        return matches
+
+
+_automaton = Automaton({pattern: kind for kind, patterns in LEXICON.items() for pattern in patterns})
+
+_SENTENCE_END = re.compile(r"\.(?!\d)|[;!?\n\r]")
+_PUNCTUATION = re.compile(r"[^a-z0-9.,()]+")
+_PARENTHETICAL = re.compile(r" \( .*?(?: \) |$)")
+_LIST_ITEM = re.compile(r"[^.,()]+")
+_TRAILING_NEGATION = {"free", "not"}  # "gluten and wheat free", "wheat is not used"
+# Declare an amount as often as an ingredient ("less than 20 ppm gluten")
+_DECLARATION_TERMS = {"gluten"}
+# Words that may come right before a plain "flour" that is still wheat flour
+_FLOUR_LEADS = {",", ".", "(", "ingredients", "contains", "and", "or", "with", "of"}
+_ITEM_LEADS = {"ingredients", "ingredient", "contains", "and", "or"}
+
+
+def normalize_text(text):
+    """Lowercase words separated by single spaces, with " . " at sentence ends,
+    " , " between list items and " ( " / " ) " around parenthesized text,
+    padded with spaces (the form the automaton matches)."""
+    text = text.lower().replace("'", "").replace("\u2019", "")
+    text = _SENTENCE_END.sub(" . ", text).replace(",", " , ")
+    text = text.replace("[", "(").replace("]", ")").replace("(", " ( ").replace(")", " ) ")
+    return f" {' '.join(_PUNCTUATION.sub(' ', text).split())} "
+
+
+def _scope_end(normalized, pos):
+    """Where the scope of a warning or negation ending at `pos` stops: the end
+    of the sentence, or the closing parenthesis when it is inside one."""
+    stop = normalized.find(" . ", pos)
+    stop = len(normalized) - 1 if stop < 0 else stop
+    close = normalized.find(" ) ", pos, stop)
+    if close >= 0 and normalized.find(" ( ", pos, close) < 0:
+        return close
+    return stop
+
+
+def _is_negated(normalized, start, end, negations):
+    """Whether the risky term at normalized[start:end] is negated: inside a
+    negation's scope, or followed by "free" / "not" before its item ends.
+    Parenthesized text after the term describes it ("wheat flour (not
+    bromated)") and is skipped."""
+    if any(s <= start < e for s, e in negations):
+        return True
+    stops = [i for i in (normalized.find(" , ", end), normalized.find(" . ", end),
+                         normalized.find(" ) ", end)) if i >= 0]
+    tail = _PARENTHETICAL.sub(" ", normalized[end:min(stops, default=len(normalized))])
+    return not _TRAILING_NEGATION.isdisjoint(tail.split())
+
+
+def _word_before(normalized, start):
+    """The token just before normalized[start:], or "" at the start."""
+    return normalized[normalized.rfind(" ", 0, start - 1) + 1:start - 1]
+
+
+def find_terms(text):
+    """Lexicon matches in ingredient text as {kind: [term, ...]} (each term
+    once, in order), after exceptions, negations and cross-contamination
+    warnings are applied. Cross-contamination entries are the warning's
+    words, e.g. "processed in a facility that also processes wheat";
+    AMBIGUOUS holds risky terms that were negated, an unknown flour or a bare
+    "gluten"; UNRECOGNIZED holds list items with no lexicon term at all (only
+    filled in for text with a certification)."""
+    normalized = normalize_text(text)
+    matches = _automaton.find(normalized)
+
+    # Drop a match inside a longer one ("buckwheat" hides "wheat")
+    kept = [m for m in matches
+            if not any(o[0] <= m[0] and m[1] <= o[1] and o[1] - o[0] > m[1] - m[0] for o in matches)]
+
+    # A warning or negation runs from its phrase to the end of the sentence
+    warnings, negations = [], []
+    for start, end, _, kind in kept:
+        if kind == CROSS_CONTAMINATION:
+            warnings.append((start, _scope_end(normalized, end)))
+        elif kind == NEGATION:
+            negations.append((start, _scope_end(normalized, end)))
+
+    found = {GLUTEN: [], HIDDEN: [], CROSS_CONTAMINATION: [], CERTIFICATION: [], AMBIGUOUS: [],
+             UNRECOGNIZED: []}
+    for start, end, pattern, kind in sorted(kept):
+        if kind in (EXCEPTION, CROSS_CONTAMINATION, NEGATION):
+            continue
+        warning = next(((s, e) for s, e in warnings if s <= start < e), None)
+        if kind in (GLUTEN, HIDDEN) and _is_negated(normalized, start, end, negations):
+            kind = AMBIGUOUS
+        elif warning and kind in (GLUTEN, HIDDEN):
+            kind, pattern = CROSS_CONTAMINATION, normalized[warning[0]:warning[1]]
+        elif pattern == "flour" and _word_before(normalized, start) not in _FLOUR_LEADS | {""}:
+            kind, pattern = AMBIGUOUS, f"{_word_before(normalized, start)} flour"
+        elif pattern in _DECLARATION_TERMS:
+            kind = AMBIGUOUS
+        if pattern not in found[kind]:
+            found[kind].append(pattern)
+
+    if found[CERTIFICATION]:  # only a certified verdict looks at them
+        found[UNRECOGNIZED] = _unrecognized_items(normalized, kept)
+    return found
+
+
+def _unrecognized_items(normalized, matches):
+    """List items in normalized text that no match overlaps."""
+    # furthest_end[i]: the furthest end among the first i + 1 matches by start
+    spans = sorted((start, end) for start, end, _, _ in matches)
+    starts = [start for start, _ in spans]
+    furthest_end = list(accumulate((end for _, end in spans), max))
+    items = []
+    for item in _LIST_ITEM.finditer(normalized):
+        item_start, item_end = item.span()
+        before = bisect_left(starts, item_end)
+        if before and furthest_end[before - 1] > item_start:
+            continue
+        words = item.group().split()
+        while words and words[0] in _ITEM_LEADS:
+            words.pop(0)
+        if any(word.isalpha() for word in words):
+            items.append(" ".join(words))
+    return items
+
+
+def split_ingredients(text):
+    """Top-level comma-separated items of an ingredient list (commas inside
+    parentheses stay with their item)."""
+    text = re.sub(r"^\s*ingredients?\s*:\s*", "", text.strip(), flags=re.IGNORECASE)
+    items, depth, current = [], 0, []
+    for char in text:
+        if char in "([":
+            depth += 1
+        elif char in ")]":
+            depth = max(0, depth - 1)
+        if char in ",;\n" and depth == 0:
+            items.append("".join(current))
+            current = []
+        else:
+            current.append(char)
+    items.append("".join(current))
+    return [" ".join(item.split()).strip(" .") for item in items if item.strip(" .")][:200]
+
+
+# ---------------------------------------------------------------------------
+# Pre-screen
+# ---------------------------------------------------------------------------
+
+def _and_list(terms, limit=3):
+    """"a", "a and b", "a, b and c", "a, b, c and 2 more"."""
+    if len(terms) > limit:
+        terms = terms[:limit] + [f"{len(terms) - limit} more"]
+    return terms[0] if len(terms) == 1 else f"{', '.join(terms[:-1])} and {terms[-1]}"
+
+
+def _analysis(verdict, confidence, summary, reasoning, text, found, product_name):
+    return {
+        "product_name": product_name or "Unknown Product",
+        "verdict": verdict,
+        "confidence": confidence,
+        "summary": summary,
+        "ingredients_found": split_ingredients(text),
+        "gluten_sources": found[GLUTEN],
+        "hidden_risks": found[HIDDEN],
+        "cross_contamination": found[CROSS_CONTAMINATION],
+        "certifications": found[CERTIFICATION],
+        "detailed_reasoning": reasoning,
+        "decided_by": "rules",
+    }
+
+
+def prescreen(text, source="typed", product_name=""):
+    """A local verdict for ingredient text (label-analysis JSON shape), or
+    None when it should go to Claude. `source` is "typed" or "ocr"; OCR text
+    only ever gets a local UNSAFE. Ambiguous mentions (see find_terms) never
+    decide a verdict: with nothing else risky the text escalates."""
+    with span("ingredients.prescreen"):
+        found = find_terms(text)
+    gluten, hidden, warnings, certified, ambiguous = (
+        found[GLUTEN], found[HIDDEN], found[CROSS_CONTAMINATION], found[CERTIFICATION], found[AMBIGUOUS])
+
+    analysis = None
+    if gluten and not certified:
+        listed = _and_list(gluten)
+        analysis = _analysis(
+            "UNSAFE", "HIGH",
+            # "Contains vital wheat gluten.", not "..., which contains gluten."
+            f"Contains {listed}." if "gluten" in listed.split() else
+            f"Contains {listed}, which {'contains' if len(gluten) == 1 else 'contain'} gluten.",
+            f"The ingredients list {_and_list(gluten, limit=len(gluten))}, "
+            f"{'a gluten source' if len(gluten) == 1 else 'all gluten sources'} for someone with celiac disease.",
+            text, found, product_name)
+    elif source == "typed" and not gluten and not ambiguous and certified and not hidden and not warnings:
+        # An item the lexicon doesn't know could be a grain it lacks
+        unrecognized = found[UNRECOGNIZED]
+        analysis = _analysis(
+            "SAFE", "MEDIUM" if unrecognized else "HIGH", "Certified gluten-free with no risky ingredients.",
+            f"The label carries a gluten-free certification ({', '.join(certified)}) and no gluten "
+            "sources, hidden risks or cross-contamination warnings were found."
+            + (f" {_and_list(unrecognized).capitalize()} {'is' if len(unrecognized) == 1 else 'are'} not in "
+               "the ingredient lexicon, so this relies on the certification." if unrecognized else ""),
+            text, found, product_name)
+    elif source == "typed" and not gluten and not ambiguous and not certified and (hidden or warnings):
+        analysis = _analysis(
+            "INVESTIGATE", "MEDIUM",
+            "No obvious gluten, but some ingredients or warnings need checking with the manufacturer.",
+            "No gluten sources were found, but "
+            + "; ".join(part for part in (
+                f"the source of {', '.join(hidden)} isn't stated" if hidden else "",
+                f"the label warns: {', '.join(warnings)}" if warnings else "",
+            ) if part) + ".",
+            text, found, product_name)
+
+    inc("celia_prescreen_total", source=source, result=analysis["verdict"].lower() if analysis else "escalated")
+    return analysis
+
+
+# ---------------------------------------------------------------------------
+# OCR
+# ---------------------------------------------------------------------------
+
+_ocr_available = None
+
+
+def ocr_available():
+    """pytesseract, Pillow and the tesseract binary are all installed (checked once)."""
+    global _ocr_available
+    if _ocr_available is None:
+        _ocr_available = False
+        if LABEL_OCR and pytesseract is not None and Image is not None:
+            try:
+                pytesseract.get_tesseract_version()
+                _ocr_available = True
+            except Exception as e:
+                log.info("Label OCR unavailable: %s", e)
+    return _ocr_available
+
+
+def ocr_text(image_bytes):
+    """Text read from a label photo, or None (no OCR, or too little text)."""
+    if not ocr_available():
+        return None
+    try:
+        with span("ingredients.ocr"):
+            with Image.open(BytesIO(image_bytes)) as image:
+                image.draft("L", (OCR_MAX_SIZE, OCR_MAX_SIZE))
+                image = ImageOps.exif_transpose(image).convert("L")
+                image.thumbnail((OCR_MAX_SIZE, OCR_MAX_SIZE))
+                text = pytesseract.image_to_string(image)
+    except Exception as e:
+        log.warning("Label OCR failed: %s", e)
+        return None
+    return text if len(re.findall(r"[A-Za-z]{3,}", text)) >= OCR_MIN_WORDS else None
@@ -0,0 +1,194 @@
+"""Single entry point for Claude API calls.
+
+Every `messages.create` in the app goes through create_message() so each
+call is timed as a dependency span, its token / web search usage is counted
+per endpoint, and a usage row (tokens, searches, latency, cost) is queued for
+the llm_usage table. Rows are written in batches by a background thread so
+the request never waits on the insert.
+
+The client is created lazily, once per process (see get_client).
+LLM_MODE=record / replay swaps it for llm_fixtures.FixtureClient, which
+saves or replays request / response pairs instead of (only) calling the API.
+"""
+
+import os
+import time
+import queue
+import atexit
+import threading
+from datetime import datetime, timezone
+
+from anthropic import Anthropic
+
+from database import insert_llm_usage
+from logging_config import get_logger
+from metrics import span, inc
+
+log = get_logger("LLM")
+
+LLM_MODE = os.environ.get("LLM_MODE", "live").lower()
+
+if LLM_MODE not in ("live", "record", "replay"):
+    raise ValueError(f"LLM_MODE must be live, record or replay, not {LLM_MODE!r}")
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """The Claude client for this process, created on first use and again
+    after a fork: its HTTP connection pool must not be shared with a
+    preloaded gunicorn master or sibling workers."""
+    global _client, _client_pid
+    if _client_pid != os.getpid():
+        with _client_lock:
+            if _client_pid != os.getpid():
+                if LLM_MODE == "live":
+                    _client = Anthropic()
+                else:
+                    from llm_fixtures import FixtureClient
+                    _client = FixtureClient(LLM_MODE, Anthropic)
+                _client_pid = os.getpid()
+    return _client
+
+# USD per million tokens: (input, output, cache write, cache read)
+MODEL_PRICING = {
+    "claude-sonnet-4-20250514": (3.00, 15.00, 3.75, 0.30),
+    "claude-haiku-4-5-20250929": (1.00, 5.00, 1.25, 0.10),
+}
+DEFAULT_PRICING = MODEL_PRICING["claude-sonnet-4-20250514"]
+WEB_SEARCH_COST = 0.01  # USD per search ($10 / 1,000)
+
+USAGE_BATCH_SIZE = 50
+USAGE_FLUSH_INTERVAL = 5  # seconds
+
+_usage_queue = queue.Queue(maxsize=10000)
+_writer_pid = None
+_writer_lock = threading.Lock()
+
+
+def _get(obj, name, default=0):
+    """Read a usage field from either an SDK object or a plain dict."""
+    if obj is None:
+        return default
+    if isinstance(obj, dict):
+        return obj.get(name, default) or default
+    return getattr(obj, name, default) or default
+
+
+def usage_counts(message):
+    """Return token and web search counts for a Claude response as a dict."""
+    usage = getattr(message, "usage", None)
+    server_tool_use = _get(usage, "server_tool_use", None)
+    web_searches = _get(server_tool_use, "web_search_requests", 0)
+    if not web_searches:
+        # Older SDKs drop server_tool_use from usage; count the blocks instead
+        web_searches = sum(1 for b in getattr(message, "content", []) or []
+                           if getattr(b, "type", None) == "server_tool_use")
+    return {
+        "input_tokens": _get(usage, "input_tokens"),
+        "output_tokens": _get(usage, "output_tokens"),
+        "cache_creation_input_tokens": _get(usage, "cache_creation_input_tokens"),
+        "cache_read_input_tokens": _get(usage, "cache_read_input_tokens"),
+        "web_searches": web_searches,
+    }
+
+
+def estimate_cost(model, counts):
+    """Estimated USD cost of one call from its usage counts."""
+    price_in, price_out, price_write, price_read = MODEL_PRICING.get(model, DEFAULT_PRICING)
+    return (
+        counts["input_tokens"] * price_in
+        + counts["output_tokens"] * price_out
+        + counts["cache_creation_input_tokens"] * price_write
+        + counts["cache_read_input_tokens"] * price_read
+    ) / 1_000_000 + counts["web_searches"] * WEB_SEARCH_COST
+
+
+def create_message(endpoint, user_id=None, ip_address=None, **kwargs):
+    """Call client.messages.create(**kwargs), recording latency under
+    claude.<endpoint>, token / web search counters labelled by endpoint, and a
+    queued llm_usage row attributed to `user_id` / `ip_address`."""
+    model = kwargs.get("model", "")
+    start = time.perf_counter()
+    with span(f"claude.{endpoint}"):
+        message = get_client().messages.create(**kwargs)
+    latency_ms = int((time.perf_counter() - start) * 1000)
+
+    counts = usage_counts(message)
+    for kind in ("input_tokens", "output_tokens", "cache_creation_input_tokens", "cache_read_input_tokens"):
+        inc("celia_llm_tokens_total", counts[kind], endpoint=endpoint, model=model, kind=kind)
+    inc("celia_llm_web_searches_total", counts["web_searches"], endpoint=endpoint, model=model)
+    inc("celia_llm_calls_total", endpoint=endpoint, model=model)
+
+    record_usage({
+        "created_at": datetime.now(timezone.utc).replace(tzinfo=None),
+        "endpoint": endpoint,
+        "model": model,
+        "user_id": user_id,
+        "ip_address": ip_address,
+        "input_tokens": counts["input_tokens"],
+        "output_tokens": counts["output_tokens"],
+        "cache_creation_tokens": counts["cache_creation_input_tokens"],
+        "cache_read_tokens": counts["cache_read_input_tokens"],
+        "web_searches": counts["web_searches"],
+        "latency_ms": latency_ms,
+        "cost_micros": int(round(estimate_cost(model, counts) * 1_000_000)),
+    })
+    return message
+
+
+# ---------------------------------------------------------------------------
+# Batched usage writer
+# ---------------------------------------------------------------------------
+
+def record_usage(row):
+    """Queue one llm_usage row for the background writer. Never blocks."""
+    _ensure_writer()
+    try:
+        _usage_queue.put_nowait(row)
+    except queue.Full:
+        log.warning("LLM usage queue full, dropping row for %s", row.get("endpoint"))
+
+
+def _ensure_writer():
+    """Start the writer thread once per process (after a fork too)."""
+    global _writer_pid
+    if _writer_pid == os.getpid():
+        return
+    with _writer_lock:
+        if _writer_pid == os.getpid():
+            return
+        threading.Thread(target=_usage_writer, name="llm-usage-writer", daemon=True).start()
+        _writer_pid = os.getpid()
+
+
+def _usage_writer():
+    while True:
+        batch = [_usage_queue.get()]
+        deadline = time.monotonic() + USAGE_FLUSH_INTERVAL
+        while len(batch) < USAGE_BATCH_SIZE:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(_usage_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        insert_llm_usage(batch)
+
+
+def flush_usage():
+    """Write any queued usage rows now (used at exit by scripts)."""
+    batch = []
+    while True:
+        try:
+            batch.append(_usage_queue.get_nowait())
+        except queue.Empty:
+            break
+    if batch:
+        insert_llm_usage(batch)
+
+
+atexit.register(flush_usage)
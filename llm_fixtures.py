@@ -0,0 +1,176 @@
+"""Record / replay of Claude calls, for working on the app offline.
+
+LLM_MODE selects the client llm.get_client() returns, and so how every
+llm.create_message() call reaches Claude:
+
+    live    (default) call the API
+    record  call the API and save each request / response pair
+    replay  answer from saved pairs only, without the API
+
+Pairs are keyed by a hash of the normalized request (model, system prompt,
+tools and messages, with whitespace collapsed and image data replaced by its
+digest; max_tokens is left out), so the same search or scan replays the
+same answer. Each pair is a gzipped JSON file under LLM_FIXTURES_DIR
+holding the full response (web search blocks and usage included) and the
+latency it was recorded with.
+
+Replay settings:
+    LLM_REPLAY_LATENCY_SCALE   sleep this multiple of the recorded latency
+                               (default 0: answer immediately)
+    LLM_REPLAY_EXTRA_LATENCY   seconds added to every call, to simulate a
+                               slow upstream (default 0)
+    LLM_REPLAY_MISS            "error" (default) raises FixtureMissing for an
+                               unrecorded request; "record" calls the API and
+                               records it
+"""
+
+import os
+import gzip
+import json
+import time
+import hashlib
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+from logging_config import get_logger
+from metrics import inc
+
+log = get_logger("LLM-FIXTURES")
+
+LLM_MODES = ("live", "record", "replay")
+DEFAULT_FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks", "llm_fixtures")
+
+
+class FixtureMissing(LookupError):
+    """Replay mode got a request that was never recorded."""
+
+    def __init__(self, key, model):
+        super().__init__(f"No recorded Claude response for request {key} ({model}); "
+                         f"record it with LLM_MODE=record or set LLM_REPLAY_MISS=record")
+        self.key = key
+
+
+def _normalize(value):
+    if isinstance(value, str):
+        return " ".join(value.split())
+    if isinstance(value, list):
+        return [_normalize(v) for v in value]
+    if isinstance(value, dict):
+        if value.get("type") == "base64" and isinstance(value.get("data"), str):
+            digest = hashlib.sha256(value["data"].encode("ascii")).hexdigest()
+            return {**value, "data": f"sha256:{digest}"}
+        return {k: _normalize(v) for k, v in value.items()}
+    return value
+
+
+def normalize_request(kwargs):
+    """The parts of a messages.create call that decide the answer, in canonical form."""
+    return {
+        "model": kwargs.get("model"),
+        "system": _normalize(kwargs.get("system")),
+        "tools": _normalize(kwargs.get("tools")),
+        "messages": _normalize(kwargs.get("messages")),
+    }
+
+
+def request_key(kwargs):
+    canonical = json.dumps(normalize_request(kwargs), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:32]
+
+
+def _to_namespace(value):
+    """Rebuild attribute access (message.content[0].text) over a recorded dict."""
+    if isinstance(value, dict):
+        return SimpleNamespace(**{k: _to_namespace(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return [_to_namespace(v) for v in value]
+    return value
+
+
+def _dump_message(message):
+    if hasattr(message, "model_dump"):
+        # Older SDKs type web search blocks loosely; the dump is still complete
+        return message.model_dump(mode="json", exclude_none=True, warnings=False)
+    return json.loads(json.dumps(message, default=lambda o: vars(o)))
+
+
+class FixtureStore:
+    """Recorded pairs on disk: <dir>/<key[:2]>/<key>.json.gz."""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.json.gz")
+
+    def load(self, key):
+        try:
+            with gzip.open(self.path(key), "rt", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def save(self, key, fixture):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8", compresslevel=9) as f:
+            json.dump(fixture, f, separators=(",", ":"))
+        os.replace(tmp_path, path)
+
+
+class _Messages:
+    def __init__(self, owner):
+        self._owner = owner
+
+    def create(self, **kwargs):
+        return self._owner.create(**kwargs)
+
+
+class FixtureClient:
+    """What llm.get_client() returns in record / replay mode, in place of
+    Anthropic(): `messages.create(**kwargs)` records or replays instead of
+    (only) calling the API."""
+
+    def __init__(self, mode, live_client_factory, directory=None):
+        self.mode = mode
+        self.store = FixtureStore(directory or os.environ.get("LLM_FIXTURES_DIR") or DEFAULT_FIXTURES_DIR)
+        self.latency_scale = float(os.environ.get("LLM_REPLAY_LATENCY_SCALE", "0"))
+        self.extra_latency = float(os.environ.get("LLM_REPLAY_EXTRA_LATENCY", "0"))
+        self.record_misses = os.environ.get("LLM_REPLAY_MISS", "error") == "record"
+        self._live_client_factory = live_client_factory
+        self._live_client = None
+        self.messages = _Messages(self)
+        log.info("Claude calls in %s mode (fixtures: %s)", mode, self.store.directory)
+
+    def create(self, **kwargs):
+        key = request_key(kwargs)
+        if self.mode == "replay":
+            fixture = self.store.load(key)
+            if fixture is not None:
+                inc("celia_llm_fixture_total", result="hit")
+                delay = fixture.get("latency_ms", 0) / 1000 * self.latency_scale + self.extra_latency
+                if delay > 0:
+                    time.sleep(delay)
+                return _to_namespace(fixture["response"])
+            inc("celia_llm_fixture_total", result="miss")
+            if not self.record_misses:
+                raise FixtureMissing(key, kwargs.get("model"))
+        return self._record(key, kwargs)
+
+    def _record(self, key, kwargs):
+        if self._live_client is None:
+            self._live_client = self._live_client_factory()
+        start = time.perf_counter()
+        message = self._live_client.messages.create(**kwargs)
+        latency_ms = int((time.perf_counter() - start) * 1000)
+        self.store.save(key, {
+            "key": key,
+            "recorded_at": datetime.now(timezone.utc).isoformat(),
+            "latency_ms": latency_ms,
+            "request": normalize_request(kwargs),
+            "response": _dump_message(message),
+        })
+        inc("celia_llm_fixture_total", result="recorded")
+        log.debug("Recorded %s (%s, %d ms)", key, kwargs.get("model"), latency_ms)
+        return message
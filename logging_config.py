@@ -0,0 +1,172 @@
+"""Structured, leveled logging for the app.
+
+Log records are handed to a QueueHandler and written by a background
+QueueListener, so request threads never block on stdout. Production runs at
+LOG_LEVEL=INFO; a single request can opt into DEBUG output by sending the
+X-Celia-Debug header (admin session or local debug server only).
+
+Environment:
+    LOG_LEVEL          INFO (default), DEBUG, WARNING, ...
+    LOG_FORMAT         "json" (default) or "text"
+    DEBUG_SAMPLE_RATE  fraction of verbose dumps (raw responses, per-row output)
+                       logged when running at DEBUG (default 0.01)
+"""
+
+import os
+import sys
+import json
+import queue
+import random
+import atexit
+import threading
+import logging
+import logging.handlers
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+DEBUG_HEADER = "X-Celia-Debug"
+
+# Per-request override: True when the current request asked for DEBUG output
+_request_debug = ContextVar("celia_request_debug", default=False)
+
+_listener = None
+_listener_pid = None
+_listener_lock = threading.Lock()
+_stream = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, tag, msg plus any `extra` fields."""
+
+    _reserved = set(vars(logging.makeLogRecord({})).keys()) | {"message", "asctime", "tag"}
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "tag": getattr(record, "tag", record.name),
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in self._reserved and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Human-readable format matching the old "[TAG] message" prints."""
+
+    def format(self, record):
+        line = f"{record.levelname:<7} [{getattr(record, 'tag', record.name)}] {record.getMessage()}"
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+class TagLogger(logging.LoggerAdapter):
+    """Logger for one subsystem tag (SCOUT, CACHE, DB, ...).
+
+    DEBUG is emitted when the process runs at DEBUG *or* the current request
+    enabled debug via header. `verbose()` is for large dumps (raw responses,
+    per-row output): at process-level DEBUG it is sampled, per-request debug
+    always gets it.
+    """
+
+    def __init__(self, logger, tag):
+        super().__init__(logger, {"tag": tag})
+
+    def isEnabledFor(self, level):
+        if level < logging.INFO and _request_debug.get():
+            return True
+        return self.logger.isEnabledFor(level)
+
+    def log(self, level, msg, *args, **kwargs):
+        if self.isEnabledFor(level):
+            msg, kwargs = self.process(msg, kwargs)
+            # Bypass the underlying logger's level check so per-request debug works
+            self.logger._log(level, msg, args, **kwargs)
+
+    def process(self, msg, kwargs):
+        extra = dict(self.extra)
+        extra.update(kwargs.get("extra") or {})
+        kwargs["extra"] = extra
+        return msg, kwargs
+
+    def verbose(self, msg, *args, **kwargs):
+        if _request_debug.get():
+            self.log(logging.DEBUG, msg, *args, **kwargs)
+        elif self.logger.isEnabledFor(logging.DEBUG) and random.random() < _sample_rate():
+            self.log(logging.DEBUG, msg, *args, **kwargs)
+
+
+def _sample_rate():
+    try:
+        return float(os.environ.get("DEBUG_SAMPLE_RATE", "0.01"))
+    except ValueError:
+        return 0.01
+
+
+def get_logger(tag):
+    """Return the logger for a subsystem tag, e.g. get_logger("SCOUT")."""
+    return TagLogger(logging.getLogger(f"celia.{tag.lower()}"), tag)
+
+
+class _ForkSafeQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that starts a fresh listener in a forked child: the
+    listener thread doesn't survive fork (e.g. gunicorn's preload_app)."""
+
+    def enqueue(self, record):
+        if _listener_pid != os.getpid():
+            _start_listener(self)
+        super().enqueue(record)
+
+
+def _start_listener(handler):
+    global _listener, _listener_pid
+    with _listener_lock:
+        if _listener_pid == os.getpid():
+            return
+        handler.queue = queue.SimpleQueue()
+        _listener = logging.handlers.QueueListener(handler.queue, _stream, respect_handler_level=False)
+        _listener.start()
+        _listener_pid = os.getpid()
+
+
+def _stop_listener():
+    if _listener is not None and _listener_pid == os.getpid():
+        _listener.stop()
+
+
+def configure_logging():
+    """Install the queue handler on the "celia" logger. Safe to call twice."""
+    global _stream
+    if _listener is not None:
+        return
+
+    root = logging.getLogger("celia")
+    root.setLevel(os.environ.get("LOG_LEVEL", "INFO").upper())
+    root.propagate = False
+
+    _stream = logging.StreamHandler(sys.stdout)
+    if os.environ.get("LOG_FORMAT", "json").lower() == "text":
+        _stream.setFormatter(TextFormatter())
+    else:
+        _stream.setFormatter(JsonFormatter())
+
+    handler = _ForkSafeQueueHandler(queue.SimpleQueue())
+    root.handlers = [handler]
+    _start_listener(handler)
+    atexit.register(_stop_listener)
+
+
+def enable_request_debug():
+    """Turn on DEBUG output for the rest of the current request.
+    Returns a token for reset_request_debug."""
+    return _request_debug.set(True)
+
+
+def reset_request_debug(token):
+    if token is not None:
+        _request_debug.reset(token)
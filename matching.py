@@ -0,0 +1,378 @@
+"""Map many spellings of a restaurant to one cached entry.
+
+Cache keys are exact after normalize_name / normalize_location, so
+"Zahav Restaurant" + "Philadelphia, PA" misses "zahav" + "philadelphia".
+This module sits behind the exact lookup:
+
+1. exact key (database.get_cached_restaurant)
+2. learned alias (restaurant_aliases table, mirrored in memory)
+3. fuzzy match: trigram similarity over canonical names within the same
+   canonical location, using an in-process index
+
+The index holds (id, name, location, score) for every cached restaurant and
+is rebuilt in the background every MATCH_INDEX_TTL seconds; new results are
+added to it as they are cached.
+
+Serving another restaurant's celiac report is far worse than a cache miss,
+so a fuzzy match is only served when it is close (MATCH_THRESHOLD) and the
+names have the same distinguishing words, allowing a one-letter typo in
+longer words: "Vetri Cuccina" finds "Vetri Cucina", but "Thai Kitchen
+Express" does not find "Thai Kitchen". A weaker or extra-word match is only
+a suggestion the user has to confirm. Aliases are written on confirmation only (the user
+accepting a suggestion, or Claude's official name for a researched
+restaurant), never by the lookup itself.
+"""
+
+import re
+import time
+import threading
+from collections import defaultdict
+
+from background import submit_once
+from database import (
+    normalize_name, normalize_location,
+    get_cached_restaurant, get_cached_restaurant_by_id, get_cached_restaurants,
+    get_restaurant_match_rows, get_restaurant_aliases, add_restaurant_alias, get_restaurant_id,
+)
+from logging_config import get_logger
+from metrics import inc
+
+log = get_logger("MATCH")
+
+MATCH_THRESHOLD = 0.85   # minimum similarity to serve a fuzzy match (same words too)
+SUGGEST_THRESHOLD = 0.7  # minimum similarity to suggest a match for confirmation
+MATCH_INDEX_TTL = 600    # seconds between background index rebuilds
+
+CITY_ALIASES = {
+    "philly": "philadelphia",
+    "phila": "philadelphia",
+    "nyc": "new york",
+    "new york city": "new york",
+    "manhattan": "new york",
+    "la": "los angeles",
+    "sf": "san francisco",
+    "dc": "washington",
+    "washington dc": "washington",
+    "nola": "new orleans",
+    "vegas": "las vegas",
+    "atl": "atlanta",
+    "chi": "chicago",
+}
+
+US_STATES = {
+    "al", "ak", "az", "ar", "ca", "co", "ct", "de", "fl", "ga", "hi", "id", "il", "in", "ia",
+    "ks", "ky", "la", "me", "md", "ma", "mi", "mn", "ms", "mo", "mt", "ne", "nv", "nh", "nj",
+    "nm", "ny", "nc", "nd", "oh", "ok", "or", "pa", "ri", "sc", "sd", "tn", "tx", "ut", "vt",
+    "va", "wa", "wv", "wi", "wy", "dc",
+    "alabama", "alaska", "arizona", "arkansas", "california", "colorado", "connecticut",
+    "delaware", "florida", "georgia", "hawaii", "idaho", "illinois", "indiana", "iowa",
+    "kansas", "kentucky", "louisiana", "maine", "maryland", "massachusetts", "michigan",
+    "minnesota", "mississippi", "missouri", "montana", "nebraska", "nevada", "new hampshire",
+    "new jersey", "new mexico", "new york state", "north carolina", "north dakota", "ohio",
+    "oklahoma", "oregon", "pennsylvania", "rhode island", "south carolina", "south dakota",
+    "tennessee", "texas", "utah", "vermont", "virginia", "washington state", "west virginia",
+    "wisconsin", "wyoming", "usa", "us", "united states",
+}
+
+# Words that don't distinguish one restaurant from another
+GENERIC_NAME_WORDS = {"the", "restaurant", "restaurants", "eatery"}
+
+_STRIP_PUNCT = re.compile(r"[^\w\s]")
+
+
+def canonical_location(location):
+    """Reduce a location to a city key: "Reading Terminal Market, Philadelphia, PA"
+    -> "philadelphia", "Philly" -> "philadelphia"."""
+    loc = normalize_location(location)
+    if not loc:
+        return ""
+    parts = [" ".join(_STRIP_PUNCT.sub(" ", p).split()) for p in loc.split(",")]
+    parts = [p for p in parts if p]
+    # Drop trailing state / country components
+    while len(parts) > 1 and parts[-1] in US_STATES:
+        parts.pop()
+    city = parts[-1] if parts else ""
+    # "philadelphia pa" (no comma)
+    words = city.split()
+    if len(words) > 1 and words[-1] in US_STATES:
+        city = " ".join(words[:-1])
+    return CITY_ALIASES.get(city, city)
+
+
+def canonical_name(name, location=""):
+    """Reduce a restaurant name to its distinguishing words: drop generic words
+    and any words naming the location ("Zahav Philly" -> "zahav")."""
+    base = " ".join(_STRIP_PUNCT.sub(" ", normalize_name(name)).split())
+    city = canonical_location(location)
+    location_words = set(city.split())
+    location_words.update(alias for alias, target in CITY_ALIASES.items() if target == city)
+    words = [w for w in base.split() if w not in GENERIC_NAME_WORDS and w not in location_words]
+    return " ".join(words) or base
+
+
+def trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _within_one_edit(a, b):
+    """True if a and b differ by at most one insertion, deletion or substitution."""
+    if abs(len(a) - len(b)) > 1:
+        return False
+    if len(a) > len(b):
+        a, b = b, a
+    i = 0
+    while i < len(a) and a[i] == b[i]:
+        i += 1
+    # Skip the one differing character in b (insertion) or in both (substitution)
+    return a[i:] == b[i + 1:] or (len(a) == len(b) and a[i + 1:] == b[i + 1:])
+
+
+def same_words(name, other):
+    """True if two canonical names have the same distinguishing words, in any
+    order, allowing a one-letter typo in words of 5+ letters. An extra word on
+    either side ("express", "bar", "2") means a possibly different restaurant."""
+    words, other_words = name.split(), other.split()
+    if len(words) != len(other_words):
+        return False
+    unmatched = list(other_words)
+    for word in words:
+        for candidate in unmatched:
+            if word == candidate or (min(len(word), len(candidate)) >= 4
+                                     and max(len(word), len(candidate)) >= 5
+                                     and _within_one_edit(word, candidate)):
+                unmatched.remove(candidate)
+                break
+        else:
+            return False
+    return True
+
+
+class MatchIndex:
+    """Trigram postings per canonical location over canonical restaurant names
+    and learned aliases. Similarity is the Dice coefficient over character
+    trigrams (1.0 = identical)."""
+
+    def __init__(self, rows=(), aliases=()):
+        self.spellings = []   # spelling no. -> (restaurant_id, canonical name, trigrams)
+        self.postings = defaultdict(lambda: defaultdict(set))  # city -> trigram -> spelling nos.
+        self.scores = {}      # restaurant_id -> safety_score
+        self.aliases = {}     # (canonical name, canonical location) -> restaurant_id
+        self.built_at = time.monotonic()
+        self._lock = threading.Lock()
+        for row in rows:
+            self.add(row["id"], row["name"], row["location"], row.get("safety_score"))
+        for alias in aliases:
+            self.add_alias(alias["alias_name"], alias["alias_location"], alias["restaurant_id"])
+
+    def _add_spelling(self, restaurant_id, name, location):
+        city = canonical_location(location)
+        canonical = canonical_name(name, location)
+        grams = trigrams(canonical)
+        with self._lock:
+            number = len(self.spellings)
+            self.spellings.append((restaurant_id, canonical, grams))
+            for gram in grams:
+                self.postings[city][gram].add(number)
+
+    def add(self, restaurant_id, name, location, safety_score=None):
+        self.scores[restaurant_id] = safety_score
+        self._add_spelling(restaurant_id, name, location)
+
+    def add_alias(self, name, location, restaurant_id):
+        """Map another spelling to restaurant_id, exactly and for fuzzy matching."""
+        self.aliases[(canonical_name(name, location), canonical_location(location))] = restaurant_id
+        self._add_spelling(restaurant_id, name, location)
+
+    def alias_for(self, name, location):
+        return self.aliases.get((canonical_name(name, location), canonical_location(location)))
+
+    def best_match(self, name, location):
+        """Return (restaurant_id, similarity, same_words) for the closest
+        spelling in the same city, or (None, 0.0, False). Among equally
+        similar spellings, one with the same words wins."""
+        city = canonical_location(location)
+        canonical = canonical_name(name, location)
+        grams = trigrams(canonical)
+        best = (None, 0.0, False)
+        with self._lock:
+            postings = self.postings.get(city)
+            if not postings:
+                return best
+            shared = defaultdict(int)
+            for gram in grams:
+                for number in postings.get(gram, ()):
+                    shared[number] += 1
+            for number, count in shared.items():
+                restaurant_id, spelling, spelling_grams = self.spellings[number]
+                score = 2 * count / (len(grams) + len(spelling_grams))
+                if score < best[1] or (score == best[1] and best[2]):
+                    continue
+                words_match = same_words(canonical, spelling)
+                if score > best[1] or words_match:
+                    best = (restaurant_id, score, words_match)
+        return best
+
+    def score(self, restaurant_id):
+        return self.scores.get(restaurant_id)
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def _build_index():
+    global _index
+    index = MatchIndex(get_restaurant_match_rows(), get_restaurant_aliases())
+    with _index_lock:
+        _index = index
+    log.info("Built match index with %d restaurants, %d aliases", len(index.scores), len(index.aliases))
+
+
+def get_index():
+    """Return the current index, building it on first use and refreshing it in
+    the background once it is older than MATCH_INDEX_TTL."""
+    if _index is None:
+        _build_index()
+    elif time.monotonic() - _index.built_at > MATCH_INDEX_TTL:
+        submit_once("match-index", _build_index)
+    return _index
+
+
+def _classify(restaurant_id, score, words_match):
+    """"fuzzy" (safe to serve), "suggestion" (ask the user) or None."""
+    if restaurant_id is None or score < SUGGEST_THRESHOLD:
+        return None
+    if score >= MATCH_THRESHOLD and words_match:
+        return "fuzzy"
+    return "suggestion"
+
+
+def resolve_restaurant_id(name, location):
+    """Find the cached restaurant a (name, location) query refers to via the
+    alias table or fuzzy matching. Returns (restaurant_id, how) with how one
+    of "alias", "fuzzy" (both safe to serve) or "suggestion" (only with the
+    user's confirmation), or (None, None). Never writes aliases."""
+    index = get_index()
+    restaurant_id = index.alias_for(name, location)
+    if restaurant_id is not None:
+        return restaurant_id, "alias"
+
+    restaurant_id, score, words_match = index.best_match(name, location)
+    how = _classify(restaurant_id, score, words_match)
+    if how is None:
+        return None, None
+    log.debug("Fuzzy %s %r (%r) -> id=%s (%.2f)", how, name, location, restaurant_id, score)
+    return restaurant_id, how
+
+
+def find_cached_restaurant(name, location):
+    """Drop-in for get_cached_restaurant that also resolves aliases and fuzzy
+    matches. The returned dict gains 'matched_by': exact, alias or fuzzy.
+    A match that is only a suggestion is a miss (see suggest_restaurant)."""
+    cached = get_cached_restaurant(name, location)
+    if cached:
+        cached["matched_by"] = "exact"
+        return cached
+
+    restaurant_id, how = resolve_restaurant_id(name, location)
+    if restaurant_id is None or how == "suggestion":
+        return None
+    cached = get_cached_restaurant_by_id(restaurant_id)
+    if cached:
+        inc("celia_cache_lookups_total", result=f"{how}_hit")
+        cached["matched_by"] = how
+    return cached
+
+
+def find_cached_restaurants(names, location):
+    """Bulk find_cached_restaurant with a single database query: aliases and
+    fuzzy matches are resolved against the in-memory index first, then exact
+    keys and resolved IDs are fetched together. Returns a list parallel to
+    `names` of cache entries (with 'matched_by') or None. Suggestions are
+    misses here: there is no one to confirm them."""
+    index = get_index()
+    candidates = []  # per name: (restaurant_id, how) or None
+    for name in names:
+        restaurant_id = index.alias_for(name, location)
+        if restaurant_id is not None:
+            candidates.append((restaurant_id, "alias"))
+            continue
+        restaurant_id, score, words_match = index.best_match(name, location)
+        how = _classify(restaurant_id, score, words_match)
+        candidates.append((restaurant_id, how) if how == "fuzzy" else None)
+
+    found = get_cached_restaurants(names, location, {c[0] for c in candidates if c})
+    results = []
+    for name, candidate in zip(names, candidates):
+        cached = found["by_name"].get(normalize_name(name))
+        if cached:
+            inc("celia_cache_lookups_total", result="stale" if cached["stale"] else "hit")
+            results.append(dict(cached, matched_by="exact"))
+            continue
+        cached = found["by_id"].get(candidate[0]) if candidate else None
+        if not cached:
+            inc("celia_cache_lookups_total", result="miss")
+            results.append(None)
+            continue
+        inc("celia_cache_lookups_total", result=f"{candidate[1]}_hit")
+        results.append(dict(cached, matched_by=candidate[1]))
+    return results
+
+
+def match_scores(names, location, exact_scores):
+    """Fill in cached safety scores for names that missed the exact lookup.
+    `exact_scores` maps normalize_name(name) -> score; returns the same kind of
+    dict with fuzzy / alias matches added."""
+    scores = dict(exact_scores)
+    index = get_index()
+    for name in names:
+        key = normalize_name(name)
+        if key in scores:
+            continue
+        restaurant_id, how = resolve_restaurant_id(name, location)
+        if how in ("alias", "fuzzy") and index.score(restaurant_id) is not None:
+            scores[key] = index.score(restaurant_id)
+    return scores
+
+
+def suggest_restaurant(name, location):
+    """The cached restaurant a query probably means but that can't be served
+    without the user's confirmation: restaurant_id or None."""
+    restaurant_id, how = resolve_restaurant_id(name, location)
+    return restaurant_id if how == "suggestion" else None
+
+
+def confirm_match(name, location, restaurant_id):
+    """The user confirmed a suggestion: remember the spelling as an alias.
+    Only a suggestion the lookup itself would make is accepted. Returns True
+    if the alias was recorded."""
+    if resolve_restaurant_id(name, location) not in ((restaurant_id, "suggestion"), (restaurant_id, "fuzzy")):
+        return False
+    remember_alias(name, location, restaurant_id)
+    inc("celia_match_confirmations_total")
+    return True
+
+
+def remember_alias(name, location, restaurant_id):
+    """Persist and index a confirmed (name, location) -> restaurant_id mapping.
+    Callers must have a real confirmation; fuzzy lookups never call this."""
+    index = get_index()
+    if index.alias_for(name, location) == restaurant_id:
+        return
+    index.add_alias(name, location, restaurant_id)
+    add_restaurant_alias(name, location, restaurant_id)
+
+
+def index_restaurant(restaurant_id, name, location, safety_score=None, official_name=None):
+    """Add a freshly cached restaurant to the index. Claude's research names
+    the restaurant it found, which confirms that official name: if it differs
+    from what the user searched and no other entry has or resembles it,
+    remember it as an alias too."""
+    index = get_index()
+    if official_name and normalize_name(official_name) != normalize_name(name):
+        if (get_restaurant_id(official_name, location) is None
+                and index.alias_for(official_name, location) is None
+                and index.best_match(official_name, location)[1] < SUGGEST_THRESHOLD):
+            remember_alias(official_name, location, restaurant_id)
+    index.add(restaurant_id, normalize_name(name), normalize_location(location), safety_score)
@@ -0,0 +1,269 @@
+"""In-process request and dependency timing.
+
+Timings are kept per (metric, labels) series as a count, a running sum and a
+sliding window of recent samples for p50/p95/p99. Counters are plain sums.
+Series are recorded in memory in the current process; `report()` returns
+them as a dict for tests and scripts.
+
+Under gunicorn every worker has its own series, and a scrape lands on one of
+them. So when METRICS_DIR is set (gunicorn.conf.py points it at a fresh
+temp directory shared by the workers), each worker writes its series to
+<pid>.json there every METRICS_FLUSH_INTERVAL seconds, and
+`render_prometheus()`, which backs /metrics, serves all workers merged:
+counts and sums are added up across every file, including those of workers
+that have since exited, so counters never go backwards; quantiles are taken
+over the recent samples of workers that are still writing.
+
+Environment:
+    METRICS_DIR              directory shared by the workers (set by
+                             gunicorn.conf.py; unset: this process only)
+    METRICS_FLUSH_INTERVAL   seconds between a worker's writes (default 5)
+
+Usage:
+    with span("db.connect"):
+        ...
+
+    @timed("db.get_cached_restaurant")
+    def get_cached_restaurant(...): ...
+
+    inc("celia_cache_lookups_total", result="hit")
+"""
+
+import os
+import json
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import g, request
+
+REQUEST_METRIC = "celia_request_seconds"
+DEPENDENCY_METRIC = "celia_dependency_seconds"
+QUANTILES = (0.5, 0.95, 0.99)
+WINDOW_SIZE = 1024  # recent samples kept per series for quantiles
+
+METRICS_DIR = os.environ.get("METRICS_DIR")
+METRICS_FLUSH_INTERVAL = float(os.environ.get("METRICS_FLUSH_INTERVAL", "5"))
+
+_lock = threading.Lock()
+_timings = {}
+_counters = {}
+_flusher_pid = None
+
+
+class _Series:
+    __slots__ = ("count", "total", "samples")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.samples = deque(maxlen=WINDOW_SIZE)
+
+
+def _key(metric, labels):
+    return metric, tuple(sorted(labels.items()))
+
+
+def observe(metric, seconds, **labels):
+    """Record one duration (in seconds) for a timing series."""
+    key = _key(metric, labels)
+    with _lock:
+        series = _timings.get(key)
+        if series is None:
+            series = _timings[key] = _Series()
+        series.count += 1
+        series.total += seconds
+        series.samples.append(seconds)
+
+
+def inc(metric, amount=1, **labels):
+    """Add `amount` to a counter series."""
+    if not amount:
+        return
+    key = _key(metric, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+@contextmanager
+def span(dependency):
+    """Time a block as a call to `dependency` (e.g. "db.connect", "claude.scout")."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(DEPENDENCY_METRIC, time.perf_counter() - start, dependency=dependency)
+
+
+def timed(dependency):
+    """Decorator form of span()."""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(dependency):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _quantile(sorted_samples, q):
+    if not sorted_samples:
+        return 0.0
+    index = min(len(sorted_samples) - 1, int(round(q * (len(sorted_samples) - 1))))
+    return sorted_samples[index]
+
+
+def _snapshot():
+    """This process's series as plain data:
+    {"timings": [[metric, labels, count, sum, samples]], "counters": [[metric, labels, value]]}"""
+    with _lock:
+        return {
+            "timings": [[metric, dict(labels), s.count, s.total, list(s.samples)]
+                        for (metric, labels), s in _timings.items()],
+            "counters": [[metric, dict(labels), value] for (metric, labels), value in _counters.items()],
+        }
+
+
+def _merge(snapshots):
+    """One _snapshot-shaped dict for several processes. Each item is
+    (snapshot, live); samples only come from live ones."""
+    timings, counters = {}, {}
+    for snapshot, live in snapshots:
+        for metric, labels, count, total, samples in snapshot["timings"]:
+            entry = timings.setdefault(_key(metric, labels), [metric, labels, 0, 0.0, []])
+            entry[2] += count
+            entry[3] += total
+            if live:
+                entry[4].extend(samples)
+        for metric, labels, value in snapshot["counters"]:
+            entry = counters.setdefault(_key(metric, labels), [metric, labels, 0])
+            entry[2] += value
+    return {"timings": list(timings.values()), "counters": list(counters.values())}
+
+
+def _summarize(snapshot):
+    out = {"timings": {}, "counters": {}}
+    for metric, labels, count, total, samples in snapshot["timings"]:
+        samples = sorted(samples)
+        entry = {"labels": labels, "count": count, "sum": total}
+        for q in QUANTILES:
+            entry[f"p{int(q * 100)}"] = _quantile(samples, q)
+        out["timings"].setdefault(metric, []).append(entry)
+    for metric, labels, value in snapshot["counters"]:
+        out["counters"].setdefault(metric, []).append({"labels": labels, "value": value})
+    return out
+
+
+def report():
+    """Snapshot of this process's series:
+    {"timings": {metric: [{labels, count, sum, p50, p95, p99}]}, "counters": {metric: [{labels, value}]}}"""
+    return _summarize(_snapshot())
+
+
+def write_snapshot(directory=None):
+    """Write this process's series to <directory>/<pid>.json (atomically)."""
+    directory = directory or METRICS_DIR
+    path = os.path.join(directory, f"{os.getpid()}.json")
+    with open(path + ".tmp", "w") as f:
+        json.dump(_snapshot(), f)
+    os.replace(path + ".tmp", path)
+
+
+def aggregate_report(directory=None):
+    """report() merged across every worker that has written to `directory`
+    (this process included, written fresh). Workers whose file is older than
+    a few flush intervals count as gone: their counts and sums stay in, their
+    samples don't."""
+    directory = directory or METRICS_DIR
+    write_snapshot(directory)
+    stale_before = time.time() - 3 * METRICS_FLUSH_INTERVAL
+    snapshots = []
+    for name in os.listdir(directory):
+        if not name.endswith(".json"):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            live = os.path.getmtime(path) >= stale_before
+            with open(path) as f:
+                snapshots.append((json.load(f), live))
+        except (OSError, ValueError):
+            continue  # removed or being replaced just now
+    return _summarize(_merge(snapshots))
+
+
+def _flush_periodically():
+    while True:
+        time.sleep(METRICS_FLUSH_INTERVAL)
+        try:
+            write_snapshot()
+        except OSError:
+            pass
+
+
+def _ensure_flusher():
+    """Start this process's snapshot writer (again after a fork)."""
+    global _flusher_pid
+    if _flusher_pid != os.getpid():
+        with _lock:
+            if _flusher_pid != os.getpid():
+                _flusher_pid = os.getpid()
+                threading.Thread(target=_flush_periodically, name="celia-metrics", daemon=True).start()
+
+
+def reset():
+    """Drop all recorded series (for tests and benchmarks)."""
+    with _lock:
+        _timings.clear()
+        _counters.clear()
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    parts = []
+    for name, value in sorted(labels.items()):
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'{name}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+
+def render_prometheus():
+    """Render all series in the Prometheus text exposition format (timings as
+    summaries): every worker's when METRICS_DIR is set, else this process's."""
+    snapshot = aggregate_report() if METRICS_DIR else report()
+    lines = []
+    for metric, series in sorted(snapshot["timings"].items()):
+        lines.append(f"# TYPE {metric} summary")
+        for entry in series:
+            labels = entry["labels"]
+            for q in QUANTILES:
+                q_labels = dict(labels, quantile=str(q))
+                lines.append(f"{metric}{_format_labels(q_labels)} {entry[f'p{int(q * 100)}']:.6f}")
+            lines.append(f"{metric}_sum{_format_labels(labels)} {entry['sum']:.6f}")
+            lines.append(f"{metric}_count{_format_labels(labels)} {entry['count']}")
+    for metric, series in sorted(snapshot["counters"].items()):
+        lines.append(f"# TYPE {metric} counter")
+        for entry in series:
+            lines.append(f"{metric}{_format_labels(entry['labels'])} {entry['value']}")
+    return "\n".join(lines) + "\n"
+
+
+def init_app(app):
+    """Time every request into celia_request_seconds{route, method, status}."""
+
+    @app.before_request
+    def _start_request_timer():
+        g.metrics_start = time.perf_counter()
+        if METRICS_DIR:
+            _ensure_flusher()
+
+    @app.after_request
+    def _record_request_time(response):
+        start = g.pop("metrics_start", None)
+        if start is not None:
+            route = request.url_rule.rule if request.url_rule else "unmatched"
+            observe(REQUEST_METRIC, time.perf_counter() - start,
+                    route=route, method=request.method, status=str(response.status_code))
+        return response
@@ -0,0 +1,162 @@
+-- Baseline: the schema as it stood when versioned migrations were introduced
+-- (formerly schema.sql). Every statement is idempotent, so databases created
+-- from schema.sql record this version without changing anything.
+
+-- This creates a table to store restaurant search results
+CREATE TABLE IF NOT EXISTS restaurants (
+    id SERIAL PRIMARY KEY,
+    name VARCHAR(255) NOT NULL,
+    location VARCHAR(255) NOT NULL,
+    search_query VARCHAR(500) NOT NULL,
+    safety_score INTEGER CHECK (safety_score >= 0 AND safety_score <= 10),
+    analysis_json JSONB NOT NULL,
+    searched_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    expires_at TIMESTAMP NOT NULL,
+    UNIQUE(name, location)
+);
+
+-- This makes searching faster
+CREATE INDEX IF NOT EXISTS idx_restaurant_search ON restaurants(name, location);
+CREATE INDEX IF NOT EXISTS idx_expires_at ON restaurants(expires_at);
+
+-- Listing fields, so listings don't have to read analysis_json (see models.ScoutResult)
+ALTER TABLE restaurants ADD COLUMN IF NOT EXISTS score_label TEXT;
+ALTER TABLE restaurants ADD COLUMN IF NOT EXISTS cuisine_type TEXT;
+ALTER TABLE restaurants ADD COLUMN IF NOT EXISTS summary TEXT;
+
+-- Backfill: move rows still holding the full response wrapper to the compact
+-- format (listing fields in columns, wrapper fields dropped)
+UPDATE restaurants SET
+    score_label = analysis_json->'analysis'->>'score_label',
+    cuisine_type = analysis_json->'analysis'->>'cuisine_type',
+    summary = analysis_json->'analysis'->>'summary',
+    analysis_json = jsonb_build_object(
+        'v', 2,
+        'id', analysis_json->'id',
+        'ts', analysis_json->'timestamp',
+        'analysis', (analysis_json->'analysis') - 'safety_score' - 'score_label' - 'cuisine_type' - 'summary'
+    )
+WHERE NOT analysis_json ? 'v';
+
+-- Which scout tier produced the cached result: 'triage' (quick Haiku pass) or
+-- 'full' (Sonnet research). Rows cached before tiered routing were all 'full'.
+ALTER TABLE restaurants ADD COLUMN IF NOT EXISTS analysis_tier TEXT;
+UPDATE restaurants SET analysis_tier = 'full' WHERE analysis_tier IS NULL;
+
+-- This creates a table for users (simple version for now)
+CREATE TABLE IF NOT EXISTS users (
+    id SERIAL PRIMARY KEY,
+    email VARCHAR(255) UNIQUE NOT NULL,
+    search_count INTEGER DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- This creates a table to track which restaurants users save
+CREATE TABLE IF NOT EXISTS saved_restaurants (
+    user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+    restaurant_id INTEGER REFERENCES restaurants(id) ON DELETE CASCADE,
+    saved_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_id, restaurant_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_user_saved ON saved_restaurants(user_id);
+
+-- Track search usage for anonymous (non-signed-in) users by IP
+CREATE TABLE IF NOT EXISTS anonymous_usage (
+    id SERIAL PRIMARY KEY,
+    ip_address VARCHAR(45) UNIQUE NOT NULL,
+    search_count INTEGER DEFAULT 0,
+    first_searched_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    last_searched_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Restaurant requests from users who hit the search limit
+CREATE TABLE IF NOT EXISTS restaurant_requests (
+    id SERIAL PRIMARY KEY,
+    restaurant_name VARCHAR(255) NOT NULL,
+    location VARCHAR(255),
+    user_email VARCHAR(255),
+    ip_address VARCHAR(45) NOT NULL,
+    requested_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    fulfilled_at TIMESTAMP
+);
+
+-- Pro waitlist signups
+CREATE TABLE IF NOT EXISTS waitlist (
+    id SERIAL PRIMARY KEY,
+    email VARCHAR(255) UNIQUE NOT NULL,
+    signed_up_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+-- One row per Claude API call, written in batches off the request path.
+-- Cost is stored in millionths of a dollar to keep the row small.
+CREATE TABLE IF NOT EXISTS llm_usage (
+    id BIGSERIAL PRIMARY KEY,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    endpoint VARCHAR(32) NOT NULL,
+    model VARCHAR(64) NOT NULL,
+    user_id INTEGER,
+    ip_address VARCHAR(45),
+    input_tokens INTEGER NOT NULL DEFAULT 0,
+    output_tokens INTEGER NOT NULL DEFAULT 0,
+    cache_creation_tokens INTEGER NOT NULL DEFAULT 0,
+    cache_read_tokens INTEGER NOT NULL DEFAULT 0,
+    web_searches SMALLINT NOT NULL DEFAULT 0,
+    latency_ms INTEGER NOT NULL DEFAULT 0,
+    cost_micros INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE INDEX IF NOT EXISTS idx_llm_usage_created_at ON llm_usage(created_at);
+
+-- Discovery results keyed by normalized cuisine + location
+CREATE TABLE IF NOT EXISTS discovery_cache (
+    cuisine VARCHAR(100) NOT NULL,
+    location VARCHAR(255) NOT NULL,
+    results_json JSONB NOT NULL,
+    searched_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    expires_at TIMESTAMP NOT NULL,
+    PRIMARY KEY (cuisine, location)
+);
+
+-- Local-first alternatives: best-scoring cached restaurants per location
+CREATE INDEX IF NOT EXISTS idx_restaurants_location_score ON restaurants (LOWER(location), safety_score DESC);
+
+-- Alternate spellings of a cached restaurant, learned from confirmed matches
+CREATE TABLE IF NOT EXISTS restaurant_aliases (
+    alias_name VARCHAR(255) NOT NULL,
+    alias_location VARCHAR(255) NOT NULL,
+    restaurant_id INTEGER NOT NULL REFERENCES restaurants(id) ON DELETE CASCADE,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (alias_name, alias_location)
+);
+
+-- Negative cache: recent scout failures per restaurant key and failure kind,
+-- with exponential backoff before the same research is attempted again
+CREATE TABLE IF NOT EXISTS scout_failures (
+    name VARCHAR(255) NOT NULL,
+    location VARCHAR(255) NOT NULL,
+    failure_kind VARCHAR(20) NOT NULL,
+    failure_count INTEGER NOT NULL DEFAULT 1,
+    detail TEXT,
+    first_failed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    last_failed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    retry_after TIMESTAMP NOT NULL,
+    PRIMARY KEY (name, location, failure_kind)
+);
+
+-- Sampled request profiles (collapsed stacks), see profiling.py
+CREATE TABLE IF NOT EXISTS request_profiles (
+    id SERIAL PRIMARY KEY,
+    route VARCHAR(255) NOT NULL,
+    method VARCHAR(10) NOT NULL,
+    path TEXT,
+    status INTEGER,
+    duration_ms INTEGER NOT NULL,
+    sample_count INTEGER NOT NULL,
+    interval_ms INTEGER NOT NULL,
+    trigger VARCHAR(20) NOT NULL,
+    stacks TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_request_profiles_route_duration ON request_profiles (route, duration_ms DESC);
+CREATE INDEX IF NOT EXISTS idx_request_profiles_created_at ON request_profiles (created_at);
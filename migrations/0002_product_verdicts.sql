@@ -0,0 +1,15 @@
+-- Barcode-keyed product index: the latest label analysis per packaged product
+-- (UPC / EAN, stored as a 13-digit GTIN), so scanning a known product is
+-- answered without a vision call. See barcodes.py.
+CREATE TABLE IF NOT EXISTS product_verdicts (
+    barcode VARCHAR(14) PRIMARY KEY,
+    product_name TEXT NOT NULL,
+    verdict VARCHAR(20) NOT NULL,
+    confidence VARCHAR(10),
+    analysis_json JSONB NOT NULL,
+    analyzed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    scan_count INTEGER NOT NULL DEFAULT 1,
+    last_scanned_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_product_verdicts_scan_count ON product_verdicts (scan_count DESC);
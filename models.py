@@ -0,0 +1,81 @@
+"""Typed models for documents stored in the database."""
+
+import json
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime
+
+# analysis_json format written by ScoutResult.to_storage(). Rows without a
+# "v" key hold the old format: the full response wrapper as sent to the client.
+SCOUT_STORAGE_VERSION = 2
+
+# Analysis fields kept in their own restaurants columns (listings read these
+# without touching analysis_json), and left out of the stored document.
+SCOUT_COLUMN_FIELDS = ("safety_score", "score_label", "cuisine_type", "summary", "analysis_tier")
+
+
+@dataclass
+class ScoutResult:
+    """A restaurant scout report: Claude's analysis plus the wrapper fields
+    the frontend expects (id, restaurant_name, menu_url, timestamp)."""
+
+    restaurant_name: str
+    analysis: dict
+    menu_url: str = ""
+    id: str = field(default_factory=lambda: str(uuid.uuid4())[:8])
+    timestamp: str = field(default_factory=lambda: datetime.now().isoformat())
+
+    @property
+    def safety_score(self):
+        return self.analysis.get("safety_score")
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build from the response shape (what to_dict returns)."""
+        return cls(
+            restaurant_name=data.get("restaurant_name") or "",
+            analysis=data.get("analysis") or {},
+            menu_url=data.get("menu_url") or "",
+            id=data.get("id") or str(uuid.uuid4())[:8],
+            timestamp=data.get("timestamp") or datetime.now().isoformat(),
+        )
+
+    def to_dict(self):
+        """The JSON response shape for /api/restaurant-scout."""
+        return {
+            "id": self.id,
+            "restaurant_name": self.restaurant_name,
+            "menu_url": self.menu_url,
+            "timestamp": self.timestamp,
+            "analysis": self.analysis,
+        }
+
+    def columns(self):
+        """Values for the restaurants columns in SCOUT_COLUMN_FIELDS."""
+        return {name: self.analysis.get(name) for name in SCOUT_COLUMN_FIELDS}
+
+    def to_storage(self):
+        """Compact analysis_json document. The name comes from the row's
+        search_query, menu_url is always empty for cached results, and the
+        column fields live in their columns."""
+        return {
+            "v": SCOUT_STORAGE_VERSION,
+            "id": self.id,
+            "ts": self.timestamp,
+            "analysis": {k: v for k, v in self.analysis.items() if k not in SCOUT_COLUMN_FIELDS},
+        }
+
+
+def scout_response_body(row, restaurant_name):
+    """Serialized /api/restaurant-scout response for a cached row, built
+    around its stored analysis text without decoding it. `row` has the
+    columns selected by database.SCOUT_BODY_COLUMNS; restaurant_id is taken
+    from row["id"]."""
+    return (
+        f'{{"id": {json.dumps(row["result_id"] or "")}, '
+        f'"restaurant_name": {json.dumps(restaurant_name)}, '
+        f'"menu_url": "", '
+        f'"timestamp": {json.dumps(row["result_ts"] or "")}, '
+        f'"analysis": {row["analysis_text"]}, '
+        f'"restaurant_id": {int(row["id"])}}}'
+    )
@@ -0,0 +1,233 @@
+"""On-demand sampling profiler for individual requests.
+
+A profiled request is sampled by a background OS thread every
+PROFILE_INTERVAL_MS: each tick records the request's current stack (wall
+clock, so time spent waiting on Claude or Postgres shows up as well as CPU
+work). Under gevent the request's greenlet is sampled where it is parked
+while other greenlets run. Stacks are stored as collapsed text, one
+"frame;frame;frame count" line per distinct stack, which flamegraph.pl and
+speedscope read directly; profiles are browsable from the admin dashboard.
+
+A request is profiled when:
+    - an admin (or the local debug server) sends the X-Celia-Profile header
+      or has the celia_profile cookie set (toggled from the dashboard), or
+    - it is picked by PROFILE_SAMPLE_RATE (profile 1 in N requests; 0, the
+      default, turns sampling off). Sampled profiles are only kept when the
+      request took at least PROFILE_MIN_MS.
+
+When nothing asks for a profile no sampler thread runs and the per-request
+cost is a header and cookie lookup.
+
+Environment:
+    PROFILE_SAMPLE_RATE     profile 1 in N requests (default 0: off)
+    PROFILE_MIN_MS          keep sampled profiles at least this slow (default 1000)
+    PROFILE_INTERVAL_MS     sampling interval (default 10)
+    PROFILE_MAX_ACTIVE      concurrent profiles per worker (default 4)
+"""
+
+import os
+import sys
+import time
+import random
+import _thread
+import itertools
+from collections import Counter
+
+from flask import g, request, session
+
+from background import submit_once
+from logging_config import get_logger
+from metrics import inc
+
+log = get_logger("PROFILE")
+
+PROFILE_HEADER = "X-Celia-Profile"
+PROFILE_COOKIE = "celia_profile"
+PROFILE_SAMPLE_RATE = int(os.environ.get("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_MIN_MS = int(os.environ.get("PROFILE_MIN_MS", "1000"))
+PROFILE_INTERVAL_MS = int(os.environ.get("PROFILE_INTERVAL_MS", "10"))
+PROFILE_MAX_ACTIVE = int(os.environ.get("PROFILE_MAX_ACTIVE", "4"))
+MAX_STACK_DEPTH = 100
+
+# Requests never worth profiling
+SKIPPED_PREFIXES = ("/static/", "/metrics", "/admin/profiles/")
+
+
+def _unpatched(module, name, default):
+    """The real OS-level primitive, even when gevent has patched it: the
+    sampler must keep ticking while greenlets wait."""
+    try:
+        from gevent import monkey
+    except ImportError:
+        return default
+    return monkey.get_original(module, name) if monkey.is_module_patched(module) else default
+
+
+_start_thread = _unpatched("_thread", "start_new_thread", _thread.start_new_thread)
+_get_ident = _unpatched("_thread", "get_ident", _thread.get_ident)
+_sleep = _unpatched("time", "sleep", time.sleep)
+_lock = _unpatched("_thread", "allocate_lock", _thread.allocate_lock)()
+
+_active = {}          # profile id -> _Profile
+_sampler_running = False
+_ids = itertools.count(1)
+
+
+def _current_greenlet():
+    if "gevent" not in sys.modules:
+        return None
+    from gevent import monkey
+    if not monkey.is_module_patched("threading"):
+        return None
+    import greenlet
+    return greenlet.getcurrent()
+
+
+class _Profile:
+    __slots__ = ("thread_id", "greenlet", "stacks", "samples", "started")
+
+    def __init__(self):
+        self.thread_id = _get_ident()
+        self.greenlet = _current_greenlet()
+        self.stacks = Counter()
+        self.samples = 0
+        self.started = time.perf_counter()
+
+    def frame(self, frames):
+        # A greenlet that isn't running keeps its frame in gr_frame; while it
+        # runs, gr_frame is None and its stack is the thread's.
+        if self.greenlet is not None and self.greenlet.gr_frame is not None:
+            return self.greenlet.gr_frame
+        return frames.get(self.thread_id)
+
+
+_labels = {}  # code object -> frame label
+
+
+def _label(code):
+    label = _labels.get(code)
+    if label is None:
+        label = _labels[code] = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+    return label
+
+
+def collapse(frame):
+    """Root-first "a;b;c" for a frame's stack."""
+    labels = []
+    while frame is not None and len(labels) < MAX_STACK_DEPTH:
+        labels.append(_label(frame.f_code))
+        frame = frame.f_back
+    labels.reverse()
+    return ";".join(labels)
+
+
+def _sample_loop():
+    global _sampler_running
+    interval = PROFILE_INTERVAL_MS / 1000
+    while True:
+        _sleep(interval)
+        with _lock:
+            if not _active:
+                _sampler_running = False
+                return
+            frames = sys._current_frames()
+            for profile in _active.values():
+                frame = profile.frame(frames)
+                if frame is not None:
+                    profile.stacks[collapse(frame)] += 1
+                    profile.samples += 1
+            del frames
+
+
+def start_profile():
+    """Start sampling the current request. Returns a profile id, or None when
+    PROFILE_MAX_ACTIVE profiles are already running."""
+    global _sampler_running
+    with _lock:
+        if len(_active) >= PROFILE_MAX_ACTIVE:
+            return None
+        profile_id = next(_ids)
+        _active[profile_id] = _Profile()
+        if not _sampler_running:
+            _sampler_running = True
+            _start_thread(_sample_loop, ())
+    return profile_id
+
+
+def stop_profile(profile_id):
+    """Stop sampling. Returns (duration_ms, sample_count, collapsed stacks text)."""
+    with _lock:
+        profile = _active.pop(profile_id, None)
+    if profile is None:
+        return None
+    duration_ms = int((time.perf_counter() - profile.started) * 1000)
+    stacks = "\n".join(f"{stack} {count}" for stack, count in profile.stacks.most_common())
+    return duration_ms, profile.samples, stacks
+
+
+def _requested_trigger(app):
+    """"header" / "cookie" when an admin asked for this request to be profiled."""
+    if request.headers.get(PROFILE_HEADER):
+        trigger = "header"
+    elif request.cookies.get(PROFILE_COOKIE):
+        trigger = "cookie"
+    else:
+        return None
+    if app.debug or session.get("admin_authenticated"):
+        return trigger
+    return None
+
+
+def init_app(app):
+    """Profile requests an admin asks for, and 1 in PROFILE_SAMPLE_RATE others."""
+
+    @app.before_request
+    def _start_request_profile():
+        trigger = _requested_trigger(app)
+        if trigger is None:
+            if not PROFILE_SAMPLE_RATE or random.randrange(PROFILE_SAMPLE_RATE):
+                return
+            trigger = "sampled"
+        if request.path.startswith(SKIPPED_PREFIXES):
+            return
+        profile_id = start_profile()
+        if profile_id is None:
+            inc("celia_profiles_total", result="busy")
+            return
+        g.profile = (profile_id, trigger)
+
+    @app.after_request
+    def _note_profile_status(response):
+        if "profile" in g:
+            g.profile_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def _finish_request_profile(exc):
+        profile = g.pop("profile", None)
+        if profile is None:
+            return
+        profile_id, trigger = profile
+        result = stop_profile(profile_id)
+        if result is None:
+            return
+        duration_ms, sample_count, stacks = result
+        if trigger == "sampled" and duration_ms < PROFILE_MIN_MS:
+            inc("celia_profiles_total", result="discarded")
+            return
+        inc("celia_profiles_total", result="stored")
+
+        from database import save_request_profile
+        row = {
+            "route": request.url_rule.rule if request.url_rule else "unmatched",
+            "method": request.method,
+            "path": request.full_path.rstrip("?")[:1000],
+            "status": g.pop("profile_status", 500 if exc else None),
+            "duration_ms": duration_ms,
+            "sample_count": sample_count,
+            "interval_ms": PROFILE_INTERVAL_MS,
+            "trigger": trigger,
+            "stacks": stacks,
+        }
+        submit_once(f"profile:{os.getpid()}:{profile_id}", save_request_profile, row)
+        log.debug("Profiled %s %s: %d ms, %d samples", row["method"], row["route"], duration_ms, sample_count)
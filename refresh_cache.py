@@ -0,0 +1,55 @@
+"""Re-research popular restaurants before their cache entries expire, so
+saved restaurants stay fresh without a user waiting on a slow miss.
+
+Run manually or from cron:  python refresh_cache.py [--days 3] [--limit 10]
+"""
+
+import time
+import argparse
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from app import refresh_restaurant
+from database import get_expiring_restaurants, display_name_from_search_query
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--days", type=int, default=3, help="refresh entries expiring within this many days")
+    parser.add_argument("--limit", type=int, default=10, help="maximum restaurants to refresh per run")
+    parser.add_argument("--delay", type=int, default=60, help="seconds to wait between analyses")
+    args = parser.parse_args()
+
+    rows = get_expiring_restaurants(within_days=args.days, limit=args.limit)
+
+    if not rows:
+        print("No cache entries due for refresh.")
+        return
+
+    total = len(rows)
+    print(f"Found {total} cache entr{'y' if total == 1 else 'ies'} due for refresh.\n")
+
+    for i, row in enumerate(rows, 1):
+        name = display_name_from_search_query(row["search_query"], row["location"], row["name"])
+        print(f"Refreshing {i}/{total}: {name}, {row['location'] or 'no location'} "
+              f"(saved {row['save_count']}x, expires {row['expires_at']:%Y-%m-%d})...")
+
+        try:
+            result = refresh_restaurant(name, row["location"])
+            score = result["analysis"].get("safety_score", "?")
+            print(f"  Done — safety score: {score}/10")
+        except Exception as e:
+            print(f"  FAILED — {e}")
+
+        # Delay between calls (skip after the last one)
+        if i < total:
+            print(f"  Waiting {args.delay}s before next refresh...")
+            time.sleep(args.delay)
+
+    print(f"\nFinished refreshing {total} restaurant(s).")
+
+
+if __name__ == "__main__":
+    main()
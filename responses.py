@@ -0,0 +1,134 @@
+"""Response compression and pre-serialized JSON bodies.
+
+init_app() compresses dynamic JSON / HTML / text responses with brotli or
+gzip, whichever the client accepts. `brotli` is in requirements.txt; an
+environment without it falls back to gzip only. Responses that already
+carry a Content-Encoding, streamed responses and small bodies are left
+alone.
+
+Cached scout results come out of Postgres as JSON text (see
+database.SCOUT_BODY_COLUMNS), so they are sent as-is instead of being
+decoded and re-encoded by jsonify. Each body gets a strong ETag (a hash of
+its bytes), so GETs from My Safe Spots revalidate to 304 Not Modified.
+Compressed copies are kept per worker by ETag, so a popular report is
+compressed once rather than on every hit.
+"""
+
+import gzip
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+
+from flask import Response, request
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+COMPRESS_MIN_BYTES = 1024     # smaller bodies aren't worth compressing
+COMPRESSIBLE_MIMETYPES = {
+    "application/json", "application/x-ndjson", "text/html", "text/css", "text/plain",
+    "text/javascript", "application/javascript", "image/svg+xml",
+}
+COMPRESSED_CACHE_SIZE = 256   # compressed bodies kept per worker
+
+_compressed = OrderedDict()   # (etag, encoding) -> bytes, least recently used first
+_compressed_lock = threading.Lock()
+
+
+def splice_json(body, **fields):
+    """Add top-level fields to a serialized JSON object without parsing it."""
+    if not fields:
+        return body
+    extra = "".join(f", {json.dumps(name)}: {json.dumps(value)}" for name, value in fields.items())
+    return body[:body.rindex("}")] + extra + "}"
+
+
+def strong_etag(data):
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def accepted_encoding():
+    """The best encoding this request accepts: "br", "gzip" or None."""
+    accepted = request.accept_encodings
+    if brotli is not None and accepted["br"]:
+        return "br"
+    if accepted["gzip"]:
+        return "gzip"
+    return None
+
+
+def compress(data, encoding, best=False):
+    """Compress bytes with "br" or "gzip". `best` trades time for size (for
+    content compressed once, like static files)."""
+    if encoding == "br":
+        return brotli.compress(data, quality=11 if best else 5)
+    return gzip.compress(data, compresslevel=9 if best else 6)
+
+
+def _compress_cached(etag, data, encoding):
+    key = (etag, encoding)
+    with _compressed_lock:
+        if key in _compressed:
+            _compressed.move_to_end(key)
+            return _compressed[key]
+    compressed = compress(data, encoding)
+    with _compressed_lock:
+        _compressed[key] = compressed
+        while len(_compressed) > COMPRESSED_CACHE_SIZE:
+            _compressed.popitem(last=False)
+    return compressed
+
+
+def json_body_response(body, status=200, cache_control=None):
+    """Response for an already-serialized JSON body, with a strong ETag,
+    304 handling on GET / HEAD, and gzip / brotli when the client accepts it.
+    Compressed variants get their own ETag ("<etag>-gzip") since their bytes
+    differ."""
+    data = body.encode("utf-8")
+    etag = strong_etag(data)
+    encoding = accepted_encoding() if len(data) >= COMPRESS_MIN_BYTES else None
+    variant_etag = f"{etag}-{encoding}" if encoding else etag
+
+    response = Response(status=status, mimetype="application/json")
+    response.vary.add("Accept-Encoding")
+    if cache_control:
+        response.headers["Cache-Control"] = cache_control
+    response.set_etag(variant_etag)
+
+    if request.method in ("GET", "HEAD") and request.if_none_match.contains(variant_etag):
+        response.status_code = 304
+        return response
+
+    if encoding:
+        data = _compress_cached(etag, data, encoding)
+        response.headers["Content-Encoding"] = encoding
+    response.set_data(data)
+    return response
+
+
+def init_app(app):
+    """Compress eligible responses to clients that accept it."""
+
+    @app.after_request
+    def _compress_response(response):
+        if (response.status_code != 200
+                or response.direct_passthrough
+                or response.is_streamed
+                or "Content-Encoding" in response.headers
+                or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+            return response
+        response.vary.add("Accept-Encoding")
+        encoding = accepted_encoding()
+        data = response.get_data()
+        if encoding is None or len(data) < COMPRESS_MIN_BYTES:
+            return response
+
+        response.set_data(compress(data, encoding))
+        response.headers["Content-Encoding"] = encoding
+        etag, weak = response.get_etag()
+        if etag:
+            response.set_etag(f"{etag}-{encoding}", weak)
+        return response
@@ -1,36 +1,54 @@
-"""Read schema.sql and create tables in PostgreSQL."""
+"""Apply pending database migrations (migrations/*.sql).
+
+Run once per deploy, before the new app version starts (Render's
+preDeployCommand). Safe to run repeatedly: applied versions are recorded in
+schema_migrations and skipped.
+
+Run:  python setup_db.py [--status]
+"""
 
 import os
 import sys
-import psycopg2
+import argparse
 from dotenv import load_dotenv
 
 load_dotenv()
 
+from database import apply_migrations, list_migrations, get_connection
+
+
+def print_status():
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT to_regclass('schema_migrations') IS NOT NULL AS present")
+            applied = {}
+            if cur.fetchone()["present"]:
+                cur.execute("SELECT version, applied_at FROM schema_migrations")
+                applied = {row["version"]: row["applied_at"] for row in cur.fetchall()}
+    finally:
+        conn.close()
+    for version, _ in list_migrations():
+        when = applied.get(version)
+        print(f"{version:<40} {when:%Y-%m-%d %H:%M}" if when else f"{version:<40} pending")
+
 
 def main():
-    database_url = os.environ.get("DATABASE_URL")
-    if not database_url:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--status", action="store_true", help="list migrations without applying them")
+    args = parser.parse_args()
+
+    if not os.environ.get("DATABASE_URL"):
         print("ERROR: DATABASE_URL not set in environment")
         sys.exit(1)
 
-    schema_path = os.path.join(os.path.dirname(__file__), "schema.sql")
-    with open(schema_path) as f:
-        schema_sql = f.read()
-
-    conn = psycopg2.connect(database_url)
-    try:
-        with conn:
-            with conn.cursor() as cur:
-                cur.execute(schema_sql)
-        print("Tables created successfully")
-    except psycopg2.errors.DuplicateTable as e:
-        print(f"Tables already exist: {e.diag.message_primary}")
-    except Exception as e:
-        print(f"Failed to create tables: {e}")
+    if args.status:
+        print_status()
+        return
+    if not apply_migrations():
+        print("Migrations failed, see the log above")
         sys.exit(1)
-    finally:
-        conn.close()
+    print("Database schema is up to date")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,241 @@
+"""Local SQLite snapshot of the restaurant cache.
+
+If Postgres is down, every cache lookup misses and each search becomes a
+paid Claude analysis. To avoid that, each host keeps a copy of the
+restaurants table, with the served response columns only, in a SQLite file
+at SNAPSHOT_PATH. The file is shared by the host's workers, so a new worker
+starts with a warm snapshot.
+
+database.py reads from the snapshot when the primary fails or times out.
+It then keeps using the snapshot for PRIMARY_RETRY_AFTER seconds before
+trying Postgres again, so an outage doesn't make every request wait on a
+dead connection first. A read that only waited too long for one of the
+worker's connection slots (database.ConnectionSlotTimeout) is served from
+the snapshot without marking Postgres down. Entries served from the
+snapshot are never marked stale, so an outage doesn't start background
+re-research.
+
+The snapshot is refreshed incrementally: rows whose searched_at is past the
+stored high-water mark (less a short overlap) are copied over, and rows
+whose id is no longer in Postgres are deleted. The refresh runs in the
+background at most every SNAPSHOT_REFRESH_INTERVAL seconds per worker,
+triggered by cache lookups.
+
+Environment:
+    SNAPSHOT_PATH               SQLite file (default: celia-restaurants.sqlite3 in
+                                the temp directory; "off" disables the snapshot)
+    SNAPSHOT_REFRESH_INTERVAL   seconds between incremental refreshes (default 60)
+"""
+
+import os
+import time
+import sqlite3
+import tempfile
+import threading
+from datetime import datetime, timedelta
+
+from background import submit_once
+from logging_config import get_logger
+from metrics import inc, span
+
+log = get_logger("SNAPSHOT")
+
+SNAPSHOT_PATH = os.environ.get("SNAPSHOT_PATH") or os.path.join(
+    tempfile.gettempdir(), "celia-restaurants.sqlite3")
+SNAPSHOT_ENABLED = SNAPSHOT_PATH.lower() != "off"
+SNAPSHOT_REFRESH_INTERVAL = int(os.environ.get("SNAPSHOT_REFRESH_INTERVAL", "60"))
+SNAPSHOT_BATCH_SIZE = 2000   # rows copied per query while refreshing
+SNAPSHOT_OVERLAP = timedelta(minutes=2)  # re-read before the high-water mark
+PRIMARY_RETRY_AFTER = 15     # seconds to serve from the snapshot before retrying Postgres
+
+# Columns copied from Postgres: what database._restaurant_cache_entry and the
+# match index need (analysis_text etc. come from database.SCOUT_BODY_COLUMNS)
+SNAPSHOT_COLUMNS = (
+    "id", "name", "location", "search_query", "safety_score", "searched_at",
+    "result_id", "result_ts", "analysis_text",
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS restaurants (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    location TEXT NOT NULL,
+    search_query TEXT,
+    safety_score INTEGER,
+    searched_at TEXT NOT NULL,
+    result_id TEXT,
+    result_ts TEXT,
+    analysis_text TEXT NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_restaurants_key ON restaurants (name, location);
+CREATE TABLE IF NOT EXISTS snapshot_meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+"""
+
+_state_lock = threading.Lock()
+_refreshed_at = None          # monotonic time of this worker's last refresh
+_primary_down_until = 0.0     # monotonic time until which Postgres is skipped
+_schema_ready = False
+
+
+def _connect():
+    global _schema_ready
+    conn = sqlite3.connect(SNAPSHOT_PATH, timeout=5)
+    conn.row_factory = sqlite3.Row
+    if not _schema_ready:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(_SCHEMA)
+        _schema_ready = True
+    return conn
+
+
+def _row_dict(row):
+    """A snapshot row shaped like the Postgres row it was copied from."""
+    row = dict(row)
+    row["searched_at"] = datetime.fromisoformat(row["searched_at"])
+    return row
+
+
+# ---------------------------------------------------------------------------
+# Primary health
+# ---------------------------------------------------------------------------
+
+def primary_available():
+    """False while reads should go straight to the snapshot (Postgres failed recently)."""
+    return not SNAPSHOT_ENABLED or time.monotonic() >= _primary_down_until
+
+
+def primary_failed(error):
+    """Note a failed or timed-out Postgres read; the snapshot serves reads for
+    the next PRIMARY_RETRY_AFTER seconds."""
+    global _primary_down_until
+    if not SNAPSHOT_ENABLED:
+        return
+    with _state_lock:
+        if time.monotonic() >= _primary_down_until:
+            log.warning("Primary unavailable (%s), serving cache reads from the snapshot for %ds",
+                        str(error).strip(), PRIMARY_RETRY_AFTER)
+        _primary_down_until = time.monotonic() + PRIMARY_RETRY_AFTER
+    inc("celia_snapshot_fallbacks_total")
+
+
+# ---------------------------------------------------------------------------
+# Reads
+# ---------------------------------------------------------------------------
+
+def _select(where, params):
+    if not SNAPSHOT_ENABLED:
+        return []
+    try:
+        with span("snapshot.read"):
+            conn = _connect()
+            try:
+                rows = conn.execute(
+                    f"SELECT {', '.join(SNAPSHOT_COLUMNS)} FROM restaurants WHERE {where}", params
+                ).fetchall()
+            finally:
+                conn.close()
+        return [_row_dict(row) for row in rows]
+    except sqlite3.Error as e:
+        log.error("Error reading snapshot: %s", e)
+        return []
+
+
+def get_row(norm_name, norm_location):
+    rows = _select("name = ? AND location = ?", (norm_name, norm_location))
+    return rows[0] if rows else None
+
+
+def get_row_by_id(restaurant_id):
+    rows = _select("id = ?", (restaurant_id,))
+    return rows[0] if rows else None
+
+
+def get_rows(norm_names, norm_location, restaurant_ids=()):
+    """Rows for several names in one location, plus rows by ID."""
+    names, ids = list(norm_names), list(restaurant_ids)
+    if not names and not ids:
+        return []
+    where = (f"(location = ? AND name IN ({', '.join('?' * len(names))})) "
+             f"OR id IN ({', '.join('?' * len(ids))})")
+    return _select(where, [norm_location, *names, *ids])
+
+
+def get_match_rows():
+    """(id, name, location, safety_score) for every row, for the match index."""
+    return [{key: row[key] for key in ("id", "name", "location", "safety_score")}
+            for row in _select("1 = 1", ())]
+
+
+# ---------------------------------------------------------------------------
+# Refresh
+# ---------------------------------------------------------------------------
+
+def _delete_missing(conn, live_ids):
+    """Delete snapshot rows whose id isn't in `live_ids`. Returns the count."""
+    with conn:
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS live_ids (id INTEGER PRIMARY KEY)")
+        conn.execute("DELETE FROM live_ids")
+        conn.executemany("INSERT INTO live_ids (id) VALUES (?)", ((i,) for i in live_ids))
+        deleted = conn.execute("DELETE FROM restaurants WHERE id NOT IN (SELECT id FROM live_ids)").rowcount
+        conn.execute("DELETE FROM live_ids")
+    return deleted
+
+
+def refresh():
+    """Drop rows deleted from Postgres, then copy rows changed since the
+    high-water mark. Returns the number of rows copied."""
+    global _refreshed_at
+    from database import get_restaurant_ids, get_restaurants_changed_since
+
+    _refreshed_at = time.monotonic()
+    conn = _connect()
+    try:
+        # IDs are read before copying, so a row added meanwhile is kept
+        live_ids = get_restaurant_ids()
+        if live_ids is not None:
+            deleted = _delete_missing(conn, live_ids)
+            if deleted:
+                log.info("Snapshot: removed %d rows deleted from Postgres", deleted)
+        mark = conn.execute("SELECT value FROM snapshot_meta WHERE key = 'searched_at'").fetchone()
+        # Re-read a short overlap: a write can commit after a later-stamped one
+        since = (datetime.fromisoformat(mark["value"]) - SNAPSHOT_OVERLAP) if mark else datetime(1970, 1, 1)
+        after_id = 0
+        copied = 0
+        while True:
+            rows = get_restaurants_changed_since(since, after_id, SNAPSHOT_BATCH_SIZE)
+            if not rows:
+                break
+            with conn:
+                conn.executemany(
+                    # REPLACE also drops a row whose key moved to a new id
+                    f"INSERT OR REPLACE INTO restaurants ({', '.join(SNAPSHOT_COLUMNS)}) "
+                    f"VALUES ({', '.join('?' * len(SNAPSHOT_COLUMNS))})",
+                    [tuple(row["searched_at"].isoformat() if c == "searched_at" else row[c]
+                           for c in SNAPSHOT_COLUMNS) for row in rows],
+                )
+                since, after_id = rows[-1]["searched_at"], rows[-1]["id"]
+                conn.execute(
+                    "INSERT OR REPLACE INTO snapshot_meta (key, value) VALUES ('searched_at', ?)",
+                    (since.isoformat(),),
+                )
+            copied += len(rows)
+            if len(rows) < SNAPSHOT_BATCH_SIZE:
+                break
+        log.debug("Snapshot refreshed: %d rows copied", copied)
+        inc("celia_snapshot_refresh_total", result="ok")
+        return copied
+    except Exception as e:
+        log.error("Error refreshing snapshot: %s", e)
+        inc("celia_snapshot_refresh_total", result="error")
+        return 0
+    finally:
+        conn.close()
+
+
+def maybe_refresh():
+    """Queue a background refresh if this worker hasn't refreshed for
+    SNAPSHOT_REFRESH_INTERVAL seconds (or ever)."""
+    if not SNAPSHOT_ENABLED or not primary_available():
+        return
+    if _refreshed_at is None or time.monotonic() - _refreshed_at > SNAPSHOT_REFRESH_INTERVAL:
+        submit_once("restaurant-snapshot", refresh)
@@ -18,18 +18,21 @@ const historyClose = $("#history-close");
 const historyList = $("#history-list");
 const historyEmpty = $("#history-empty");
 
-let selectedFile = null;
+let selectedFiles = [];
 
-// File selection
+// File selection (several photos are sides of one product: front, ingredients, allergens)
 fileInput.addEventListener("change", (e) => {
-  const file = e.target.files[0];
-  if (!file) return;
+  const files = Array.from(e.target.files);
+  if (files.length === 0) return;
 
-  selectedFile = file;
+  selectedFiles = files;
+  scanBtn.textContent = files.length > 1 ? `Scan ${files.length} Photos` : "Scan Label";
+  const file = files[0];
   const reader = new FileReader();
   reader.onload = (ev) => {
     previewImage.src = ev.target.result;
     hide(uploadArea);
+    hide($("#type-ingredients"));
     hide(resultsSection);
     show(previewSection);
   };
@@ -43,16 +46,21 @@ cancelBtn.addEventListener("click", () => {
 
 // Scan
 scanBtn.addEventListener("click", async () => {
-  if (!selectedFile) return;
+  if (selectedFiles.length === 0) return;
 
   hide(previewSection);
   show(loadingSection);
 
   const formData = new FormData();
-  formData.append("image", selectedFile);
+  selectedFiles.forEach((file) => formData.append("image", file));
+  const batch = selectedFiles.length > 1;
+  if (!batch) {
+    const barcode = await readBarcode(selectedFiles[0]);
+    if (barcode) formData.append("barcode", barcode);
+  }
 
   try {
-    const response = await fetch("/api/scan", {
+    const response = await fetch(batch ? "/api/scan/batch" : "/api/scan", {
       method: "POST",
       body: formData,
     });
@@ -63,6 +71,42 @@ scanBtn.addEventListener("click", async () => {
       throw new Error(data.error || "Scan failed");
     }
 
+    const result = batch ? data.products[0] : { scan: data };
+    if (result.error) {
+      throw new Error(result.error);
+    }
+
+    displayResults(result.scan);
+  } catch (err) {
+    alert(err.message || "Something went wrong. Please try again.");
+    resetToUpload();
+  } finally {
+    hide(loadingSection);
+  }
+});
+
+// Typed ingredients: clear cases are decided on the server without a label analysis
+$("#check-ingredients-btn").addEventListener("click", async () => {
+  const ingredients = $("#ingredients-input").value.trim();
+  if (!ingredients) return;
+
+  hide(uploadArea);
+  hide($("#type-ingredients"));
+  show(loadingSection);
+
+  try {
+    const response = await fetch("/api/check-ingredients", {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({ ingredients }),
+    });
+
+    const data = await response.json();
+
+    if (!response.ok) {
+      throw new Error(data.error || "Check failed");
+    }
+
     displayResults(data);
   } catch (err) {
     alert(err.message || "Something went wrong. Please try again.");
@@ -72,6 +116,19 @@ scanBtn.addEventListener("click", async () => {
   }
 });
 
+// Read the product barcode in the browser where supported, so the server can
+// skip detecting it (known products are answered without a label analysis)
+async function readBarcode(file) {
+  if (!("BarcodeDetector" in window)) return "";
+  try {
+    const detector = new BarcodeDetector({ formats: ["ean_13", "ean_8", "upc_a"] });
+    const codes = await detector.detect(await createImageBitmap(file));
+    return codes.length ? codes[0].rawValue : "";
+  } catch (err) {
+    return "";
+  }
+}
+
 // Display results
 function displayResults(data) {
   const analysis = data.analysis;
@@ -144,13 +201,15 @@ newScanBtn.addEventListener("click", () => {
 });
 
 function resetToUpload() {
-  selectedFile = null;
+  selectedFiles = [];
   fileInput.value = "";
+  scanBtn.textContent = "Scan Label";
   previewImage.src = "";
   hide(previewSection);
   hide(loadingSection);
   hide(resultsSection);
   show(uploadArea);
+  show($("#type-ingredients"));
 }
 
 // History
@@ -192,7 +251,7 @@ async function loadHistory() {
       });
 
       item.innerHTML = `
-        <img class="history-thumb" src="/static/uploads/${scan.filename}" alt="${scan.product_name}" loading="lazy">
+        <img class="history-thumb" src="${scan.thumbnail_url || `/static/uploads/${scan.filename}`}" alt="${escapeHtml(scan.product_name)}" loading="lazy" decoding="async" width="52" height="52">
         <div class="history-info">
           <div class="history-product">${escapeHtml(scan.product_name)}</div>
           <div class="history-date">${dateStr}</div>
@@ -205,12 +264,18 @@ async function loadHistory() {
         </button>
       `;
 
+      // Images past the upload retention window are gone; keep the placeholder
+      item.querySelector(".history-thumb").addEventListener("error", (e) => {
+        e.target.style.visibility = "hidden";
+      });
+
       // Click to view details
       item.addEventListener("click", (e) => {
         if (e.target.closest(".history-delete")) return;
         hide(historyView);
         displayResults(scan);
         hide(uploadArea);
+        hide($("#type-ingredients"));
         show(resultsSection);
       });
 
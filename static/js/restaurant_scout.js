@@ -96,13 +96,32 @@ if (scoutBtn) {
     startLoadingSteps();
 
     try {
-      const response = await fetch("/api/restaurant-scout", {
+      let response = await fetch("/api/restaurant-scout", {
         method: "POST",
         headers: { "Content-Type": "application/json" },
         body: JSON.stringify({ restaurant_name: name, menu_url: menuUrl, location: currentLocation }),
       });
 
-      const data = await response.json();
+      let data = await response.json();
+
+      // A similar restaurant is cached: only show its report if the user confirms it's the one
+      if (response.ok && data.suggestion) {
+        const s = data.suggestion;
+        if (confirm(`Did you mean ${s.name}${s.location ? ` (${s.location})` : ""}?`)) {
+          await fetch("/api/restaurant-scout/confirm-match", {
+            method: "POST",
+            headers: { "Content-Type": "application/json" },
+            body: JSON.stringify({ restaurant_name: name, location: currentLocation, restaurant_id: s.restaurant_id }),
+          });
+          if (await loadReportById(s.restaurant_id)) return;
+        }
+        response = await fetch("/api/restaurant-scout", {
+          method: "POST",
+          headers: { "Content-Type": "application/json" },
+          body: JSON.stringify({ restaurant_name: name, menu_url: menuUrl, location: currentLocation, skip_suggestion: true }),
+        });
+        data = await response.json();
+      }
 
       if (!response.ok) {
         if (data.limit_reached) {
@@ -682,7 +701,8 @@ async function fetchAlternatives(cuisineType, location, originalName) {
           const resp = await fetch("/api/restaurant-scout", {
             method: "POST",
             headers: { "Content-Type": "application/json" },
-            body: JSON.stringify({ restaurant_name: alt.name, menu_url: "", location }),
+            // Names from the alternatives search are already specific; no "did you mean"
+            body: JSON.stringify({ restaurant_name: alt.name, menu_url: "", location, skip_suggestion: true }),
           });
           const data = await resp.json();
 
@@ -1088,6 +1108,21 @@ if (requestForm) {
 // URL Parameter Handling (for links from My Safe Spots and Discover pages)
 // ---------------------------------------------------------------------------
 
+async function loadReportById(id) {
+  try {
+    const response = await fetch(`/api/restaurant/${encodeURIComponent(id)}`);
+    if (!response.ok) return false;
+    const data = await response.json();
+    currentLocation = locationInput ? locationInput.value.trim() : "";
+    currentScoutResult = data;
+    displayScoutResults(data);
+    return true;
+  } catch (err) {
+    console.error("[Scout] Failed to load report", id, err);
+    return false;
+  }
+}
+
 function initFromUrlParams() {
   console.log("[Scout] initFromUrlParams called");
   console.log("[Scout] Current URL:", window.location.href);
@@ -1095,6 +1130,7 @@ function initFromUrlParams() {
   const params = new URLSearchParams(window.location.search);
   const name = params.get("name");
   const location = params.get("location");
+  const reportId = params.get("id");
 
   console.log("[Scout] URL params - name:", name, "location:", location);
   console.log("[Scout] restaurantNameInput element:", restaurantNameInput);
@@ -1131,7 +1167,9 @@ function initFromUrlParams() {
     // Auto-trigger search
     if (scoutBtn) {
       console.log("[Scout] Triggering search in 150ms...");
-      setTimeout(() => {
+      setTimeout(async () => {
+        // Saved restaurants link by ID: load the cached report directly
+        if (reportId && (await loadReportById(reportId))) return;
         console.log("[Scout] NOW triggering scoutBtn.click()");
         scoutBtn.click();
       }, 150);
@@ -0,0 +1,98 @@
+"""Fingerprinted, pre-compressed static assets.
+
+At startup every file under static/ (except user uploads) is read once,
+hashed, and, for text types, compressed with gzip (and brotli when
+installed) at the highest level. url_for("static", ...) then adds ?v=<hash>,
+and a request carrying the current hash is served with a one-year immutable
+Cache-Control, so browsers only re-download an asset after it changes.
+Requests without the hash (or with an old one) get "no-cache" plus an ETag
+and revalidate to 304.
+
+Files that appear after startup (and uploads) fall through to Flask's
+normal static handling.
+"""
+
+import os
+import hashlib
+import mimetypes
+
+from flask import Response, request
+
+from logging_config import get_logger
+from responses import COMPRESS_MIN_BYTES, COMPRESSIBLE_MIMETYPES, accepted_encoding, brotli, compress
+
+log = get_logger("STATIC")
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "public, no-cache"
+SKIP_DIRS = {"uploads"}
+
+_assets = {}  # filename (relative to static/) -> Asset
+
+
+class Asset:
+    __slots__ = ("version", "mimetype", "data", "encoded")
+
+    def __init__(self, data, mimetype):
+        self.version = hashlib.blake2b(data, digest_size=6).hexdigest()
+        self.mimetype = mimetype
+        self.data = data
+        self.encoded = {}  # encoding -> compressed bytes
+        if mimetype in COMPRESSIBLE_MIMETYPES and len(data) >= COMPRESS_MIN_BYTES:
+            for encoding in ("gzip", "br") if brotli is not None else ("gzip",):
+                self.encoded[encoding] = compress(data, encoding, best=True)
+
+
+def build_assets(static_folder):
+    """Hash and pre-compress every static file. Returns the number loaded."""
+    _assets.clear()
+    for root, dirs, files in os.walk(static_folder):
+        dirs[:] = [d for d in dirs if d not in SKIP_DIRS]
+        for name in files:
+            path = os.path.join(root, name)
+            filename = os.path.relpath(path, static_folder).replace(os.sep, "/")
+            mimetype = mimetypes.guess_type(name)[0] or "application/octet-stream"
+            with open(path, "rb") as f:
+                _assets[filename] = Asset(f.read(), mimetype)
+    return len(_assets)
+
+
+def asset_version(filename):
+    asset = _assets.get(filename)
+    return asset.version if asset else None
+
+
+def init_app(app):
+    """Build the asset table and route static requests through it."""
+    count = build_assets(app.static_folder)
+    log.info("Loaded %d static assets", count)
+    send_static_file = app.view_functions["static"]
+
+    @app.url_defaults
+    def _fingerprint_static_urls(endpoint, values):
+        if endpoint == "static" and "filename" in values and "v" not in values:
+            version = asset_version(values["filename"])
+            if version:
+                values["v"] = version
+
+    def serve_static(filename):
+        asset = _assets.get(filename)
+        if asset is None:
+            return send_static_file(filename=filename)
+
+        encoding = accepted_encoding()
+        data = asset.encoded.get(encoding)
+        response = Response(data or asset.data, mimetype=asset.mimetype)
+        response.vary.add("Accept-Encoding")
+        if data:
+            response.headers["Content-Encoding"] = encoding
+            response.set_etag(f"{asset.version}-{encoding}")
+        else:
+            response.set_etag(asset.version)
+        if request.args.get("v") == asset.version:
+            response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+        else:
+            response.headers["Cache-Control"] = REVALIDATE_CACHE_CONTROL
+        return response.make_conditional(request)
+
+    app.view_functions["static"] = serve_static
@@ -0,0 +1,43 @@
+import os
+import sys
+import uuid
+import urllib.parse
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def scratch_database(monkeypatch):
+    """An empty database on the server at TEST_DATABASE_URL, set as
+    DATABASE_URL for the test and dropped afterwards. Tests using it are
+    skipped when TEST_DATABASE_URL isn't set."""
+    server_url = os.environ.get("TEST_DATABASE_URL")
+    if not server_url:
+        pytest.skip("TEST_DATABASE_URL not set")
+    import psycopg2
+
+    dbname = f"celia_test_{uuid.uuid4().hex[:8]}"
+    admin = psycopg2.connect(server_url)
+    admin.autocommit = True
+    try:
+        with admin.cursor() as cur:
+            cur.execute(f"CREATE DATABASE {dbname}")
+        parts = urllib.parse.urlsplit(server_url)
+        database_url = urllib.parse.urlunsplit(parts._replace(path="/" + dbname))
+        monkeypatch.setenv("DATABASE_URL", database_url)
+        yield database_url
+    finally:
+        with admin.cursor() as cur:
+            cur.execute(f"DROP DATABASE IF EXISTS {dbname} WITH (FORCE)")
+        admin.close()
+
+
+@pytest.fixture
+def migrated_database(scratch_database):
+    """scratch_database with every migration applied."""
+    import database
+
+    assert database.apply_migrations()
+    return scratch_database
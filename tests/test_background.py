@@ -0,0 +1,52 @@
+"""Background pools: de-duplication, the refresh cap, and short jobs not
+waiting behind refreshes."""
+
+import threading
+
+import pytest
+
+import background
+
+
+@pytest.fixture
+def pools(monkeypatch):
+    default = background._Pool("test-bg", 1)
+    refresh = background._Pool("test-refresh", 1, max_pending=2)
+    monkeypatch.setattr(background, "_default_pool", default)
+    monkeypatch.setattr(background, "_refresh_pool", refresh)
+    release = threading.Event()
+    yield release
+    release.set()
+
+
+def test_same_key_runs_once(pools):
+    release = pools
+    assert background.submit_once("k", release.wait, 5)
+    assert not background.submit_once("k", release.wait, 5)
+
+
+def test_full_refresh_pool_drops(pools):
+    release = pools
+    assert background.submit_refresh("a", release.wait, 5)   # running
+    assert background.submit_refresh("b", release.wait, 5)   # queued
+    assert not background.submit_refresh("c", release.wait, 5)
+    assert background.submit_refresh("a", release.wait, 5)   # already pending
+
+
+def test_short_jobs_do_not_wait_for_refreshes(pools):
+    release = pools
+    background.submit_refresh("slow", release.wait, 5)
+    ran = threading.Event()
+    background.submit_once("thumbnail", ran.set)
+    assert ran.wait(2)
+
+
+def test_key_is_released_after_the_job(pools):
+    done = threading.Event()
+    background.submit_once("k", done.set)
+    assert done.wait(2)
+    for _ in range(100):
+        if not background._default_pool.pending("k"):
+            break
+        threading.Event().wait(0.01)
+    assert background.submit_once("k", lambda: None)
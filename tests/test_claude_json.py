@@ -0,0 +1,103 @@
+"""claude_json: pulling the answer out of fenced, prose-wrapped, multi-object
+and truncated responses, and schema validation."""
+
+import json
+
+import pytest
+
+from claude_json import RESPONSE_SCHEMAS, SchemaMismatch, extract_json, iter_json_objects, parse_claude_json, validate
+
+LABEL = {"verdict": "SAFE", "summary": "No gluten ingredients."}
+
+
+def test_fenced_output():
+    text = "```json\n" + json.dumps(LABEL, indent=2) + "\n```"
+    assert parse_claude_json(text, "label") == LABEL
+
+
+def test_fenced_output_without_language():
+    text = "Here you go:\n```\n" + json.dumps(LABEL) + "\n```\n"
+    assert parse_claude_json(text, "label") == LABEL
+
+
+def test_prose_wrapped_output():
+    text = f"Based on my research, here is the analysis:\n{json.dumps(LABEL)}\nLet me know if you need more."
+    assert parse_claude_json(text, "label") == LABEL
+
+
+def test_braces_in_prose_are_skipped():
+    text = (
+        "I searched for {cuisine} restaurants (see {1}).\n"
+        + json.dumps({"safety_score": 7, "summary": "Uses {separate} fryers"})
+        + "\nThat is my answer }"
+    )
+    assert parse_claude_json(text, "scout") == {"safety_score": 7, "summary": "Uses {separate} fryers"}
+
+
+def test_multiple_objects_pick_the_one_matching_the_schema():
+    draft = {"note": "draft", "restaurant": "Zahav"}
+    final = {"safety_score": 8, "summary": "Dedicated fryer."}
+    text = json.dumps(draft) + "\nRevised:\n" + json.dumps(final)
+    assert parse_claude_json(text, "scout") == final
+
+
+def test_multiple_matching_objects_take_the_first():
+    first = {"safety_score": 6}
+    second = {"safety_score": 9}
+    assert parse_claude_json(json.dumps(first) + " " + json.dumps(second), "scout") == first
+
+
+def test_without_schema_the_largest_object_wins():
+    text = '{"a": 1} then {"a": 1, "b": 2, "c": 3} then {"d": 4}'
+    assert extract_json(text) == {"a": 1, "b": 2, "c": 3}
+
+
+def test_iter_json_objects_yields_top_level_objects_in_order():
+    text = 'x {"a": {"nested": 1}} y {"b": [1, {"c": 2}]} z'
+    assert list(iter_json_objects(text)) == [{"a": {"nested": 1}}, {"b": [1, {"c": 2}]}]
+
+
+def test_truncated_object_is_not_json():
+    text = '```json\n{"restaurant_name": "Zahav", "safety_score": 7, "summary": "Dedicated GF me'
+    with pytest.raises(json.JSONDecodeError) as excinfo:
+        parse_claude_json(text, "scout")
+    assert not isinstance(excinfo.value, SchemaMismatch)
+
+
+def test_truncated_object_after_a_complete_one_keeps_the_complete_one():
+    text = json.dumps({"safety_score": 5}) + '\n{"safety_score": 8, "summary": "cut o'
+    assert parse_claude_json(text, "scout") == {"safety_score": 5}
+
+
+def test_no_json_at_all():
+    with pytest.raises(json.JSONDecodeError):
+        parse_claude_json("I could not find this restaurant.", "scout")
+
+
+def test_schema_mismatch_is_a_json_decode_error():
+    text = json.dumps({"verdict": "MAYBE", "summary": "Unsure."})
+    with pytest.raises(SchemaMismatch, match=r"\$\.verdict should be one of"):
+        parse_claude_json(text, "label")
+    # callers that only catch JSONDecodeError still handle it
+    with pytest.raises(json.JSONDecodeError):
+        parse_claude_json(text, "label")
+
+
+def test_schema_mismatch_reports_the_first_error():
+    text = json.dumps({"restaurants": [{"name": "Zahav"}, {"city": "Philadelphia"}]})
+    with pytest.raises(SchemaMismatch, match=r"\$\.restaurants\[1\]\.name is missing"):
+        parse_claude_json(text, "discover")
+
+
+@pytest.mark.parametrize("value, schema, error", [
+    ({"safety_score": None}, "scout", None),
+    ({"safety_score": 7.5}, "scout", None),
+    ({"safety_score": "7"}, "scout", "$.safety_score has the wrong type (str)"),
+    ({"alternatives": []}, "alternatives", None),
+    ({"alternatives": {"name": "x"}}, "alternatives", "$.alternatives should be an array"),
+    ({"alternatives": ["x"]}, "alternatives", "$.alternatives[0] should be an object"),
+    ({"summary": "ok"}, "label", "$.verdict is missing"),
+    ([LABEL], "label", "$ should be an object"),
+])
+def test_validate(value, schema, error):
+    assert validate(value, RESPONSE_SCHEMAS[schema]) == error
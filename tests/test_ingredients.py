@@ -0,0 +1,156 @@
+"""Pre-screen rules in ingredients.py: clear cases decided locally,
+negated and unfamiliar mentions escalated to Claude."""
+
+import pytest
+
+import ingredients
+from ingredients import AMBIGUOUS, GLUTEN, UNRECOGNIZED, find_terms, prescreen
+
+
+def verdict(text, source="typed"):
+    analysis = prescreen(text, source=source)
+    return analysis and analysis["verdict"]
+
+
+@pytest.mark.parametrize("text", [
+    "Ingredients: enriched wheat flour, sugar, salt",
+    "Ingredients: flour, sugar, salt",
+    "Ingredients: organic flour, water, yeast",
+    "Ingredients: water, barley malt, hops",
+    "Ingredients: wheat flour, sugar. Contains no peanuts.",
+    "Ingredients: wheat flour. Contains no barley.",
+    "Ingredients: rice flour, yellow no. 5, wheat starch",
+    "Ingredients: wheat flour (not bromated), sugar",
+    "Ingredients: enriched flour (not bromated), wheat starch",
+    "Ingredients: enriched flour (wheat flour, niacin, iron), sugar",
+    "Ingredients: rice, wheat [not genetically modified]",
+    "Ingredients: rice flour (gluten free), malt extract",
+])
+def test_gluten_source_is_unsafe(text):
+    assert verdict(text) == "UNSAFE"
+    assert verdict(text, source="ocr") == "UNSAFE"
+
+
+@pytest.mark.parametrize("text", [
+    "Contains no wheat.",
+    "Does not contain gluten.",
+    "free of gluten",
+    "Free from wheat and barley.",
+    "Made without wheat flour.",
+    "Does not contain: wheat, barley",
+    "Ingredients: rice flour, sugar. Contains no wheat, barley or rye.",
+    "Gluten and wheat free. Ingredients: rice, salt",
+    "Wheat is not an ingredient.",
+    "Ingredients: rice flour (not wheat), salt",
+])
+def test_negated_gluten_escalates(text):
+    assert find_terms(text)[GLUTEN] == []
+    assert find_terms(text)[AMBIGUOUS]
+    assert verdict(text) is None
+    assert verdict(text, source="ocr") is None
+
+
+@pytest.mark.parametrize("text", [
+    "Ingredients: tigernut flour, dates, salt",
+    "Ingredients: cricket flour, cocoa",
+])
+def test_unknown_flour_escalates(text):
+    assert find_terms(text)[AMBIGUOUS] == [text.split(": ")[1].split(",")[0]]
+    assert verdict(text) is None
+
+
+@pytest.mark.parametrize("text", [
+    "Ingredients: rice flour, almond flour, sugar",
+    "Ingredients: buckwheat, corn starch, corn maltodextrin",
+])
+def test_exceptions_are_not_gluten(text):
+    assert find_terms(text)[GLUTEN] == []
+    assert find_terms(text)[AMBIGUOUS] == []
+
+
+def test_certified_with_nothing_risky_is_safe_only_when_typed():
+    text = "Ingredients: rice flour, sugar. Certified gluten-free."
+    assert verdict(text) == "SAFE"
+    assert verdict(text, source="ocr") is None
+
+
+def test_certified_with_negated_gluten_escalates():
+    assert verdict("Certified gluten-free. Contains no wheat.") is None
+
+
+@pytest.mark.parametrize("text", [
+    "Contains less than 20 ppm gluten",
+    "Gluten: none",
+    "Gluten: 0 mg per serving",
+    "Ingredients: rice, salt. 0 mg gluten.",
+    "Contains gluten.",
+    "Certified gluten-free. Less than 10 ppm gluten.",
+])
+def test_bare_gluten_declaration_escalates(text):
+    assert find_terms(text)[GLUTEN] == []
+    assert find_terms(text)[AMBIGUOUS] == ["gluten"]
+    assert verdict(text) is None
+    assert verdict(text, source="ocr") is None
+
+
+@pytest.mark.parametrize("text", [
+    "Certified gluten free. Ingredients: rice, Triticum aestivum",
+    "Certified gluten free. Ingredients: rice flour, dinkel",
+    "Certified gluten free. Ingredients: chocolate, pretzel pieces",
+    "Certified gluten free. Ingredients: cracker meal, salt",
+])
+def test_certified_with_a_less_common_gluten_source_escalates(text):
+    assert find_terms(text)[GLUTEN]
+    assert verdict(text) is None
+
+
+def test_certified_gluten_free_pretzels_are_safe():
+    assert find_terms("Certified gluten free. Ingredients: gluten-free pretzels, rice flour")[GLUTEN] == []
+
+
+def test_certified_confidence_depends_on_recognizing_every_item():
+    known = prescreen("Ingredients: rice flour, corn starch. Certified gluten-free.")
+    assert (known["verdict"], known["confidence"]) == ("SAFE", "HIGH")
+
+    text = "Ingredients: rice flour, sugar, crisps (sorghum, salt). Certified gluten-free."
+    assert find_terms(text)[UNRECOGNIZED] == ["sugar", "crisps", "sorghum", "salt"]
+    partly = prescreen(text)
+    assert (partly["verdict"], partly["confidence"]) == ("SAFE", "MEDIUM")
+    assert "Sugar, crisps, sorghum and 1 more are not in the ingredient lexicon" in partly["detailed_reasoning"]
+
+
+def test_warning_in_parentheses_ends_with_them():
+    found = find_terms("Ingredients: rice (may contain wheat), malt extract")
+    assert found[GLUTEN] == ["malt extract"]
+
+
+@pytest.mark.parametrize("text", [
+    "Ingredients: rice, natural flavors",
+    "Ingredients: rice, sugar. May contain wheat.",
+    "May contain: wheat",
+    "Processed in a facility that also handles barley.",
+])
+def test_hidden_risk_or_warning_investigates(text):
+    assert verdict(text) == "INVESTIGATE"
+    assert verdict(text, source="ocr") is None
+
+
+def test_nothing_recognized_escalates():
+    assert verdict("Ingredients: rice, water, salt") is None
+
+
+@pytest.mark.parametrize("text, summary", [
+    ("Ingredients: wheat flour, sugar", "Contains wheat flour, which contains gluten."),
+    ("Ingredients: barley, rye", "Contains barley and rye, which contain gluten."),
+    ("Ingredients: wheat, barley, rye, spelt, sugar", "Contains wheat, barley, rye and 1 more, which contain gluten."),
+    ("Ingredients: vital wheat gluten, water", "Contains vital wheat gluten."),
+    ("Ingredients: barley, vital wheat gluten", "Contains barley and vital wheat gluten."),
+])
+def test_unsafe_summary(text, summary):
+    assert prescreen(text)["summary"] == summary
+
+
+def test_normalize_text_keeps_items_and_sentences():
+    assert ingredients.normalize_text("Contains: Wheat, Barley; may contain rye.") == \
+        " contains wheat , barley . may contain rye . "
+    assert ingredients.normalize_text("Flour (Wheat) [Enriched]") == " flour ( wheat ) ( enriched ) "
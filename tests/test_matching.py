@@ -0,0 +1,150 @@
+"""Restaurant name matching: which cached report a search may be served,
+which it may only be offered, and when an alias is remembered."""
+
+import pytest
+
+import matching
+from matching import (
+    MatchIndex, _classify, _within_one_edit, canonical_location, canonical_name, same_words,
+    MATCH_THRESHOLD, SUGGEST_THRESHOLD,
+)
+
+ROWS = [
+    {"id": 1, "name": "thai kitchen", "location": "philadelphia, pa", "safety_score": 7},
+    {"id": 2, "name": "zahav", "location": "philadelphia, pa", "safety_score": 8},
+    {"id": 3, "name": "vetri cucina", "location": "philadelphia, pa", "safety_score": 6},
+    {"id": 4, "name": "joes pizza", "location": "new york, ny", "safety_score": 5},
+]
+
+
+@pytest.fixture
+def index(monkeypatch):
+    """A fresh in-memory index in place of the database-built one; alias
+    writes are recorded instead of stored."""
+    index = MatchIndex(ROWS)
+    written = []
+    monkeypatch.setattr(matching, "_index", index)
+    monkeypatch.setattr(matching, "add_restaurant_alias", lambda *args: written.append(args))
+    monkeypatch.setattr(matching, "get_restaurant_id", lambda name, location: None)
+    index.written = written
+    return index
+
+
+@pytest.mark.parametrize("a, b", [("abc", "abd"), ("abc", "ab"), ("abc", "xabc"), ("abc", "abc")])
+def test_within_one_edit(a, b):
+    assert _within_one_edit(a, b)
+    assert _within_one_edit(b, a)
+
+
+@pytest.mark.parametrize("a, b", [("abcd", "abdc"), ("abc", "abcde"), ("abc", "xyz")])
+def test_not_within_one_edit(a, b):
+    assert not _within_one_edit(a, b)
+
+
+@pytest.mark.parametrize("a, b", [
+    ("thai kitchen", "thai kitchen"),
+    ("thai kitchen", "kitchen thai"),
+    ("thai kitchen", "thai kitchn"),
+    ("vetri cucina", "vetri cuccina"),
+    ("zahav", "zahv"),
+])
+def test_same_words(a, b):
+    assert same_words(a, b)
+    assert same_words(b, a)
+
+
+@pytest.mark.parametrize("a, b", [
+    ("thai kitchen express", "thai kitchen"),   # extra word
+    ("thai kitchen 2", "thai kitchen"),
+    ("vedge bar", "vedge"),
+    ("joe pizza", "joes pizza"),               # typo in a short word
+    ("pho", "phi"),
+    ("abcd", "abce"),                          # four-letter words must be exact
+    ("thai kitchen", "thai chicken"),          # more than one edit
+    ("thai thai", "thai kitchen"),
+])
+def test_different_words(a, b):
+    assert not same_words(a, b)
+    assert not same_words(b, a)
+
+
+@pytest.mark.parametrize("location, city", [
+    ("Reading Terminal Market, Philadelphia, PA", "philadelphia"),
+    ("Philadelphia PA", "philadelphia"),
+    ("Philly", "philadelphia"),
+    ("New York City, NY, USA", "new york"),
+    ("nyc", "new york"),
+    ("", ""),
+])
+def test_canonical_location(location, city):
+    assert canonical_location(location) == city
+
+
+@pytest.mark.parametrize("name, location, canonical", [
+    ("Zahav Restaurant", "Philadelphia", "zahav"),
+    ("Zahav Philly", "Philadelphia, PA", "zahav"),
+    ("  THAI   Kitchen!! ", "", "thai kitchen"),
+    ("Joe's Pizza", "NYC", "joes pizza"),
+    ("The Restaurant", "", "the restaurant"),  # nothing distinguishing: keep it all
+])
+def test_canonical_name(name, location, canonical):
+    assert canonical_name(name, location) == canonical
+
+
+def test_thresholds_are_ordered():
+    assert SUGGEST_THRESHOLD < MATCH_THRESHOLD <= 1
+
+
+@pytest.mark.parametrize("match, how", [
+    ((1, 1.0, True), "fuzzy"),
+    ((1, MATCH_THRESHOLD, True), "fuzzy"),
+    ((1, MATCH_THRESHOLD - 0.01, True), "suggestion"),
+    ((1, 1.0, False), "suggestion"),
+    ((1, SUGGEST_THRESHOLD, False), "suggestion"),
+    ((1, SUGGEST_THRESHOLD - 0.01, True), None),
+    ((None, 1.0, True), None),
+])
+def test_classify(match, how):
+    assert _classify(*match) == how
+
+
+@pytest.mark.parametrize("name, location, expected", [
+    ("Zahav Restaurant", "Philly", (2, "fuzzy")),
+    ("Vetri Cuccina", "Philadelphia, PA", (3, "fuzzy")),
+    ("Thai Kitchen Express", "Philadelphia", (1, "suggestion")),
+    ("Thai Kitchen 2", "Philadelphia", (1, "suggestion")),
+    ("Joe Pizza", "NYC", (4, "suggestion")),
+    ("Thai Kitchen", "Pittsburgh", (None, None)),
+    ("Golden Dragon", "Philadelphia", (None, None)),
+])
+def test_resolve_never_writes_aliases(index, name, location, expected):
+    assert matching.resolve_restaurant_id(name, location) == expected
+    assert index.written == []
+
+
+def test_confirm_accepts_the_suggested_restaurant(index):
+    assert matching.confirm_match("Thai Kitchen Express", "Philadelphia", 1)
+    assert index.written == [("Thai Kitchen Express", "Philadelphia", 1)]
+    assert matching.resolve_restaurant_id("Thai Kitchen Express", "Philadelphia") == (1, "alias")
+
+
+@pytest.mark.parametrize("name, location, restaurant_id", [
+    ("Thai Kitchen Express", "Philadelphia", 2),   # suggested, but a different id
+    ("Golden Dragon", "Philadelphia", 1),          # nothing suggested
+    ("Thai Kitchen Express", "Pittsburgh", 1),     # another city
+])
+def test_confirm_refuses_unrelated_restaurants(index, name, location, restaurant_id):
+    assert not matching.confirm_match(name, location, restaurant_id)
+    assert index.written == []
+    assert matching.resolve_restaurant_id(name, location)[1] != "alias"
+
+
+def test_index_restaurant_aliases_a_new_official_name(index):
+    matching.index_restaurant(5, "dizengoff philly", "Philadelphia", 7, official_name="Dizengoff Hummus")
+    assert index.written == [("Dizengoff Hummus", "Philadelphia", 5)]
+
+
+def test_index_restaurant_does_not_alias_a_name_like_another(index):
+    matching.index_restaurant(5, "thai kitchen express", "Philadelphia", 7, official_name="Thai Kitchen Xpress")
+    assert index.written == []
+    assert matching.resolve_restaurant_id("Thai Kitchen Express", "Philadelphia") == (5, "fuzzy")
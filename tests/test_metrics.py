@@ -0,0 +1,65 @@
+"""Cross-worker aggregation in metrics.py."""
+
+import json
+import os
+import time
+
+import pytest
+
+import metrics
+
+
+@pytest.fixture(autouse=True)
+def clean_metrics():
+    metrics.reset()
+    yield
+    metrics.reset()
+
+
+def write_worker(directory, pid, snapshot, age=0):
+    path = directory / f"{pid}.json"
+    path.write_text(json.dumps(snapshot))
+    mtime = time.time() - age
+    os.utime(path, (mtime, mtime))
+
+
+def series(report, kind, metric, **labels):
+    return next(e for e in report[kind][metric] if e["labels"] == labels)
+
+
+def test_aggregate_adds_up_workers(tmp_path):
+    metrics.inc("celia_cache_lookups_total", result="hit")
+    metrics.observe("celia_request_seconds", 0.1, route="/a")
+    write_worker(tmp_path, 1, {
+        "timings": [["celia_request_seconds", {"route": "/a"}, 3, 0.9, [0.3, 0.3, 0.3]]],
+        "counters": [["celia_cache_lookups_total", {"result": "hit"}, 4]],
+    })
+
+    report = metrics.aggregate_report(str(tmp_path))
+
+    assert series(report, "counters", "celia_cache_lookups_total", result="hit")["value"] == 5
+    timing = series(report, "timings", "celia_request_seconds", route="/a")
+    assert timing["count"] == 4
+    assert timing["sum"] == pytest.approx(1.0)
+    assert timing["p50"] == pytest.approx(0.3)
+    assert (tmp_path / f"{os.getpid()}.json").exists()
+
+
+def test_exited_worker_keeps_counts_but_not_samples(tmp_path):
+    metrics.observe("celia_request_seconds", 0.1, route="/a")
+    write_worker(tmp_path, 1, {
+        "timings": [["celia_request_seconds", {"route": "/a"}, 2, 20.0, [10.0, 10.0]]],
+        "counters": [],
+    }, age=10 * metrics.METRICS_FLUSH_INTERVAL)
+
+    timing = series(metrics.aggregate_report(str(tmp_path)), "timings", "celia_request_seconds", route="/a")
+
+    assert timing["count"] == 3
+    assert timing["p99"] == pytest.approx(0.1)
+
+
+def test_report_is_this_process_only(tmp_path):
+    metrics.inc("celia_cache_lookups_total", result="miss")
+    write_worker(tmp_path, 1, {"timings": [], "counters": [["celia_cache_lookups_total", {"result": "miss"}, 7]]})
+
+    assert series(metrics.report(), "counters", "celia_cache_lookups_total", result="miss")["value"] == 1
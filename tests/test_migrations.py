@@ -0,0 +1,85 @@
+"""Versioned migrations (database.apply_migrations): file ordering, and
+applying against a scratch database once, twice and concurrently."""
+
+import re
+import threading
+
+import database
+
+
+def write_migrations(directory, files):
+    for filename, sql in files.items():
+        (directory / filename).write_text(sql)
+
+
+def recorded_versions():
+    conn = database.get_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT version, applied_at FROM schema_migrations ORDER BY version")
+            return [(row["version"], row["applied_at"]) for row in cur.fetchall()]
+    finally:
+        conn.close()
+
+
+def test_shipped_migrations_are_numbered_in_order():
+    versions = [version for version, _ in database.list_migrations()]
+    assert versions, "migrations/ is empty"
+    numbers = [int(re.match(r"(\d{4})_\w+$", version).group(1)) for version in versions]
+    assert numbers == sorted(set(numbers))
+
+
+def test_list_migrations_sorts_by_version_and_skips_other_files(tmp_path, monkeypatch):
+    write_migrations(tmp_path, {"0010_later.sql": "", "0002_first.sql": "", "README.txt": ""})
+    monkeypatch.setattr(database, "MIGRATIONS_DIR", str(tmp_path))
+    assert [version for version, _ in database.list_migrations()] == ["0002_first", "0010_later"]
+
+
+def test_apply_migrations_twice_is_a_no_op(scratch_database):
+    assert database.apply_migrations()
+    first = recorded_versions()
+    assert [version for version, _ in first] == [version for version, _ in database.list_migrations()]
+
+    assert database.apply_migrations()
+    assert recorded_versions() == first
+
+
+def test_migrations_apply_in_version_order(scratch_database, tmp_path, monkeypatch):
+    # 0002 fails unless 0001 already ran
+    write_migrations(tmp_path, {
+        "0002_add_column.sql": "ALTER TABLE widgets ADD COLUMN colour TEXT;",
+        "0001_create.sql": "CREATE TABLE widgets (id SERIAL PRIMARY KEY);",
+    })
+    monkeypatch.setattr(database, "MIGRATIONS_DIR", str(tmp_path))
+    assert database.apply_migrations()
+    assert [version for version, _ in recorded_versions()] == ["0001_create", "0002_add_column"]
+
+    # a later file is picked up on the next run, the earlier ones are not re-run
+    write_migrations(tmp_path, {"0003_index.sql": "CREATE INDEX idx_widgets_colour ON widgets (colour);"})
+    assert database.apply_migrations()
+    assert [version for version, _ in recorded_versions()] == ["0001_create", "0002_add_column", "0003_index"]
+
+
+def test_failed_migration_keeps_earlier_ones(scratch_database, tmp_path, monkeypatch):
+    write_migrations(tmp_path, {
+        "0001_create.sql": "CREATE TABLE widgets (id SERIAL PRIMARY KEY);",
+        "0002_broken.sql": "ALTER TABLE no_such_table ADD COLUMN x TEXT;",
+    })
+    monkeypatch.setattr(database, "MIGRATIONS_DIR", str(tmp_path))
+    assert not database.apply_migrations()
+    assert [version for version, _ in recorded_versions()] == ["0001_create"]
+
+    write_migrations(tmp_path, {"0002_broken.sql": "ALTER TABLE widgets ADD COLUMN x TEXT;"})
+    assert database.apply_migrations()
+    assert [version for version, _ in recorded_versions()] == ["0001_create", "0002_broken"]
+
+
+def test_concurrent_callers_migrate_once(scratch_database):
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(database.apply_migrations())) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=30)
+    assert results == [True] * 4
+    assert len(recorded_versions()) == len(database.list_migrations())
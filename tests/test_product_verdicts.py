@@ -0,0 +1,99 @@
+"""Barcode product index (app.product_verdict): which barcode a verdict is
+filed under, and that a barcode the client sent is never given one it
+didn't earn."""
+
+import pytest
+
+import app as celia
+import database
+
+PHOTOS = [(b"photo bytes", "image/jpeg")]
+ANALYSIS = {"product_name": "Rice Crackers", "verdict": "SAFE", "confidence": "HIGH", "summary": "No gluten."}
+
+
+@pytest.fixture
+def scan(monkeypatch):
+    """product_verdict with barcode detection, OCR and Claude replaced, and
+    the index in a dict. Set scan.photo_code to the code "in" the photos."""
+    state = type("Scan", (), {})()
+    state.photo_code = None
+    state.index = {}
+    state.vision_calls = 0
+    state.analysis = dict(ANALYSIS)
+
+    def analyze_label(images, **kwargs):
+        state.vision_calls += 1
+        return state.analysis
+
+    monkeypatch.setattr(celia.barcodes, "detect_barcode", lambda data: state.photo_code)
+    monkeypatch.setattr(celia.ingredients, "ocr_available", lambda: False)
+    monkeypatch.setattr(celia, "analyze_label", analyze_label)
+    monkeypatch.setattr(celia, "get_product_verdict", lambda code: state.index.get(code))
+    monkeypatch.setattr(celia, "save_product_verdict",
+                        lambda code, analysis: state.index.__setitem__(code, {"analysis": analysis}))
+    return state
+
+
+def test_detected_barcode_is_indexed_before_returning(scan):
+    scan.photo_code = "0012345678905"
+    assert celia.product_verdict(PHOTOS) == (ANALYSIS, "0012345678905", False)
+    assert scan.index == {"0012345678905": {"analysis": ANALYSIS}}
+
+
+def test_known_barcode_skips_vision(scan):
+    scan.photo_code = "0012345678905"
+    celia.product_verdict(PHOTOS)
+    assert celia.product_verdict(PHOTOS) == (ANALYSIS, "0012345678905", True)
+    assert scan.vision_calls == 1
+
+
+def test_client_barcode_not_in_the_photos_is_not_indexed(scan):
+    scan.photo_code = None
+    analysis, barcode, from_index = celia.product_verdict(PHOTOS, barcode="0099999999990")
+    assert (analysis, barcode, from_index) == (ANALYSIS, "0099999999990", False)
+    assert scan.index == {}
+
+    # photos of a different product than the code the client sent
+    scan.photo_code = "0012345678905"
+    celia.product_verdict(PHOTOS, barcode="0099999999990")
+    assert "0099999999990" not in scan.index
+
+
+def test_client_barcode_confirmed_by_the_photos_is_indexed(scan):
+    scan.photo_code = "0012345678905"
+    celia.product_verdict(PHOTOS, barcode="0012345678905")
+    assert list(scan.index) == ["0012345678905"]
+
+
+def test_forged_barcode_never_gets_a_cached_verdict(scan):
+    # someone photographs crackers but sends the code of another product
+    scan.photo_code = None
+    celia.product_verdict(PHOTOS, barcode="0099999999990")
+
+    # the real product behind that code is still analyzed, not answered from the index
+    scan.photo_code = "0099999999990"
+    scan.analysis = {"product_name": "Wheat Thins", "verdict": "UNSAFE", "confidence": "HIGH", "summary": "Wheat."}
+    analysis, _, from_index = celia.product_verdict(PHOTOS, barcode="0099999999990")
+    assert not from_index
+    assert analysis["verdict"] == "UNSAFE"
+    assert scan.vision_calls == 2
+
+
+def test_low_confidence_reads_are_not_indexed(scan):
+    scan.photo_code = "0012345678905"
+    scan.analysis = dict(ANALYSIS, confidence="LOW")
+    celia.product_verdict(PHOTOS)
+    assert scan.index == {}
+
+
+def test_forged_barcode_is_not_saved_to_postgres(scan, migrated_database, monkeypatch):
+    monkeypatch.setattr(celia, "get_product_verdict", database.get_product_verdict)
+    monkeypatch.setattr(celia, "save_product_verdict", database.save_product_verdict)
+
+    celia.product_verdict(PHOTOS, barcode="0099999999990")
+    assert database.get_product_verdict("0099999999990") is None
+
+    scan.photo_code = "0012345678905"
+    celia.product_verdict(PHOTOS, barcode="0012345678905")
+    assert database.get_product_verdict("0012345678905")["analysis"] == ANALYSIS
+    assert celia.product_verdict(PHOTOS, barcode="0012345678905")[2] is True
@@ -0,0 +1,132 @@
+"""responses: splice_json, strong ETags with 304 revalidation, and
+Accept-Encoding negotiation, through a Flask test client."""
+
+import gzip
+import json
+
+import pytest
+from flask import Flask
+
+import responses
+
+BIG_BODY = json.dumps({"restaurant_name": "Zahav", "summary": "Dedicated fryer. " * 100})
+SMALL_BODY = json.dumps({"restaurant_name": "Zahav"})
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(responses, "_compressed", responses.OrderedDict())
+    app = Flask(__name__)
+    responses.init_app(app)
+
+    @app.route("/report/<size>")
+    def report(size):
+        body = BIG_BODY if size == "big" else SMALL_BODY
+        return responses.json_body_response(responses.splice_json(body, cached=True), cache_control="no-cache")
+
+    @app.route("/page")
+    def page():
+        return "<p>" + "gluten free " * 200 + "</p>"
+
+    return app.test_client()
+
+
+def test_splice_json_adds_fields():
+    body = json.dumps({"a": 1, "nested": {"b": "}"}})
+    spliced = responses.splice_json(body, cached=True, age_days=3, note='say "hi"')
+    assert json.loads(spliced) == {"a": 1, "nested": {"b": "}"}, "cached": True, "age_days": 3, "note": 'say "hi"'}
+
+
+def test_splice_json_without_fields_is_unchanged():
+    assert responses.splice_json(SMALL_BODY) is SMALL_BODY
+
+
+def test_spliced_body_is_served_as_json(client):
+    response = client.get("/report/small")
+    assert response.status_code == 200
+    assert response.mimetype == "application/json"
+    assert response.get_json() == {"restaurant_name": "Zahav", "cached": True}
+    assert response.headers["Cache-Control"] == "no-cache"
+
+
+def test_strong_etag_and_304(client):
+    first = client.get("/report/small", headers={"Accept-Encoding": "identity"})
+    etag, weak = first.get_etag()
+    assert etag and not weak
+    assert etag == responses.strong_etag(first.data)
+
+    again = client.get("/report/small", headers={"If-None-Match": f'"{etag}"'})
+    assert again.status_code == 304
+    assert again.data == b""
+    assert again.get_etag() == (etag, False)
+
+
+def test_stale_etag_gets_the_body(client):
+    response = client.get("/report/small", headers={"If-None-Match": '"not-the-etag"'})
+    assert response.status_code == 200
+    assert response.get_json()["cached"] is True
+
+
+def test_weak_if_none_match_does_not_revalidate(client):
+    etag = client.get("/report/small").get_etag()[0]
+    response = client.get("/report/small", headers={"If-None-Match": f'W/"{etag}"'})
+    assert response.status_code == 200
+
+
+def test_gzip_when_accepted(client, monkeypatch):
+    monkeypatch.setattr(responses, "brotli", None)
+    response = client.get("/report/big", headers={"Accept-Encoding": "gzip, br"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["Vary"]
+    assert json.loads(gzip.decompress(response.data)) == json.loads(responses.splice_json(BIG_BODY, cached=True))
+
+    etag = response.get_etag()[0]
+    assert etag.endswith("-gzip")
+    assert client.get("/report/big", headers={"Accept-Encoding": "gzip", "If-None-Match": f'"{etag}"'}).status_code == 304
+    # the compressed ETag doesn't revalidate the uncompressed variant
+    assert client.get("/report/big", headers={"Accept-Encoding": "identity", "If-None-Match": f'"{etag}"'}).status_code == 200
+
+
+@pytest.mark.skipif(responses.brotli is None, reason="brotli not installed")
+def test_brotli_preferred_when_accepted(client):
+    response = client.get("/report/big", headers={"Accept-Encoding": "gzip, br"})
+    assert response.headers["Content-Encoding"] == "br"
+    assert response.get_etag()[0].endswith("-br")
+    assert json.loads(responses.brotli.decompress(response.data))["cached"] is True
+
+
+def test_identity_when_nothing_accepted(client):
+    response = client.get("/report/big", headers={"Accept-Encoding": "identity"})
+    assert "Content-Encoding" not in response.headers
+    assert response.get_json()["cached"] is True
+    assert "-" not in response.get_etag()[0]
+
+
+def test_small_bodies_are_not_compressed(client):
+    response = client.get("/report/small", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in response.headers
+
+
+def test_compressed_body_is_cached_per_etag(client, monkeypatch):
+    calls = []
+    real_compress = responses.compress
+
+    def counting_compress(data, encoding, best=False):
+        calls.append(encoding)
+        return real_compress(data, encoding, best)
+
+    monkeypatch.setattr(responses, "compress", counting_compress)
+    for _ in range(3):
+        assert client.get("/report/big", headers={"Accept-Encoding": "gzip"}).headers["Content-Encoding"] == "gzip"
+    assert calls == ["gzip"]
+
+
+def test_after_request_compresses_dynamic_html(client, monkeypatch):
+    monkeypatch.setattr(responses, "brotli", None)
+    response = client.get("/page", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(response.data).startswith(b"<p>gluten free")
+
+    plain = client.get("/page", headers={"Accept-Encoding": "identity"})
+    assert "Content-Encoding" not in plain.headers
+    assert plain.data.startswith(b"<p>gluten free")
@@ -0,0 +1,51 @@
+"""Negative-cache backoff for failed scout analyses (database.py)."""
+
+from datetime import timedelta
+
+import pytest
+
+import database
+from database import SCOUT_FAILURE_BACKOFF, scout_failure_backoff
+
+
+@pytest.mark.parametrize("kind", sorted(SCOUT_FAILURE_BACKOFF))
+def test_first_failure_waits_the_base_backoff(kind):
+    assert scout_failure_backoff(kind, 1) == SCOUT_FAILURE_BACKOFF[kind][0]
+
+
+def test_repeat_failures_double():
+    assert [scout_failure_backoff("api_error", n) for n in (1, 2, 3, 4)] == [
+        timedelta(minutes=1), timedelta(minutes=2), timedelta(minutes=4), timedelta(minutes=8)]
+
+
+@pytest.mark.parametrize("kind", sorted(SCOUT_FAILURE_BACKOFF))
+def test_backoff_is_capped(kind):
+    maximum = SCOUT_FAILURE_BACKOFF[kind][1]
+    assert scout_failure_backoff(kind, 30) == maximum
+    assert scout_failure_backoff(kind, 10_000) == maximum
+
+
+def test_not_found_caps_at_a_week():
+    assert scout_failure_backoff("not_found", 5) == timedelta(days=4)
+    assert scout_failure_backoff("not_found", 6) == timedelta(days=7)
+
+
+def test_unknown_kind_backs_off_like_api_error():
+    assert scout_failure_backoff("timeout", 3) == scout_failure_backoff("api_error", 3)
+
+
+def test_count_below_one_is_a_first_failure():
+    assert scout_failure_backoff("no_text", 0) == SCOUT_FAILURE_BACKOFF["no_text"][0]
+
+
+def test_success_resets_the_backoff(migrated_database):
+    base = SCOUT_FAILURE_BACKOFF["parse_error"][0]
+    assert database.record_scout_failure("Zahav", "Philadelphia", "parse_error") == base
+    assert database.record_scout_failure("Zahav", "Philadelphia", "parse_error") == 2 * base
+    assert database.get_scout_failure("Zahav", "Philadelphia")["failure_count"] == 2
+
+    assert database.cache_restaurant_result("Zahav", "Philadelphia", {
+        "restaurant_name": "Zahav", "analysis": {"safety_score": 8, "summary": "Good."}})
+
+    assert database.get_scout_failure("Zahav", "Philadelphia") is None
+    assert database.record_scout_failure("Zahav", "Philadelphia", "parse_error") == base
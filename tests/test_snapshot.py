@@ -0,0 +1,116 @@
+"""SQLite snapshot fallback (snapshot.py): when the primary counts as down,
+and keeping the snapshot in step with Postgres, deletions included."""
+
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+import database
+import snapshot
+
+
+@pytest.fixture
+def snap(tmp_path, monkeypatch):
+    monkeypatch.setattr(snapshot, "SNAPSHOT_PATH", str(tmp_path / "snapshot.sqlite3"))
+    monkeypatch.setattr(snapshot, "SNAPSHOT_ENABLED", True)
+    monkeypatch.setattr(snapshot, "_schema_ready", False)
+    monkeypatch.setattr(snapshot, "_primary_down_until", 0.0)
+    monkeypatch.setattr(snapshot, "_refreshed_at", None)
+    monkeypatch.setattr(snapshot, "maybe_refresh", lambda: None)
+    return snapshot
+
+
+def row(restaurant_id, name, minutes_ago=0):
+    return {
+        "id": restaurant_id, "name": name, "location": "philadelphia", "search_query": name,
+        "safety_score": 7, "searched_at": datetime(2026, 1, 1) - timedelta(minutes=minutes_ago),
+        "result_id": None, "result_ts": None, "analysis_text": '{"summary": "ok"}',
+    }
+
+
+@pytest.fixture
+def primary(monkeypatch):
+    """An in-memory stand-in for the restaurants table, behind the two
+    database helpers snapshot.refresh() reads through."""
+    rows = {}
+
+    def changed_since(since, after_id=0, limit=2000):
+        newer = sorted((r for r in rows.values() if (r["searched_at"], r["id"]) > (since, after_id)),
+                       key=lambda r: (r["searched_at"], r["id"]))
+        return newer[:limit]
+
+    monkeypatch.setattr(database, "get_restaurants_changed_since", changed_since)
+    monkeypatch.setattr(database, "get_restaurant_ids", lambda: set(rows))
+    return rows
+
+
+def test_slot_timeout_does_not_mark_the_primary_down(snap, monkeypatch):
+    monkeypatch.setenv("DATABASE_URL", "postgresql://unused/celia")
+    monkeypatch.setattr(database, "CACHE_READ_TIMEOUT_MS", 50)
+    busy = threading.BoundedSemaphore(1)
+    busy.acquire()
+    monkeypatch.setattr(database, "_get_connection_slots", lambda: busy)
+
+    assert database._cache_connection() == (None, True)  # this read uses the snapshot
+    assert snap.primary_available()
+
+
+def test_connect_error_marks_the_primary_down(snap, monkeypatch, tmp_path):
+    monkeypatch.setenv("DATABASE_URL", f"postgresql://postgres@/celia?host={tmp_path}/no-server")
+
+    assert database._cache_connection() == (None, True)
+    assert not snap.primary_available()
+    # later reads skip Postgres without trying to connect
+    monkeypatch.setattr(database, "get_connection", pytest.fail)
+    assert database._cache_connection() == (None, True)
+
+
+def test_refresh_copies_new_and_changed_rows(snap, primary):
+    primary[1] = row(1, "zahav", minutes_ago=30)
+    primary[2] = row(2, "vetri cucina", minutes_ago=20)
+    assert snap.refresh() == 2
+    assert snap.get_row("zahav", "philadelphia")["id"] == 1
+
+    primary[1] = dict(row(1, "zahav"), safety_score=9)
+    snap.refresh()
+    assert snap.get_row_by_id(1)["safety_score"] == 9
+    assert snap.get_row_by_id(2) is not None
+
+
+def test_refresh_removes_rows_deleted_from_postgres(snap, primary):
+    primary[1] = row(1, "zahav", minutes_ago=30)
+    primary[2] = row(2, "vetri cucina", minutes_ago=20)
+    snap.refresh()
+
+    del primary[1]
+    snap.refresh()
+    assert snap.get_row_by_id(1) is None
+    assert snap.get_row_by_id(2) is not None
+    assert [r["id"] for r in snap.get_match_rows()] == [2]
+
+
+def test_refresh_keeps_rows_when_ids_cannot_be_read(snap, primary, monkeypatch):
+    primary[1] = row(1, "zahav")
+    snap.refresh()
+
+    monkeypatch.setattr(database, "get_restaurant_ids", lambda: None)
+    snap.refresh()
+    assert snap.get_row_by_id(1) is not None
+
+
+def test_snapshot_tracks_postgres_deletions(snap, migrated_database):
+    for name in ("Zahav", "Vetri Cucina"):
+        database.cache_restaurant_result(name, "Philadelphia", {
+            "restaurant_name": name, "analysis": {"safety_score": 8, "summary": "Good."}})
+    assert snap.refresh() == 2
+    zahav = snap.get_row("zahav", "philadelphia")
+
+    conn = database.get_connection()
+    with conn, conn.cursor() as cur:
+        cur.execute("DELETE FROM restaurants WHERE id = %s", (zahav["id"],))
+    conn.close()
+
+    snap.refresh()
+    assert snap.get_row("zahav", "philadelphia") is None
+    assert snap.get_row("vetri cucina", "philadelphia") is not None
@@ -0,0 +1,220 @@
+"""Upload storage (uploads.py): the UploadBackend contract, content-addressed
+de-duplication, thumbnails, LRU retention and serving."""
+
+import os
+import time
+from io import BytesIO
+
+import pytest
+from flask import Flask
+
+import uploads
+
+
+class MemoryBackend(uploads.UploadBackend):
+    """The smallest complete backend, to check the abstract contract is all
+    the rest of uploads.py relies on."""
+
+    def __init__(self, root=None):
+        self.files = {}  # key -> [bytes, last used]
+
+    def put(self, key, data):
+        self.files[key] = [data, time.time()]
+
+    def get(self, key):
+        return self.files[key][0] if key in self.files else None
+
+    def exists(self, key):
+        return key in self.files
+
+    def delete(self, key):
+        self.files.pop(key, None)
+
+    def touch(self, key):
+        if key in self.files:
+            self.files[key][1] = time.time()
+
+    def entries(self):
+        return [(key, len(data), used) for key, (data, used) in self.files.items()]
+
+    def set_last_used(self, key, when):
+        self.files[key][1] = when
+
+
+class DiskBackend(uploads.LocalDiskBackend):
+    def set_last_used(self, key, when):
+        os.utime(self.path(key), (when, when))
+
+
+@pytest.fixture(params=["disk", "memory"])
+def backend(request, tmp_path, monkeypatch):
+    backend = DiskBackend(str(tmp_path / "uploads")) if request.param == "disk" else MemoryBackend()
+    monkeypatch.setattr(uploads, "_backend", backend)
+    # thumbnails run inline; retention only when a test calls it
+    monkeypatch.setattr(uploads, "submit_once", lambda key, fn, *args: fn(*args))
+    monkeypatch.setattr(uploads, "_retention_ran_at", time.monotonic())
+    return backend
+
+
+def jpeg(colour, size=(400, 300)):
+    if uploads.Image is None:
+        return bytes(colour) * 1000
+    out = BytesIO()
+    uploads.Image.new("RGB", size, colour).save(out, "JPEG")
+    return out.getvalue()
+
+
+def stored_keys(backend):
+    return sorted(key for key, _, _ in backend.entries())
+
+
+def age(backend, key, seconds):
+    """Make an image and its thumbnail look last used `seconds` ago."""
+    when = time.time() - seconds
+    for k in (key, uploads.thumbnail_key(key)):
+        if backend.exists(k):
+            backend.set_last_used(k, when)
+
+
+def test_upload_backend_is_abstract():
+    with pytest.raises(TypeError):
+        uploads.UploadBackend()
+
+    class Incomplete(uploads.UploadBackend):
+        def put(self, key, data):
+            pass
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+def test_put_get_delete(backend):
+    key = uploads.upload_key(b"bytes", "png")
+    assert not backend.exists(key) and backend.get(key) is None
+    backend.put(key, b"bytes")
+    assert backend.exists(key) and backend.get(key) == b"bytes"
+    assert stored_keys(backend) == [key]
+    backend.delete(key)
+    backend.delete(key)  # deleting a missing key is fine
+    assert not backend.exists(key) and stored_keys(backend) == []
+
+
+def test_keys_are_content_addressed(backend):
+    data = jpeg((200, 30, 30))
+    key = uploads.save_upload(data, "JPG")
+    assert uploads.KEY_PATTERN.match(key)
+    assert key == uploads.upload_key(data, "jpg")
+    assert key.startswith(key.split("/")[1][:2] + "/")
+    assert uploads.save_upload(jpeg((30, 200, 30)), "jpg") != key
+
+
+def test_same_image_is_stored_once(backend):
+    data = jpeg((200, 30, 30))
+    first = uploads.save_upload(data, "jpg")
+    before = stored_keys(backend)
+    age(backend, first, 2 * uploads.TOUCH_INTERVAL)
+
+    assert uploads.save_upload(data, "jpg") == first
+    assert stored_keys(backend) == before
+    # the duplicate upload counts as a use
+    assert max(used for key, _, used in backend.entries() if key == first) > time.time() - 60
+
+
+@pytest.mark.skipif(uploads.Image is None, reason="Pillow not installed")
+def test_thumbnail_made_once_and_linked(backend):
+    key = uploads.save_upload(jpeg((200, 30, 30)), "jpg")
+    thumb = uploads.thumbnail_key(key)
+    assert stored_keys(backend) == sorted([key, thumb])
+    with uploads.Image.open(BytesIO(backend.get(thumb))) as image:
+        assert max(image.size) == uploads.THUMBNAIL_SIZE
+    assert uploads.upload_urls(key) == {"image_url": f"/uploads/{key}", "thumbnail_url": f"/uploads/{thumb}"}
+
+
+def test_thumbnail_url_falls_back_to_the_image(backend):
+    key = uploads.upload_key(b"not an image", "png")
+    backend.put(key, b"not an image")
+    assert not uploads.make_thumbnail(key)
+    assert uploads.upload_urls(key)["thumbnail_url"] == f"/uploads/{key}"
+
+
+def test_release_upload(backend):
+    key = uploads.save_upload(jpeg((200, 30, 30)), "jpg")
+    uploads.release_upload(key, still_referenced=True)
+    assert backend.exists(key)
+    uploads.release_upload(key)
+    assert stored_keys(backend) == []
+
+
+def test_retention_deletes_unused_images_with_their_thumbnails(backend):
+    old = uploads.save_upload(jpeg((200, 30, 30)), "jpg")
+    recent = uploads.save_upload(jpeg((30, 200, 30)), "jpg")
+    age(backend, old, 10 * 86400)
+    age(backend, recent, 86400)
+
+    assert uploads.enforce_retention(max_bytes=10**9, max_age=5 * 86400) == 1
+    assert not backend.exists(old) and not backend.exists(uploads.thumbnail_key(old))
+    assert backend.exists(recent)
+
+
+def test_retention_evicts_least_recently_used_until_under_the_size_cap(backend):
+    keys = [uploads.save_upload(jpeg(colour), "jpg") for colour in ((200, 0, 0), (0, 200, 0), (0, 0, 200))]
+    for hours, key in zip((3, 2, 1), keys):
+        age(backend, key, hours * uploads.TOUCH_INTERVAL)
+    sizes = {}
+    for key, size, _ in backend.entries():
+        sizes[uploads._image_id(key)] = sizes.get(uploads._image_id(key), 0) + size
+    two_newest = sum(sizes[uploads._image_id(key)] for key in keys[1:])
+
+    assert uploads.enforce_retention(max_bytes=two_newest, max_age=86400) == 1
+    assert not backend.exists(keys[0])
+    assert backend.exists(keys[1]) and backend.exists(keys[2])
+
+
+def test_serving_keeps_an_image_from_eviction(backend):
+    keys = [uploads.save_upload(jpeg(colour), "jpg") for colour in ((200, 0, 0), (0, 200, 0))]
+    age(backend, keys[0], 3 * uploads.TOUCH_INTERVAL)
+    age(backend, keys[1], 2 * uploads.TOUCH_INTERVAL)
+    backend.touch(keys[0])  # what serve_upload does
+
+    newest = sum(size for key, size, _ in backend.entries() if uploads._image_id(key) == uploads._image_id(keys[0]))
+    assert uploads.enforce_retention(max_bytes=newest, max_age=86400) == 1
+    assert backend.exists(keys[0]) and not backend.exists(keys[1])
+
+
+def test_local_disk_entries_skip_files_outside_the_key_layout(tmp_path):
+    backend = uploads.LocalDiskBackend(str(tmp_path))
+    (tmp_path / "legacy_upload.jpg").write_bytes(b"old")
+    (tmp_path / "ab").mkdir()
+    (tmp_path / "ab" / "notes.txt").write_bytes(b"x")
+    key = uploads.upload_key(b"new", "png")
+    backend.put(key, b"new")
+    assert stored_keys(backend) == [key]
+    assert not [name for name in os.listdir(tmp_path / key.split("/")[0]) if name.endswith(".tmp")]
+
+
+def test_served_with_immutable_cache_control(tmp_path, monkeypatch):
+    monkeypatch.setattr(uploads, "_backend", None)
+    monkeypatch.setenv("UPLOAD_BACKEND", "local")
+    app = Flask(__name__)
+    app.config["UPLOAD_FOLDER"] = str(tmp_path)
+    uploads.init_app(app)
+    monkeypatch.setattr(uploads, "submit_once", lambda key, fn, *args: fn(*args))
+    monkeypatch.setattr(uploads, "_retention_ran_at", time.monotonic())
+    key = uploads.save_upload(jpeg((200, 30, 30)), "jpg")
+    client = app.test_client()
+
+    response = client.get(f"/uploads/{key}")
+    assert response.status_code == 200
+    assert response.mimetype == "image/jpeg"
+    assert response.headers["Cache-Control"] == uploads.IMMUTABLE_CACHE_CONTROL
+    assert client.get("/uploads/../app.py").status_code == 404
+    assert client.get(f"/uploads/{uploads.upload_key(b'missing', 'png')}").status_code == 404
+
+
+def test_unknown_backend_is_rejected(tmp_path, monkeypatch):
+    monkeypatch.setattr(uploads, "_backend", None)
+    monkeypatch.setenv("UPLOAD_BACKEND", "s3")
+    app = Flask(__name__)
+    app.config["UPLOAD_FOLDER"] = str(tmp_path)
+    with pytest.raises(ValueError, match="UPLOAD_BACKEND"):
+        uploads.init_app(app)
@@ -0,0 +1,310 @@
+"""Storage for uploaded label images.
+
+Uploads are content-addressed: the key is the SHA-256 of the image bytes,
+"ab/abcdef....jpg", so the same photo uploaded twice is stored once and a
+key's bytes never change. They are served from /uploads/<key> with a
+one-year immutable Cache-Control. A small JPEG thumbnail ("<hash>.thumb.jpg")
+is generated once per image for the history list when Pillow is installed;
+without it the list falls back to the full image.
+
+Disk use is bounded by a retention policy. Images (with their thumbnails)
+unused for UPLOAD_MAX_AGE_DAYS are deleted. While the total is over
+UPLOAD_MAX_MB, the least recently used images go first. Serving an image
+counts as a use. Retention runs in the background after uploads, at most
+every UPLOAD_RETENTION_INTERVAL seconds per worker.
+
+Storage goes through an UploadBackend. LocalDiskBackend (UPLOAD_BACKEND=local,
+the default) keeps files under static/uploads/. Another store (e.g. an
+object store) is a subclass registered in BACKENDS.
+
+Environment:
+    UPLOAD_BACKEND              backend name in BACKENDS (default "local")
+    UPLOAD_MAX_MB               total size kept (default 500)
+    UPLOAD_MAX_AGE_DAYS         delete images unused this long (default 90)
+    UPLOAD_RETENTION_INTERVAL   seconds between retention passes (default 600)
+"""
+
+import os
+import re
+import abc
+import time
+import hashlib
+import threading
+from io import BytesIO
+
+from flask import Response, abort, send_file
+
+from background import submit_once
+from logging_config import get_logger
+from metrics import inc, span
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # optional dependency
+    Image = None
+
+log = get_logger("UPLOADS")
+
+UPLOAD_MAX_BYTES = int(os.environ.get("UPLOAD_MAX_MB", "500")) * 1024 * 1024
+UPLOAD_MAX_AGE = int(os.environ.get("UPLOAD_MAX_AGE_DAYS", "90")) * 86400
+UPLOAD_RETENTION_INTERVAL = int(os.environ.get("UPLOAD_RETENTION_INTERVAL", "600"))
+TOUCH_INTERVAL = 3600      # refresh an image's last-used time at most this often
+THUMBNAIL_SIZE = 128       # px, longest side (history thumbnails show at 52 CSS px)
+THUMBNAIL_QUALITY = 80
+THUMBNAIL_SUFFIX = ".thumb.jpg"
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+KEY_PATTERN = re.compile(r"^[0-9a-f]{2}/[0-9a-f]{64}(\.thumb)?\.(png|jpg|jpeg|webp|gif)$")
+
+
+def upload_key(data, ext):
+    digest = hashlib.sha256(data).hexdigest()
+    return f"{digest[:2]}/{digest}.{ext.lower()}"
+
+
+def thumbnail_key(key):
+    return key.split(".", 1)[0] + THUMBNAIL_SUFFIX
+
+
+def _image_id(key):
+    """The hash part of a key, shared by an image and its thumbnail."""
+    return key.split("/")[-1].split(".", 1)[0]
+
+
+# ---------------------------------------------------------------------------
+# Backends
+# ---------------------------------------------------------------------------
+
+class UploadBackend(abc.ABC):
+    """Where upload bytes live. Keys are relative paths as made by upload_key."""
+
+    @abc.abstractmethod
+    def put(self, key, data):
+        ...
+
+    @abc.abstractmethod
+    def get(self, key):
+        """The stored bytes, or None."""
+
+    @abc.abstractmethod
+    def exists(self, key):
+        ...
+
+    @abc.abstractmethod
+    def delete(self, key):
+        ...
+
+    @abc.abstractmethod
+    def touch(self, key):
+        """Mark the key as used now (for LRU eviction)."""
+
+    @abc.abstractmethod
+    def entries(self):
+        """(key, size in bytes, last used as a Unix time) for every stored key."""
+
+    def serve(self, key, mimetype):
+        data = self.get(key)
+        if data is None:
+            abort(404)
+        return Response(data, mimetype=mimetype)
+
+
+class LocalDiskBackend(UploadBackend):
+    """Files under a directory; last use is the file's mtime."""
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.root, *key.split("/"))
+
+    def put(self, key, data):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def get(self, key):
+        try:
+            with open(self.path(key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def exists(self, key):
+        return os.path.exists(self.path(key))
+
+    def delete(self, key):
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def touch(self, key):
+        path = self.path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > TOUCH_INTERVAL:
+                os.utime(path)
+        except FileNotFoundError:
+            pass
+
+    def entries(self):
+        for prefix in os.listdir(self.root):
+            directory = os.path.join(self.root, prefix)
+            if len(prefix) != 2 or not os.path.isdir(directory):
+                continue  # files from before content addressing are left alone
+            for name in os.listdir(directory):
+                key = f"{prefix}/{name}"
+                if not KEY_PATTERN.match(key):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(directory, name))
+                except FileNotFoundError:
+                    continue
+                yield key, stat.st_size, stat.st_mtime
+
+    def serve(self, key, mimetype):
+        path = self.path(key)
+        if not os.path.exists(path):
+            abort(404)
+        return send_file(path, mimetype=mimetype, conditional=True, etag=_image_id(key))
+
+
+BACKENDS = {
+    "local": LocalDiskBackend,
+}
+
+_backend = None
+_retention_ran_at = 0.0
+
+
+# ---------------------------------------------------------------------------
+# Storing and serving
+# ---------------------------------------------------------------------------
+
+def save_upload(data, ext):
+    """Store image bytes (once per distinct image). Returns the key."""
+    key = upload_key(data, ext)
+    with span("uploads.put"):
+        if _backend.exists(key):
+            _backend.touch(key)
+            inc("celia_uploads_total", result="duplicate")
+        else:
+            _backend.put(key, data)
+            inc("celia_uploads_total", result="stored")
+    if Image is not None:
+        submit_once(f"thumbnail:{key}", make_thumbnail, key, data)
+    _schedule_retention()
+    return key
+
+
+def make_thumbnail(key, data=None):
+    """Write the key's thumbnail unless it exists. Returns True if one exists now."""
+    if Image is None:
+        return False
+    thumb_key = thumbnail_key(key)
+    if _backend.exists(thumb_key):
+        return True
+    data = data if data is not None else _backend.get(key)
+    if data is None:
+        return False
+    try:
+        with span("uploads.thumbnail"):
+            with Image.open(BytesIO(data)) as image:
+                image.draft("RGB", (THUMBNAIL_SIZE, THUMBNAIL_SIZE))  # JPEG: decode at reduced size
+                image = ImageOps.exif_transpose(image)
+                if image.mode in ("RGBA", "LA", "P"):
+                    image = image.convert("RGBA")
+                    background = Image.new("RGB", image.size, "white")
+                    background.paste(image, mask=image.getchannel("A"))
+                    image = background
+                image = image.convert("RGB")
+                image.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+                out = BytesIO()
+                image.save(out, "JPEG", quality=THUMBNAIL_QUALITY, optimize=True)
+        _backend.put(thumb_key, out.getvalue())
+        return True
+    except Exception as e:
+        log.warning("Could not make a thumbnail for %s: %s", key, e)
+        return False
+
+
+def upload_urls(key):
+    """{"image_url", "thumbnail_url"} for a stored key. The thumbnail URL is
+    the image itself until the background thumbnail (see save_upload) exists;
+    thumbnails are never made on the request path."""
+    image_url = f"/uploads/{key}"
+    thumb_key = thumbnail_key(key)
+    has_thumbnail = Image is not None and _backend.exists(thumb_key)
+    return {"image_url": image_url, "thumbnail_url": f"/uploads/{thumb_key}" if has_thumbnail else image_url}
+
+
+def release_upload(key, still_referenced=False):
+    """Delete an image and its thumbnail, unless another record still uses it."""
+    if still_referenced:
+        return
+    _backend.delete(key)
+    _backend.delete(thumbnail_key(key))
+
+
+# ---------------------------------------------------------------------------
+# Retention
+# ---------------------------------------------------------------------------
+
+def enforce_retention(max_bytes=UPLOAD_MAX_BYTES, max_age=UPLOAD_MAX_AGE):
+    """Delete images unused for max_age seconds, then least recently used ones
+    until the total is under max_bytes. An image and its thumbnail count and
+    go together. Returns the number of images deleted."""
+    images = {}  # image id -> [keys, total size, last used]
+    for key, size, used in _backend.entries():
+        entry = images.setdefault(_image_id(key), [[], 0, 0.0])
+        entry[0].append(key)
+        entry[1] += size
+        entry[2] = max(entry[2], used)
+
+    total = sum(entry[1] for entry in images.values())
+    cutoff = time.time() - max_age
+    evicted = 0
+    for keys, size, used in sorted(images.values(), key=lambda entry: entry[2]):
+        if used >= cutoff and total <= max_bytes:
+            break
+        for key in keys:
+            _backend.delete(key)
+        total -= size
+        evicted += 1
+
+    if evicted:
+        log.info("Retention removed %d images; %.1f MB kept", evicted, total / 1024 / 1024)
+        inc("celia_uploads_evicted_total", evicted)
+    return evicted
+
+
+def _schedule_retention():
+    global _retention_ran_at
+    if time.monotonic() - _retention_ran_at < UPLOAD_RETENTION_INTERVAL:
+        return
+    _retention_ran_at = time.monotonic()
+    submit_once("upload-retention", enforce_retention)
+
+
+def init_app(app):
+    """Create the backend and serve /uploads/<key>."""
+    global _backend
+    name = os.environ.get("UPLOAD_BACKEND", "local")
+    if name not in BACKENDS:
+        raise ValueError(f"UPLOAD_BACKEND must be one of {', '.join(BACKENDS)}, not {name!r}")
+    _backend = BACKENDS[name](app.config["UPLOAD_FOLDER"])
+
+    @app.route("/uploads/<path:key>")
+    def serve_upload(key):
+        if not KEY_PATTERN.match(key):
+            abort(404)
+        ext = key.rsplit(".", 1)[1]
+        mimetype = "image/jpeg" if ext in ("jpg", "jpeg") else f"image/{ext}"
+        _backend.touch(key)  # a thumbnail's use keeps its image too (see enforce_retention)
+        response = _backend.serve(key, mimetype)
+        response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+        return response